@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+aggregate_store.py
+
+Materialized aggregates of the timing database, kept in a small SQLite file
+next to it. The models repeatedly reduce the same raw rows: the 2.5% quantile
+of the pit stop durations of a race (`PitStop` best pit stop), the pit stop
+durations of a team over a season (`PitStop` variability law), the number of
+starts of each driver and team and the retirement sums of a season
+(`DNFModel`), and the best qualifying time of each driver in a race (`Driver`,
+`FuelAndTireModel`). The store holds these aggregates indexed by their keys,
+computed in a single pass over the source rows of each race.
+
+`refresh` only processes the races of the source database that the store does
+not know yet, so adding a race costs the aggregation of that race alone. The
+retirement totals, which the database keeps per season, are recomputed for
+the seasons of the new races. Models given a store read from it instead of
+scanning the `laps`, `starterfields`, `retirements` and `qualifyings` tables.
+"""
+
+import sqlite3
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+
+class AggregateStore:
+    """
+    SQLite file of per-race, per-team and per-driver aggregates.
+
+    The store only holds its path (connections are opened per call), so that
+    fitted models referencing it can be pickled to worker processes.
+    """
+
+    # Quantile of a race's pit stop durations taken as its best pit stop
+    PIT_STOP_QUANTILE = 0.025
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS races (
+            id INTEGER PRIMARY KEY,
+            season INTEGER NOT NULL,
+            location TEXT NOT NULL,
+            best_pit_stop REAL,
+            fallback_qualif_time REAL
+        );
+        CREATE INDEX IF NOT EXISTS races_location ON races (location, season);
+        CREATE TABLE IF NOT EXISTS pit_stops (
+            team TEXT NOT NULL,
+            season INTEGER NOT NULL,
+            race_id INTEGER NOT NULL,
+            driver_id INTEGER NOT NULL,
+            lapno INTEGER NOT NULL,
+            pitstopduration REAL NOT NULL,
+            PRIMARY KEY (team, season, race_id, driver_id, lapno)
+        );
+        CREATE TABLE IF NOT EXISTS starts (
+            season INTEGER NOT NULL,
+            driver_id INTEGER NOT NULL,
+            team TEXT NOT NULL,
+            races INTEGER NOT NULL,
+            PRIMARY KEY (season, driver_id, team)
+        );
+        CREATE TABLE IF NOT EXISTS retirements (
+            season INTEGER NOT NULL,
+            driver_id INTEGER NOT NULL,
+            accidents REAL NOT NULL,
+            failures REAL NOT NULL,
+            records INTEGER NOT NULL,
+            PRIMARY KEY (season, driver_id)
+        );
+        CREATE TABLE IF NOT EXISTS best_qualifying (
+            race_id INTEGER NOT NULL,
+            driver_id INTEGER NOT NULL,
+            best_qualif_time REAL,
+            PRIMARY KEY (race_id, driver_id)
+        );
+    """
+
+    # Team of the starts whose starterfields row has none
+    NO_TEAM = ""
+
+    def __init__(self, path: str, timeout: float = 60.0) -> None:
+        """
+        Args:
+            path: SQLite file of the store (created if needed).
+            timeout: Seconds to wait for a lock held by another process.
+        """
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as con:
+            con.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def _read(self, query: str, params: Iterable = ()) -> pd.DataFrame:
+        con = self._connect()
+        try:
+            return pd.read_sql_query(query, con, params=list(params))
+        finally:
+            con.close()
+
+    @staticmethod
+    def _marks(values: list) -> str:
+        return ", ".join("?" * len(values))
+
+    def race_ids(self) -> list[int]:
+        """Races aggregated so far, in id order."""
+        return self._read("SELECT id FROM races ORDER BY id")["id"].tolist()
+
+    def refresh(self, db_path: str) -> list[int]:
+        """
+        Aggregate the races of `db_path` missing from the store, in one
+        transaction (an interrupted refresh leaves the store unchanged).
+
+        Args:
+            db_path: Source timing database.
+
+        Returns:
+            Identifiers of the races added.
+        """
+        known = set(self.race_ids())
+        source = sqlite3.connect(db_path)
+        try:
+            races = pd.read_sql_query("SELECT id, season, location FROM races", source)
+            races = races[~races["id"].isin(known)].sort_values("id")
+            if races.empty:
+                return []
+            race_ids = [int(r) for r in races["id"]]
+            seasons = sorted({int(s) for s in races["season"]})
+            marks, season_marks = self._marks(race_ids), self._marks(seasons)
+
+            stops = pd.read_sql_query(
+                "SELECT l.race_id, l.driver_id, l.lapno, l.pitstopduration, s.team, r.season"
+                " FROM laps l JOIN races r ON r.id = l.race_id"
+                " LEFT JOIN starterfields s ON s.race_id = l.race_id AND s.driver_id = l.driver_id"
+                f" WHERE l.pitstopduration IS NOT NULL AND l.race_id IN ({marks})",
+                source, params=race_ids,
+            )
+            starts = pd.read_sql_query(
+                "SELECT r.season, s.driver_id, COALESCE(s.team, ?) AS team, COUNT(*) AS races"
+                " FROM starterfields s JOIN races r ON r.id = s.race_id"
+                f" WHERE s.race_id IN ({marks}) GROUP BY r.season, s.driver_id, COALESCE(s.team, ?)",
+                source, params=[self.NO_TEAM, *race_ids, self.NO_TEAM],
+            )
+            quals = pd.read_sql_query(
+                "SELECT race_id, driver_id, MIN(q1laptime) AS q1laptime, MIN(q2laptime) AS q2laptime,"
+                " MIN(q3laptime) AS q3laptime"
+                f" FROM qualifyings WHERE race_id IN ({marks}) GROUP BY race_id, driver_id",
+                source, params=race_ids,
+            )
+            # Missing counts are zeros, as in `DNFModel.fit`
+            retirements = pd.read_sql_query(
+                "SELECT season, driver_id, SUM(COALESCE(accidents, 0)) AS accidents,"
+                " SUM(COALESCE(failures, 0)) AS failures, COUNT(*) AS records"
+                f" FROM retirements WHERE season IN ({season_marks}) GROUP BY season, driver_id",
+                source, params=seasons,
+            )
+        finally:
+            source.close()
+
+        best_pit_stop = stops.groupby("race_id")["pitstopduration"].quantile(q=self.PIT_STOP_QUANTILE)
+        q_columns = ["q1laptime", "q2laptime", "q3laptime"]
+        fallback = quals.groupby("race_id")[q_columns].min().mean(axis=1)
+        races = races.assign(
+            best_pit_stop=races["id"].map(best_pit_stop),
+            fallback_qualif_time=races["id"].map(fallback),
+        )
+        quals = quals.assign(best_qualif_time=quals[q_columns].min(axis=1))
+        team_stops = stops.dropna(subset=["team"])
+
+        con = self._connect()
+        try:
+            with con:
+                con.executemany(
+                    "INSERT INTO races (id, season, location, best_pit_stop, fallback_qualif_time)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    self._rows(races, ["id", "season", "location", "best_pit_stop", "fallback_qualif_time"]),
+                )
+                con.executemany(
+                    "INSERT OR REPLACE INTO pit_stops (team, season, race_id, driver_id, lapno, pitstopduration)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    self._rows(team_stops, ["team", "season", "race_id", "driver_id", "lapno", "pitstopduration"]),
+                )
+                con.executemany(
+                    "INSERT INTO starts (season, driver_id, team, races) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (season, driver_id, team) DO UPDATE SET races = races + excluded.races",
+                    self._rows(starts, ["season", "driver_id", "team", "races"]),
+                )
+                con.execute(f"DELETE FROM retirements WHERE season IN ({season_marks})", seasons)
+                con.executemany(
+                    "INSERT INTO retirements (season, driver_id, accidents, failures, records) VALUES (?, ?, ?, ?, ?)",
+                    self._rows(retirements, ["season", "driver_id", "accidents", "failures", "records"]),
+                )
+                con.executemany(
+                    "INSERT OR REPLACE INTO best_qualifying (race_id, driver_id, best_qualif_time) VALUES (?, ?, ?)",
+                    self._rows(quals, ["race_id", "driver_id", "best_qualif_time"]),
+                )
+        finally:
+            con.close()
+        return race_ids
+
+    @staticmethod
+    def _rows(df: pd.DataFrame, columns: list) -> list:
+        """Rows of `df` as Python values for sqlite3 (NaN as NULL)."""
+        values = df[columns].astype(object).where(df[columns].notna(), None)
+        return [tuple(v.item() if isinstance(v, np.generic) else v for v in row) for row in values.itertuples(index=False)]
+
+    def best_pit_stop_duration(self, location: str, seasons: Iterable[int]) -> float:
+        """
+        Mean best pit stop (PIT_STOP_QUANTILE quantile) of the races at
+        `location` in `seasons` (NaN without pit stops).
+        """
+        seasons = [int(s) for s in seasons]
+        rows = self._read(
+            f"SELECT best_pit_stop FROM races WHERE location = ? AND season IN ({self._marks(seasons)}) ORDER BY id",
+            [location, *seasons],
+        )
+        return rows["best_pit_stop"].mean()
+
+    def pit_stop_durations(self, team: str, season: int, before_race_id: int, max_duration: float = 400) -> np.ndarray:
+        """
+        Pit stop durations of `team` in the races of `season` before
+        `before_race_id`, below `max_duration` (outliers excluded).
+        """
+        rows = self._read(
+            "SELECT pitstopduration FROM pit_stops WHERE team = ? AND season = ? AND race_id < ?"
+            " AND pitstopduration < ? ORDER BY race_id, driver_id, lapno",
+            [team, int(season), int(before_race_id), max_duration],
+        )
+        return rows["pitstopduration"].to_numpy(dtype=float)
+
+    def starts(self, seasons: Iterable[int]) -> pd.DataFrame:
+        """
+        Returns:
+            Number of starts ("races") per season, driver_id and team
+            (NO_TEAM when the starterfields row has none).
+        """
+        seasons = [int(s) for s in seasons]
+        return self._read(
+            f"SELECT season, driver_id, team, races FROM starts WHERE season IN ({self._marks(seasons)})",
+            seasons,
+        )
+
+    def retirement_totals(self, seasons: Iterable[int]) -> pd.DataFrame:
+        """
+        Returns:
+            Sums of "accidents" and "failures" per season and driver_id, and
+            the number of retirements rows they add up ("records").
+        """
+        seasons = [int(s) for s in seasons]
+        return self._read(
+            "SELECT season, driver_id, accidents, failures, records FROM retirements"
+            f" WHERE season IN ({self._marks(seasons)})",
+            seasons,
+        )
+
+    def best_qualifying_times(self, race_ids: Iterable[int], driver_ids: Iterable[int]) -> pd.DataFrame:
+        """
+        Returns:
+            Best qualifying lap ("best_qualif_time") per race_id and driver_id
+            of the given races and drivers, NaN when no lap was set.
+        """
+        race_ids = [int(r) for r in race_ids]
+        driver_ids = [int(d) for d in driver_ids]
+        return self._read(
+            "SELECT race_id, driver_id, best_qualif_time FROM best_qualifying"
+            f" WHERE race_id IN ({self._marks(race_ids)}) AND driver_id IN ({self._marks(driver_ids)})"
+            " ORDER BY race_id, driver_id",
+            [*race_ids, *driver_ids],
+        )
+
+    def best_qualifying_time(self, race_id: int, driver_id: int) -> float:
+        """
+        Best qualifying lap of a driver, or without one the mean over Q1, Q2
+        and Q3 of the best laps of the race (as `Driver`).
+        """
+        rows = self._read(
+            "SELECT q.best_qualif_time, r.fallback_qualif_time FROM races r"
+            " LEFT JOIN best_qualifying q ON q.race_id = r.id AND q.driver_id = ? WHERE r.id = ?",
+            [int(driver_id), int(race_id)],
+        )
+        if rows.empty:
+            raise ValueError(f"Race {race_id} is not in the aggregate store.")
+        best = rows["best_qualif_time"].iloc[0]
+        return rows["fallback_qualif_time"].iloc[0] if pd.isna(best) else best
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+checkpoint.py
+
+Append-only checkpoint file for long Monte Carlo campaigns: completed batches of
+outcomes are appended with the RNG state, so that an interrupted campaign can
+resume where it stopped and produce the same results as an uninterrupted one.
+"""
+
+import os
+import pickle
+
+import pandas as pd
+
+
+class SimulationCheckpoint:
+    """
+    Checkpoint file made of pickled records:
+      - a header {"key": configuration hash},
+      - then one record per saved batch {"first_sim_id", "completed",
+        "outcomes", "rng_state"}.
+
+    Records are only appended, so saving costs the size of the new batch, not
+    of the whole campaign. A record truncated by a crash is dropped on load,
+    and so are the records after a gap in the simulation ids: the loaded
+    outcomes always cover simulations 0..completed-1.
+    """
+
+    def __init__(self, path: str, key: str) -> None:
+        """
+        Args:
+            path: Checkpoint file path.
+            key: Hash of the simulation configuration the file belongs to.
+        """
+        self.path = path
+        self.key = key
+
+    def load(self) -> dict | None:
+        """
+        Read every complete record of the file.
+
+        Returns:
+            None if there is no checkpoint, else a dict with keys
+            "completed" (number of simulations done), "outcomes" (DataFrame
+            of their outcomes) and "rng_state" (state after the last batch).
+
+        Raises:
+            ValueError: If the file belongs to another configuration.
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        batches = []
+        state = {"completed": 0, "outcomes": pd.DataFrame(), "rng_state": None}
+        valid_offset = 0
+        with open(self.path, "rb") as f:
+            try:
+                header = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                header = None
+            if header is None:
+                # Crash before the header was written: start from scratch
+                os.remove(self.path)
+                return None
+            if header.get("key") != self.key:
+                raise ValueError(
+                    f"Checkpoint {self.path} was written for another configuration."
+                )
+            valid_offset = f.tell()
+            while True:
+                try:
+                    record = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+                    break
+                outcomes = record["outcomes"]
+                first_sim_id = record.get(
+                    "first_sim_id", int(outcomes["simulation_id"].min()) if len(outcomes) else record["completed"]
+                )
+                if first_sim_id > state["completed"]:
+                    # Simulations missing before this record: it cannot be used
+                    break
+                # Simulations already loaded from earlier records are skipped
+                batches.append(outcomes[outcomes["simulation_id"] >= state["completed"]])
+                state["completed"] = max(state["completed"], record["completed"])
+                state["rng_state"] = record["rng_state"]
+                valid_offset = f.tell()
+
+        # Drop a trailing record truncated by a crash, so later appends stay readable
+        if os.path.getsize(self.path) != valid_offset:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_offset)
+
+        if batches:
+            state["outcomes"] = pd.concat(batches, ignore_index=True)
+        return state
+
+    def save(self, completed: int, outcomes: pd.DataFrame, rng_state) -> None:
+        """
+        Append a batch of outcomes to the checkpoint (creating it if needed).
+
+        Args:
+            completed: Total number of simulations done after this batch.
+            outcomes: Outcomes of the simulations of this batch only, i.e.
+                simulations completed - n .. completed - 1.
+            rng_state: Global NumPy RNG state after this batch.
+        """
+        first_sim_id = int(outcomes["simulation_id"].min()) if len(outcomes) else completed
+        is_new = not os.path.exists(self.path)
+        with open(self.path, "ab") as f:
+            if is_new:
+                pickle.dump({"key": self.key}, f)
+            pickle.dump(
+                {"first_sim_id": first_sim_id, "completed": completed, "outcomes": outcomes, "rng_state": rng_state},
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self) -> None:
+        """Delete the checkpoint file."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -6,47 +6,235 @@ Module responsible for loading data from an SQLite database into pandas DataFram
 """
 
 import sqlite3
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
 import pandas as pd
 
+# A float column is stored as float32 only if no value moves by more than this.
+# The default keeps values exact: model fits such as the pit stop Fisk law are
+# sensitive to perturbations far below the millisecond resolution of the data.
+FLOAT32_TOLERANCE = 0.0
+
+# Text columns become categoricals when they have at most this many distinct
+# values per row (e.g. compound, team, status; not unique driver names)
+CATEGORY_MAX_RATIO = 0.5
+
+
+def compact_dtypes(df: pd.DataFrame, float_tolerance: float = FLOAT32_TOLERANCE) -> pd.DataFrame:
+    """
+    Downcast the columns of `df` to the smallest dtype holding their values:
+    integers to int16/int32, floats to float32 when the round trip is within
+    `float_tolerance`, and repetitive text columns to categoricals.
+
+    Args:
+        df: Table as read from SQLite.
+        float_tolerance: Largest change of a value allowed by the float32 downcast.
+
+    Returns:
+        New DataFrame with compact dtypes (same values, index and columns).
+    """
+    columns = {}
+    for name, col in df.items():
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.cat.remove_unused_categories()
+        elif pd.api.types.is_integer_dtype(col.dtype):
+            col = _downcast_integers(col)
+        elif pd.api.types.is_float_dtype(col.dtype):
+            col = _downcast_floats(col, float_tolerance)
+        elif col.dtype == object or pd.api.types.is_string_dtype(col.dtype):
+            non_null = col.dropna()
+            if (
+                len(non_null)
+                and non_null.map(type).eq(str).all()
+                and non_null.nunique() <= CATEGORY_MAX_RATIO * len(col)
+            ):
+                col = col.astype("category")
+        columns[name] = col
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _downcast_integers(col: pd.Series) -> pd.Series:
+    """int64 -> int16 or int32 when the value range allows it (never narrower,
+    so that lap/position arithmetic keeps some headroom)."""
+    if col.empty:
+        return col
+    low, high = col.min(), col.max()
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return col.astype(dtype)
+    return col
+
+
+def _downcast_floats(col: pd.Series, tolerance: float) -> pd.Series:
+    """float64 -> float32 if no value moves by more than `tolerance`."""
+    values = col.to_numpy(dtype=np.float64)
+    finite = np.isfinite(values)
+    as_float32 = values.astype(np.float32)
+    if np.all(np.abs(as_float32[finite].astype(np.float64) - values[finite]) <= tolerance):
+        return pd.Series(as_float32, index=col.index, name=col.name)
+    return col
+
+
+def memory_report(before: dict, after: dict) -> pd.DataFrame:
+    """
+    Compare the memory footprint of two versions of the same tables.
+
+    Args:
+        before: dict table_name -> DataFrame.
+        after: dict table_name -> DataFrame.
+
+    Returns:
+        DataFrame indexed by table with "rows", "bytes_before", "bytes_after"
+        and "ratio" (after / before), plus a "total" row.
+    """
+    rows = []
+    for table, df in before.items():
+        bytes_before = int(df.memory_usage(index=True, deep=True).sum())
+        bytes_after = int(after[table].memory_usage(index=True, deep=True).sum())
+        rows.append((table, len(df), bytes_before, bytes_after))
+    report = pd.DataFrame(rows, columns=["table", "rows", "bytes_before", "bytes_after"]).set_index("table")
+    report.loc["total"] = report.sum()
+    report["ratio"] = report["bytes_after"] / report["bytes_before"]
+    return report
+
 
 class DataLoader:
     """
     Class responsible for loading data from an SQLite database.
     """
 
-    def __init__(self, db_path: str):
+    # List of relevant tables in the database
+    TABLES = [
+        "drivers",
+        "fcyphases",
+        "laps",
+        "qualifyings",
+        "races",
+        "retirements",
+        "starterfields",
+    ]
+
+    # Tables keyed by race, filtered through the races of the selected seasons
+    RACE_TABLES = ["fcyphases", "laps", "qualifyings", "starterfields"]
+
+    def __init__(self, db_path: str, compact: bool = True, float_tolerance: float = FLOAT32_TOLERANCE):
         """
         Args:
             db_path (str): Path to the SQLite database file.
+            compact (bool): Downcast the loaded tables (see `compact_dtypes`).
+            float_tolerance (float): Largest change of a float value allowed to
+                store its column as float32 (e.g. 5e-4 for millisecond timings).
         """
         self.db_path = db_path
+        self.compact = compact
+        self.float_tolerance = float_tolerance
         self.dataframes = {}
+        self.memory_report = None
 
-    def load_data(self) -> dict:
+    def load_data(self, seasons: Iterable[int] | None = None, tables: Iterable[str] | None = None) -> dict:
         """
         Load data from the SQLite database and store it in a dictionary.
+        With `compact`, the tables are downcast and `self.memory_report`
+        holds their memory usage before and after.
+
+        Args:
+            seasons: If given, only load the races (and their laps, qualifyings,
+                etc.) and retirements of these seasons, filtered in SQL.
+            tables: Tables to load (default: all of TABLES), e.g. everything
+                but "laps" when laps are streamed with `iter_laps`.
 
         Returns:
             dict: A dictionary where keys are table names and values are DataFrames.
         """
         connection = sqlite3.connect(self.db_path)
 
-        # List of relevant tables in the database
-        tables = [
-            "drivers",
-            "fcyphases",
-            "laps",
-            "qualifyings",
-            "races",
-            "retirements",
-            "starterfields",
-        ]
-
         # Create a dict {table_name: DataFrame}
-        self.dataframes = {
-            table: pd.read_sql_query(f"SELECT * FROM {table}", connection)
-            for table in tables
-        }
+        self.dataframes = {}
+        for table in (self.TABLES if tables is None else tables):
+            query, params = self._select(table, seasons)
+            self.dataframes[table] = pd.read_sql_query(query, connection, params=params)
 
         connection.close()
+
+        if self.compact:
+            compacted = {table: compact_dtypes(df, self.float_tolerance) for table, df in self.dataframes.items()}
+            self.memory_report = memory_report(self.dataframes, compacted)
+            self.dataframes = compacted
         return self.dataframes
+
+    def iter_laps(
+        self,
+        seasons: Iterable[int] | None = None,
+        race_ids: Iterable[int] | None = None,
+        batch_size: int = 50_000,
+    ) -> Iterator[Tuple[int, pd.DataFrame]]:
+        """
+        Stream the laps table one race at a time.
+
+        Rows are read in `race_id, driver_id, lapno` order with a cursor, in
+        batches of `batch_size` rows, so that memory holds at most one race
+        plus one batch, whatever the size of the database.
+
+        Args:
+            seasons: Only stream the races of these seasons.
+            race_ids: Only stream these races.
+            batch_size: Number of rows fetched from SQLite at a time.
+
+        Yields:
+            (race_id, laps of the race), with compact dtypes if `compact`.
+        """
+        query, params = self._select("laps", seasons)
+        if race_ids is not None:
+            race_ids = [int(r) for r in race_ids]
+            keyword = "AND" if "WHERE" in query else "WHERE"
+            query += f" {keyword} race_id IN ({', '.join('?' * len(race_ids))})"
+            params = list(params) + race_ids
+        query += " ORDER BY race_id, driver_id, lapno"
+
+        connection = sqlite3.connect(self.db_path)
+        try:
+            cursor = connection.execute(query, params)
+            columns = [c[0] for c in cursor.description]
+            race_col = columns.index("race_id")
+            pending = []
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if pending and row[race_col] != pending[-1][race_col]:
+                        yield self._race_frame(pending, columns)
+                        pending = []
+                    pending.append(row)
+            if pending:
+                yield self._race_frame(pending, columns)
+        finally:
+            connection.close()
+
+    def _race_frame(self, rows: list, columns: list) -> Tuple[int, pd.DataFrame]:
+        """Build the DataFrame of one race from the rows of the laps cursor."""
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        if self.compact:
+            df = compact_dtypes(df, self.float_tolerance)
+        return int(rows[0][columns.index("race_id")]), df
+
+    def _select(self, table: str, seasons: Iterable[int] | None) -> Tuple[str, list]:
+        """
+        Returns:
+            SQL query (and its parameters) selecting `table`, restricted to
+            `seasons` if given.
+        """
+        query = f"SELECT * FROM {table}"
+        if seasons is None:
+            return query, []
+        seasons = [int(s) for s in seasons]
+        marks = ", ".join("?" * len(seasons))
+        if table in ("races", "retirements"):
+            query += f" WHERE season IN ({marks})"
+        elif table in self.RACE_TABLES:
+            query += f" WHERE race_id IN (SELECT id FROM races WHERE season IN ({marks}))"
+        else:
+            return query, []
+        return query, seasons
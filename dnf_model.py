@@ -15,13 +15,20 @@ class DNFModel(Model):
     Inherits from the abstract `Model` base class.
     """
 
-    def __init__(self, dataframes: dict):
+    def __init__(self, dataframes: dict, aggregates=None):
         """
         Store any needed attributes.
+
+        Args:
+            dataframes: Tables (races, starterfields, retirements).
+            aggregates: Optional AggregateStore whose race counts and
+                retirement sums replace the scans of the tables.
         """
         self.driver_name = None
         self.season = None
-        self.dfs_local = {n: df.copy() for n, df in dataframes.items()}
+        # Tables are only read: keep a reference (they may be shared memory maps)
+        self.dfs_local = dataframes
+        self.aggregates = aggregates
 
         self.accident_probability = None
         self.failure_probability = None
@@ -40,30 +47,13 @@ class DNFModel(Model):
         # We'll keep the probabilities at 0.2 / 0.2 as placeholders
 
 
-        ### Instanciate dataframe needed and quick cleaning
-        races_df = self.dfs_local["races"]
-        starterfields_df = self.dfs_local["starterfields"]
-        retirements_df = self.dfs_local["retirements"]
-        retirements_df = retirements_df.fillna(0)
         seasons_to_train = [self.season - x for x in range (0, 2 +1)]
-        df_filtered = retirements_df[retirements_df['season'].isin(seasons_to_train)].copy()
+        if self.aggregates is not None:
+            dnf_accident_df, dnf_failure_df = self._counts_from_aggregates(seasons_to_train)
+        else:
+            dnf_accident_df, dnf_failure_df = self._counts_from_tables(seasons_to_train)
 
-        ### To compute probability of accident per driver we need to compute the number of races did by each driver
-        count_of_races_by_driver_df = starterfields_df[['race_id', 'driver_id']].merge(races_df[['id', 'season']], left_on='race_id', right_on='id')
-        count_of_races_by_driver_df = count_of_races_by_driver_df.drop('id', axis=1)
-        count_of_races_by_driver_df = count_of_races_by_driver_df[count_of_races_by_driver_df['season'].isin(seasons_to_train)]
-        count_of_races_by_driver_df = count_of_races_by_driver_df.groupby('driver_id').agg(count_of_race=('race_id','count'))
-
-        ### To compute probability of failure per team we need to compute the number of races did by each team
-        link_driver_season_races_df = (starterfields_df[['race_id', 'driver_id', 'team']].merge(
-                                        races_df[['id', 'season']], left_on='race_id', right_on ='id', how='inner').merge(
-                                        df_filtered, on=['season', 'driver_id'], how='inner'))
-        count_of_races_by_team_df = link_driver_season_races_df.groupby(['team']).agg(count_of_race=('race_id','count'))
-
-
-        ### Compute for each driver the number of accident made and divide by the number of races ran (- > the proportion)
-        dnf_accident_df = df_filtered.groupby("driver_id").agg(total_accident=('accidents','sum'))
-        dnf_accident_df = dnf_accident_df.merge(count_of_races_by_driver_df, on='driver_id')
+        ### Proportion of accidents per race for each driver
         dnf_accident_df['accident_proportion'] = dnf_accident_df['total_accident'] / dnf_accident_df['count_of_race']
 
         ### From the proportion we obtain mu and sigma by taking the mean and standard deviation
@@ -80,10 +70,7 @@ class DNFModel(Model):
         ### Finally we can have the probability of accident by taking the expected value of the posterior distribution
         dnf_accident_df['accident_proba'] = dnf_accident_df['alpha_posterior'] / (dnf_accident_df['alpha_posterior'] + dnf_accident_df['beta_posterior'])
 
-        ### Compute for each team the number of failures that occurred and divide by the number of races ran (-> the proportion)
-        dnf_failure_df = link_driver_season_races_df.groupby(['team', 'driver_id', 'season']).agg(failures_agg=('failures','mean'))
-        dnf_failure_df = dnf_failure_df.groupby("team").agg(total_failure=('failures_agg','sum'))
-        dnf_failure_df = dnf_failure_df.merge(count_of_races_by_team_df, on='team')
+        ### Proportion of failures per race for each team
         dnf_failure_df['failure_proportion'] = dnf_failure_df['total_failure'] / dnf_failure_df['count_of_race']
         
         ### From the proportion we obtain mu and sigma by taking the mean and standard deviation
@@ -104,6 +91,65 @@ class DNFModel(Model):
 
         self.is_fitted = True
 
+    def _counts_from_tables(self, seasons_to_train):
+        """
+        Returns:
+            (accidents, failures): "total_accident" and "count_of_race" per
+            driver_id, "total_failure" and "count_of_race" per team, over
+            `seasons_to_train`, computed from the tables.
+        """
+        ### Instanciate dataframe needed and quick cleaning
+        races_df = self.dfs_local["races"]
+        starterfields_df = self.dfs_local["starterfields"]
+        retirements_df = self.dfs_local["retirements"]
+        retirements_df = retirements_df.fillna(0)
+        df_filtered = retirements_df[retirements_df['season'].isin(seasons_to_train)].copy()
+
+        ### To compute probability of accident per driver we need to compute the number of races did by each driver
+        count_of_races_by_driver_df = starterfields_df[['race_id', 'driver_id']].merge(races_df[['id', 'season']], left_on='race_id', right_on='id')
+        count_of_races_by_driver_df = count_of_races_by_driver_df.drop('id', axis=1)
+        count_of_races_by_driver_df = count_of_races_by_driver_df[count_of_races_by_driver_df['season'].isin(seasons_to_train)]
+        count_of_races_by_driver_df = count_of_races_by_driver_df.groupby('driver_id').agg(count_of_race=('race_id','count'))
+
+        ### To compute probability of failure per team we need to compute the number of races did by each team
+        link_driver_season_races_df = (starterfields_df[['race_id', 'driver_id', 'team']].merge(
+                                        races_df[['id', 'season']], left_on='race_id', right_on ='id', how='inner').merge(
+                                        df_filtered, on=['season', 'driver_id'], how='inner'))
+        count_of_races_by_team_df = link_driver_season_races_df.groupby(['team'], observed=True).agg(count_of_race=('race_id','count'))
+
+        ### Compute for each driver the number of accident made and the number of races ran
+        dnf_accident_df = df_filtered.groupby("driver_id").agg(total_accident=('accidents','sum'))
+        dnf_accident_df = dnf_accident_df.merge(count_of_races_by_driver_df, on='driver_id')
+
+        ### Compute for each team the number of failures that occurred and the number of races ran
+        dnf_failure_df = link_driver_season_races_df.groupby(['team', 'driver_id', 'season'], observed=True).agg(failures_agg=('failures','mean'))
+        dnf_failure_df = dnf_failure_df.groupby("team", observed=True).agg(total_failure=('failures_agg','sum'))
+        dnf_failure_df = dnf_failure_df.merge(count_of_races_by_team_df, on='team')
+        return dnf_accident_df, dnf_failure_df
+
+    def _counts_from_aggregates(self, seasons_to_train):
+        """
+        Same counts as `_counts_from_tables`, from the starts and retirement
+        sums of the aggregate store.
+        """
+        starts = self.aggregates.starts(seasons_to_train)
+        retirements = self.aggregates.retirement_totals(seasons_to_train)
+
+        count_of_races_by_driver_df = starts.groupby('driver_id').agg(count_of_race=('races', 'sum'))
+        dnf_accident_df = retirements.groupby('driver_id').agg(total_accident=('accidents', 'sum'))
+        dnf_accident_df = dnf_accident_df.merge(count_of_races_by_driver_df, on='driver_id')
+
+        ### Each start of a driver counts once per retirements row of their season
+        link_df = starts[starts['team'] != self.aggregates.NO_TEAM].merge(retirements, on=['season', 'driver_id'], how='inner')
+        link_df = link_df.assign(
+            count_of_race=link_df['races'] * link_df['records'],
+            failures_agg=link_df['failures'] / link_df['records'],
+        )
+        dnf_failure_df = link_df.groupby('team').agg(
+            total_failure=('failures_agg', 'sum'), count_of_race=('count_of_race', 'sum')
+        )
+        return dnf_accident_df, dnf_failure_df
+
     def predict(self):
         """
         Return a tuple (probability_of_accident, probability_of_failure).
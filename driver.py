@@ -9,31 +9,21 @@ class Driver:
     """
     Représente un pilote avec ses paramètres et modèles associés (DNF, Fuel/Tire).
     """
-    def __init__(self, season: int, race_id: int, dataframes: dict, name: str, strategy):
+    def __init__(self, season: int, race_id: int, dataframes: dict, name: str, strategy, aggregates=None):
         self.season = season
         self.dataframes = dataframes
+        # Optional AggregateStore read by the driver's models
+        self.aggregates = aggregates
         self.name = name
         self.driver_id = None
         self.initials = None
         self.team = None
 
-        self.position = None
         self.best_qualif_time = None
-        self.current_lap_time = None
-        self.cumulative_lap_time = 0
-
-        self.fuelc = 100
-        self.next_pit_stop = 1
-        self.pit_stops_info = strategy if strategy else {}
-        self.compound = self.pit_stops_info.get("starting_compound", None)
-        self.tire_age = self.pit_stops_info.get("starting_tire_age", None)
-
         self.accident_dnf_probability = None
         self.failure_dnf_probability = None
-        self.accident_dnf_lap = None
-        self.failure_dnf_lap = None
-        self.earliest_dnf_lap = None
-        self.alive = True
+
+        self.reset_race_state(strategy)
 
         self.fuel_tire_model = None
         self.variability = None
@@ -53,25 +43,10 @@ class Driver:
         self.initials = driver_row.iloc[0]["initials"]
 
         # Extract the best qualifying time for the driver 
-        qualif_laps_df = self.dataframes["qualifyings"]
-        df_drv = qualif_laps_df[
-            (qualif_laps_df["driver_id"] == self.driver_id)
-            & (qualif_laps_df["race_id"] == race_id)
-        ][["q1laptime", "q2laptime", "q3laptime"]].copy()
-
-        if df_drv.empty or df_drv.dropna(how="all").empty:
-            # fallback sur moyenne des meilleurs temps de tous les pilotes pour la course
-            race_quals = qualif_laps_df[qualif_laps_df["race_id"] == race_id]
-            self.best_qualif_time = (
-                race_quals[["race_id", "q1laptime", "q2laptime", "q3laptime"]]
-                .groupby("race_id")
-                .min()
-                .mean(axis=1)
-                .iloc[0]
-            )
+        if self.aggregates is not None:
+            self.best_qualif_time = self.aggregates.best_qualifying_time(race_id, self.driver_id)
         else:
-            # meilleur tour individuel
-            self.best_qualif_time = df_drv.min(axis=1).iloc[0]
+            self._get_best_qualif_time(race_id)
 
         merged_data = starterfields_df.merge(
             races_df, left_on="race_id", right_on="id", suffixes=("_sf", "_races")
@@ -83,7 +58,7 @@ class Driver:
             team_name = team_row.iloc[0]["team"]
             self.team = TeamRegistry.get_team(team_name)
 
-        dnf_model = DNFModel(self.dataframes)
+        dnf_model = DNFModel(self.dataframes, self.aggregates)
         dnf_model.fit(driver=self, season=self.season)
         (acc_prob, fail_prob) = dnf_model.predict()
         self.accident_dnf_probability = acc_prob
@@ -99,6 +74,47 @@ class Driver:
         self.fuel_tire_model = fuel_tire_model_obj
         self.variability = fuel_tire_model_obj.variability
 
+    def _get_best_qualif_time(self, race_id):
+        qualif_laps_df = self.dataframes["qualifyings"]
+        df_drv = qualif_laps_df[
+            (qualif_laps_df["driver_id"] == self.driver_id)
+            & (qualif_laps_df["race_id"] == race_id)
+        ][["q1laptime", "q2laptime", "q3laptime"]].copy()
+
+        if df_drv.empty or df_drv.dropna(how="all").empty:
+            # fallback sur moyenne des meilleurs temps de tous les pilotes pour la course
+            race_quals = qualif_laps_df[qualif_laps_df["race_id"] == race_id]
+            self.best_qualif_time = (
+                race_quals[["race_id", "q1laptime", "q2laptime", "q3laptime"]]
+                .groupby("race_id")
+                .min()
+                .mean(axis=1)
+                .iloc[0]
+            )
+        else:
+            # meilleur tour individuel
+            self.best_qualif_time = df_drv.min(axis=1).iloc[0]
+
+    def reset_race_state(self, strategy=None):
+        """
+        Reset everything that evolves during a race (times, tires, fuel, DNF),
+        keeping the fitted parameters and models untouched.
+        """
+        self.position = None
+        self.current_lap_time = None
+        self.cumulative_lap_time = 0
+
+        self.fuelc = 100
+        self.next_pit_stop = 1
+        self.pit_stops_info = strategy if strategy else {}
+        self.compound = self.pit_stops_info.get("starting_compound", None)
+        self.tire_age = self.pit_stops_info.get("starting_tire_age", None)
+
+        self.accident_dnf_lap = None
+        self.failure_dnf_lap = None
+        self.earliest_dnf_lap = None
+        self.alive = True
+
     def update_status(self, current_lap):
         """Ensure that drivers retire at the correct lap."""
         if self.earliest_dnf_lap is not None:
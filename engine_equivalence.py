@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+engine_equivalence.py
+
+Checks that a simulation engine (array kernel, batched or compiled path)
+behaves like the reference `Run` engine on the same fitted race. Both inputs
+are outcome tables as returned by `MonteCarloSimulator.simulate_range` or
+`RaceArrays.simulate` (one row per driver and simulation).
+
+- Deterministic runs (test mode, no pit stop variability) must agree exactly:
+  `deterministic_differences`.
+- Stochastic runs are compared per driver with two-sample tests, KS on the
+  race time of finishers and chi-square on the histogram of final positions,
+  with a Bonferroni correction so that the whole family of tests rejects an
+  equivalent engine with probability at most `alpha`: `equivalence_tests`.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2_contingency, ks_2samp
+
+
+class EngineEquivalence:
+    """
+    Comparison of a candidate engine against the reference engine.
+
+    Attributes:
+        alpha (float): Family-wise false positive rate of `equivalence_tests`.
+        rtol (float): Relative tolerance on race times of `deterministic_differences`
+            (the engines sum the lap time terms in different orders).
+    """
+
+    # Pooling of sparse position bins: smallest expected count of a chi-square cell
+    MIN_EXPECTED = 5.0
+
+    # Fewest finishers of each engine to run the KS test on a driver's race times
+    MIN_FINISHERS = 20
+
+    def __init__(self, alpha: float = 0.01, rtol: float = 1e-9) -> None:
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be in (0, 1).")
+        self.alpha = alpha
+        self.rtol = rtol
+
+    @staticmethod
+    def _align(reference: pd.DataFrame, candidate: pd.DataFrame) -> pd.DataFrame:
+        """Join both outcome tables on (simulation_id, driver_id)."""
+        keys = ["simulation_id", "driver_id"]
+        columns = keys + ["final_position", "cumulative_time", "dnf_lap"]
+        merged = reference[columns].merge(
+            candidate[columns], on=keys, how="outer", suffixes=("_reference", "_candidate"), indicator=True
+        )
+        return merged.sort_values(keys, ignore_index=True)
+
+    def deterministic_differences(self, reference: pd.DataFrame, candidate: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rows on which two deterministic runs disagree: missing on one side,
+        different final position or retirement lap, or race times further
+        apart than `rtol`.
+
+        Returns:
+            The mismatching rows of both tables side by side (empty if the
+            engines agree).
+        """
+        merged = self._align(reference, candidate)
+        ref_dnf = merged["dnf_lap_reference"].astype(float)
+        cand_dnf = merged["dnf_lap_candidate"].astype(float)
+        same_dnf = (ref_dnf == cand_dnf) | (ref_dnf.isna() & cand_dnf.isna())
+        ref_time = merged["cumulative_time_reference"].astype(float).to_numpy()
+        cand_time = merged["cumulative_time_candidate"].astype(float).to_numpy()
+        same_time = np.isclose(ref_time, cand_time, rtol=self.rtol, atol=0.0)
+        same = (
+            (merged["_merge"] == "both")
+            & (merged["final_position_reference"] == merged["final_position_candidate"])
+            & same_dnf
+            & same_time
+        )
+        return merged[~same].drop(columns="_merge").reset_index(drop=True)
+
+    def _pooled_histograms(self, reference: pd.Series, candidate: pd.Series) -> np.ndarray:
+        """
+        2 x K table of final position counts, adjacent positions pooled until
+        every cell has an expected count of at least MIN_EXPECTED.
+        """
+        positions = np.union1d(reference.unique(), candidate.unique())
+        counts = np.array([
+            reference.value_counts().reindex(positions, fill_value=0).to_numpy(),
+            candidate.value_counts().reindex(positions, fill_value=0).to_numpy(),
+        ])
+        # Expected count of the smaller sample for a bin holding `total` draws
+        share = counts.sum(axis=1).min() / counts.sum()
+        bins, current = [], np.zeros(2, dtype=np.int64)
+        for column in counts.T:
+            current = current + column
+            if current.sum() * share >= self.MIN_EXPECTED:
+                bins.append(current)
+                current = np.zeros(2, dtype=np.int64)
+        if current.sum():
+            if bins:
+                bins[-1] = bins[-1] + current
+            else:
+                bins.append(current)
+        return np.array(bins).T
+
+    def equivalence_tests(self, reference: pd.DataFrame, candidate: pd.DataFrame) -> pd.DataFrame:
+        """
+        Two-sample tests of the outcomes of each driver, from independent
+        simulations of both engines.
+
+        Returns:
+            DataFrame with "driver_id", "test" ("race_time" KS or "position"
+            chi-square), "statistic", "p_value" and "reject" (p-value below
+            alpha divided by the number of tests).
+        """
+        rows = []
+        for driver_id, ref in reference.groupby("driver_id", sort=True):
+            cand = candidate[candidate["driver_id"] == driver_id]
+            if cand.empty:
+                raise ValueError(f"Driver {driver_id} is missing from the candidate outcomes.")
+            ref_times = ref.loc[ref["dnf_lap"].isna(), "cumulative_time"].astype(float)
+            cand_times = cand.loc[cand["dnf_lap"].isna(), "cumulative_time"].astype(float)
+            if min(len(ref_times), len(cand_times)) >= self.MIN_FINISHERS:
+                result = ks_2samp(ref_times, cand_times)
+                rows.append((driver_id, "race_time", result.statistic, result.pvalue))
+            table = self._pooled_histograms(ref["final_position"], cand["final_position"])
+            if table.shape[1] > 1:
+                statistic, p_value, _, _ = chi2_contingency(table, correction=False)
+                rows.append((driver_id, "position", statistic, p_value))
+        tests = pd.DataFrame(rows, columns=["driver_id", "test", "statistic", "p_value"])
+        tests["reject"] = tests["p_value"] < self.alpha / max(len(tests), 1)
+        return tests
+
+    def equivalent(self, reference: pd.DataFrame, candidate: pd.DataFrame) -> bool:
+        """
+        Returns:
+            True if no test of `equivalence_tests` rejects.
+        """
+        return not self.equivalence_tests(reference, candidate)["reject"].any()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+fingerprint.py
+
+Stable hashing of simulation configurations (nested dicts/lists of strategies,
+grids, parameters, ...), independent of dict ordering and numpy scalar types.
+"""
+
+import hashlib
+import json
+
+
+def _normalize(obj):
+    """
+    Recursively convert `obj` into JSON-serializable builtins with a canonical
+    form: dict keys become strings (sorted at dump time), tuples become lists
+    and numpy scalars/arrays become Python numbers/lists.
+    """
+    if isinstance(obj, dict):
+        return {str(k): _normalize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(v) for v in obj]
+    if hasattr(obj, "tolist"):
+        return _normalize(obj.tolist())
+    if isinstance(obj, float) and obj.is_integer():
+        # 2.0 and 2 describe the same configuration
+        return int(obj)
+    return obj
+
+
+def stable_hash(obj) -> str:
+    """
+    Args:
+        obj: Configuration made of dicts, lists, tuples, numbers and strings.
+
+    Returns:
+        Hex SHA-256 digest, identical across processes and Python sessions.
+    """
+    payload = json.dumps(_normalize(obj), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
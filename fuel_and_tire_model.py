@@ -1,8 +1,29 @@
 # fuel_and_tire_model.py
 import numpy as np
 import pandas as pd
-import statsmodels.formula.api as smf
 from model import Model
+from model_cache import ModelCache
+
+def remove_fcy_laps(laps_df: pd.DataFrame, fcyphases_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop the laps run under a full course yellow (Safety Car / VSC) phase.
+
+    Args:
+        laps_df: Laps with "race_id" and "lapno".
+        fcyphases_df: FCY phases with "race_id", "startlap" and "endlap".
+
+    Returns:
+        laps_df without the laps between startlap and endlap of a phase of their race.
+    """
+    phases = fcyphases_df[fcyphases_df["race_id"].isin(laps_df["race_id"].unique())]
+    if phases.empty or laps_df.empty:
+        return laps_df
+    pairs = laps_df[["race_id", "lapno"]].reset_index().merge(
+        phases[["race_id", "startlap", "endlap"]], on="race_id", how="inner"
+    )
+    in_phase = pairs.loc[pairs["lapno"].between(pairs["startlap"], pairs["endlap"]), "index"]
+    return laps_df[~laps_df.index.isin(in_phase)]
+
 
 class FuelAndTireModel(Model):
     """
@@ -11,28 +32,45 @@ class FuelAndTireModel(Model):
     """
     ALL_COMPOUNDS = ["A1", "A2", "A3", "A4", "A5", "A6", "A7", "I", "W"]
 
-    # Cache pour stocker le modèle ajusté (clé = (driver_id, race_id, season))
-    cache = {}
+    # Columns of the design matrix of
+    # "corrected_lap_time ~ fuelc + C(compound) + tireage + C(compound):tireage",
+    # in the order and with the names used by statsmodels/patsy (A1 is the reference)
+    PARAM_NAMES = (
+        ["Intercept"]
+        + [f"C(compound)[T.{c}]" for c in ALL_COMPOUNDS[1:]]
+        + ["fuelc", "tireage"]
+        + [f"C(compound)[T.{c}]:tireage" for c in ALL_COMPOUNDS[1:]]
+    )
+
+    # Cache des paramètres ajustés (clé = (driver_id, race_id, season)): only the
+    # coefficients and the variability, not the statsmodels results and their data
+    cache = ModelCache("fuel_and_tire.params", max_entries=4096)
+
+    # Per-race sufficient statistics of the regression (key = (season, driver_id,
+    # uses aggregates)), see `race_statistics`
+    statistics = ModelCache("fuel_and_tire.statistics", max_entries=512)
 
     def __init__(self, season: int, driver_id: int, race_id: int, dataframes: dict):
         self.season = season
         self.driver_id = driver_id
         self.race_id = race_id
-        self.dfs_local = {n: df.copy() for n, df in dataframes.items()}
+        # Tables are only read: keep a reference (they may be shared memory maps)
+        self.dfs_local = dataframes
         self.best_qualif_times = pd.DataFrame()
         self.laps_df = pd.DataFrame()
         self.train_data = pd.DataFrame()
         self.test_data = pd.DataFrame()
         self.model = None
+        self.params = None
         self.variability = None
         self.is_fitted = False
 
     def fit(self):
         key = (self.driver_id, self.race_id, self.season)
         # Si le modèle est en cache, on le récupère directement
-        if key in FuelAndTireModel.cache:
-            cached = FuelAndTireModel.cache[key]
-            self.model = cached["model"]
+        cached = FuelAndTireModel.cache.get(key)
+        if cached is not None:
+            self.params = cached["params"]
             self.variability = cached["variability"]
             self.is_fitted = True
             return
@@ -44,15 +82,336 @@ class FuelAndTireModel(Model):
         self._split_train_test()
         self._regression()
 
+        self.params = self.model.params
         self.variability = np.std(self.model.resid)
         self.is_fitted = True
 
-        FuelAndTireModel.cache[key] = {"model": self.model, "variability": self.variability}
+        FuelAndTireModel.cache[key] = {"params": self.params, "variability": self.variability}
+
+    @classmethod
+    def fit_batch(cls, season: int, race_id: int, driver_ids, dataframes: dict, aggregates=None) -> dict:
+        """
+        Fit the models of several drivers of a race at once.
+
+        The normal equations of each driver are the sums of the per-race
+        blocks of `race_statistics` over the races before `race_id`, and all
+        drivers are solved together with grouped NumPy linear algebra
+        (minimum-norm solutions, as statsmodels' pinv fit). Fitting the next
+        race of the season only adds one block. Fitted parameters are stored
+        in the class cache, so that the `fit()` of these drivers becomes a
+        cache lookup.
+
+        Args:
+            season: Season of the race.
+            race_id: Race to predict; training uses the season's earlier races.
+            driver_ids: Drivers to fit.
+            dataframes: Tables (laps, races, starterfields, fcyphases, qualifyings).
+            aggregates: Optional AggregateStore providing the best qualifying times.
+
+        Returns:
+            dict driver_id -> {"params": pd.Series, "variability": float}, for
+            every driver with training laps.
+        """
+        statistics = cls.race_statistics(season, driver_ids, dataframes, aggregates)
+        groups, blocks = [], []
+        for driver_id, stats in statistics.items():
+            # Races before `race_id`: a prefix of the sorted per-race blocks
+            n_races = int(np.searchsorted(stats["race_ids"], race_id))
+            if n_races and stats["cum_n"][n_races - 1] > 0:
+                groups.append(driver_id)
+                blocks.append({name: stats[f"cum_{name}"][n_races - 1] for name in ("xtx", "xty", "n", "yty")})
+        if not groups:
+            return {}
+
+        xtx = np.stack([b["xtx"] for b in blocks])
+        xty = np.stack([b["xty"] for b in blocks])
+        betas = cls._solve_normal_equations(xtx, xty)
+        n = np.array([b["n"] for b in blocks], dtype=float)
+        yty = np.array([b["yty"] for b in blocks])
+        variabilities = cls._residual_std(xtx, xty, n, yty, betas)
+
+        fitted = {}
+        for g, driver_id in enumerate(groups):
+            params = pd.Series(betas[g], index=cls.PARAM_NAMES)
+            fitted[driver_id] = {"params": params, "variability": variabilities[g]}
+            cls.cache[(driver_id, race_id, season)] = {"params": params, "variability": variabilities[g]}
+        return fitted
+
+    @classmethod
+    def race_statistics(cls, season: int, driver_ids, dataframes: dict, aggregates=None) -> dict:
+        """
+        Per-race sufficient statistics of the regression of each driver over
+        a season: X'X, X'y, number of laps and y'y of every race, with their
+        running sums over the races. The laps of the season are cleaned and
+        reduced once per driver; the results are kept in `statistics`, with
+        the races of the season they were computed from: an entry is computed
+        again once the tables hold other races of the season (e.g. new races
+        added to the database).
+
+        Args:
+            season: Season of the races.
+            driver_ids: Drivers.
+            dataframes: Tables (laps, races, starterfields, fcyphases, qualifyings).
+            aggregates: Optional AggregateStore providing the best qualifying times.
+
+        Returns:
+            dict driver_id -> {"race_ids", "xtx", "xty", "n", "yty", "cum_xtx",
+            "cum_xty", "cum_n", "cum_yty", "season_race_ids"}, arrays over the
+            driver's races in race_id order (empty without clean laps).
+        """
+        races_df = dataframes["races"]
+        season_race_ids = np.sort(races_df.loc[races_df["season"] == season, "id"].to_numpy(dtype=np.int64))
+        source = aggregates is not None
+        # Read every entry once: the cache may evict while the missing ones are added
+        result = {d: cls.statistics.get((season, d, source)) for d in driver_ids}
+        missing = [
+            d for d, stats in result.items()
+            if stats is None or not np.array_equal(stats["season_race_ids"], season_race_ids)
+        ]
+        if missing:
+            laps = cls._batch_regression_data(season, None, missing, dataframes, aggregates)
+            X = cls.design_matrix(laps)
+            y = laps["corrected_lap_time"].to_numpy(dtype=float)
+            keys = laps[["driver_id", "race_id"]].to_numpy(dtype=np.int64)
+            n_params = len(cls.PARAM_NAMES)
+            per_driver = {d: ([], [], [], [], []) for d in missing}
+            if len(laps):
+                pairs, index = np.unique(keys, axis=0, return_inverse=True)
+                order = np.argsort(index.ravel(), kind="stable")
+                bounds = np.concatenate([[0], np.cumsum(np.bincount(index.ravel()))])
+                for g, (driver_id, race_id) in enumerate(pairs):
+                    rows = order[bounds[g]:bounds[g + 1]]
+                    race_ids, xtx, xty, n, yty = per_driver[driver_id]
+                    race_ids.append(race_id)
+                    xtx.append(X[rows].T @ X[rows])
+                    xty.append(X[rows].T @ y[rows])
+                    n.append(len(rows))
+                    yty.append(y[rows] @ y[rows])
+            for driver_id, (race_ids, xtx, xty, n, yty) in per_driver.items():
+                stats = {
+                    "race_ids": np.array(race_ids, dtype=np.int64),
+                    "xtx": np.array(xtx, dtype=float).reshape(-1, n_params, n_params),
+                    "xty": np.array(xty, dtype=float).reshape(-1, n_params),
+                    "n": np.array(n, dtype=np.int64),
+                    "yty": np.array(yty, dtype=float),
+                    "season_race_ids": season_race_ids,
+                }
+                for name in ("xtx", "xty", "n", "yty"):
+                    stats[f"cum_{name}"] = np.cumsum(stats[name], axis=0)
+                cls.statistics[(season, driver_id, source)] = stats
+                result[driver_id] = stats
+        return result
+
+    @classmethod
+    def walk_forward(cls, season: int, driver_ids, dataframes: dict) -> pd.DataFrame:
+        """
+        Walk-forward evaluation over a season: for every race of each driver,
+        fit on the driver's earlier races of the season and score on the race.
+        Everything comes from `race_statistics`, i.e. one pass over the laps.
+
+        Args:
+            season: Season to evaluate.
+            driver_ids: Drivers.
+            dataframes: Tables (laps, races, starterfields, fcyphases, qualifyings).
+
+        Returns:
+            DataFrame with "driver_id", "race_id", "n_train", "n_test",
+            "variability" (training residual std), "test_rmse" and the
+            coefficients (PARAM_NAMES columns).
+        """
+        statistics = cls.race_statistics(season, driver_ids, dataframes)
+        rows, train, test = [], [], []
+        for driver_id, stats in statistics.items():
+            for k in range(1, len(stats["race_ids"])):
+                rows.append((driver_id, stats["race_ids"][k], stats["cum_n"][k - 1], stats["n"][k]))
+                train.append(k - 1)
+                test.append((driver_id, k))
+        columns = ["driver_id", "race_id", "n_train", "n_test", "variability", "test_rmse"] + cls.PARAM_NAMES
+        if not rows:
+            return pd.DataFrame(columns=columns)
+
+        def stack(name: str, cumulative: bool) -> np.ndarray:
+            index = train if cumulative else [k for _, k in test]
+            prefix = "cum_" if cumulative else ""
+            return np.array([statistics[d][prefix + name][k] for (d, _), k in zip(test, index)], dtype=float)
+
+        xtx, xty = stack("xtx", True), stack("xty", True)
+        betas = cls._solve_normal_equations(xtx, xty)
+        variabilities = cls._residual_std(xtx, xty, stack("n", True), stack("yty", True), betas)
+        # Out-of-sample squared error of race k from its own block
+        test_xtx, test_xty, test_yty = stack("xtx", False), stack("xty", False), stack("yty", False)
+        sse = (
+            test_yty
+            - 2 * np.einsum("gi,gi->g", betas, test_xty)
+            + np.einsum("gi,gij,gj->g", betas, test_xtx, betas)
+        )
+        df = pd.DataFrame(rows, columns=columns[:4])
+        df["variability"] = variabilities
+        df["test_rmse"] = np.sqrt(np.maximum(sse, 0.0) / df["n_test"].to_numpy())
+        return pd.concat([df, pd.DataFrame(betas, columns=cls.PARAM_NAMES)], axis=1)
+
+    @staticmethod
+    def _residual_std(xtx: np.ndarray, xty: np.ndarray, n: np.ndarray, yty: np.ndarray, betas: np.ndarray) -> np.ndarray:
+        """
+        Residual standard deviation (np.std of the residuals, as in `fit`)
+        from the normal equations: the first column of X is the intercept, so
+        X'X[:, 0] = X'1 and X'y[0] = sum(y).
+        """
+        sum_resid = xty[:, 0] - np.einsum("gi,gi->g", betas, xtx[:, :, 0])
+        sum_sq = yty - 2 * np.einsum("gi,gi->g", betas, xty) + np.einsum("gi,gij,gj->g", betas, xtx, betas)
+        var = sum_sq / n - (sum_resid / n) ** 2
+        return np.sqrt(np.maximum(var, 0.0))
+
+    @staticmethod
+    def _solve_normal_equations(xtx: np.ndarray, xty: np.ndarray) -> np.ndarray:
+        """
+        Solve a stack of normal equations X'X b = X'y for minimum-norm b.
+
+        Columns never observed in a problem (e.g. compounds a driver did not
+        use) have a zero diagonal: they are set to zero, like statsmodels'
+        pinv does, and the remaining system is solved with one batched pinv.
+
+        Args:
+            xtx: Array (G, P, P).
+            xty: Array (G, P).
+
+        Returns:
+            Array (G, P) of coefficients.
+        """
+        inactive = np.diagonal(xtx, axis1=1, axis2=2) == 0
+        xtx = xtx.copy()
+        xtx[inactive[:, :, None] & np.eye(xtx.shape[1], dtype=bool)[None]] = 1.0
+        # X'X squares the condition number of X: cut singular values accordingly
+        betas = np.einsum("gij,gj->gi", np.linalg.pinv(xtx, rcond=1e-10, hermitian=True), xty)
+        betas[inactive] = 0.0
+        return betas
+
+    @classmethod
+    def compound_categorical(cls, compound: pd.Series) -> pd.Series:
+        """
+        Return `compound` as a categorical over ALL_COMPOUNDS. Columns already
+        loaded as categoricals are only recoded, never converted back to strings.
+        """
+        if isinstance(compound.dtype, pd.CategoricalDtype):
+            return compound.cat.set_categories(cls.ALL_COMPOUNDS)
+        return pd.Series(
+            pd.Categorical(compound, categories=cls.ALL_COMPOUNDS),
+            index=compound.index, name=compound.name,
+        )
+
+    @classmethod
+    def design_matrix(cls, df: pd.DataFrame) -> np.ndarray:
+        """
+        Build the design matrix of the OLS formula, columns in PARAM_NAMES order.
+
+        Args:
+            df: Rows with "fuelc", "compound" and "tireage".
+
+        Returns:
+            Array of shape (len(df), len(PARAM_NAMES)).
+        """
+        codes = cls.compound_categorical(df["compound"]).cat.codes.to_numpy()
+        dummies = (codes[:, None] == np.arange(1, len(cls.ALL_COMPOUNDS))[None, :]).astype(float)
+        fuelc = df["fuelc"].to_numpy(dtype=float)
+        tireage = df["tireage"].to_numpy(dtype=float)
+        return np.column_stack([
+            np.ones(len(df)),
+            dummies,
+            fuelc,
+            tireage,
+            dummies * tireage[:, None],
+        ])
+
+    @classmethod
+    def _batch_regression_data(
+        cls, season: int, race_id: int | None, driver_ids, dataframes: dict, aggregates=None
+    ) -> pd.DataFrame:
+        """
+        Vectorized equivalent of the cleaning steps of `fit` for several drivers:
+        finished races of the season, no FCY laps, no pit in/out laps, best
+        qualifying time, fuel feature, training races before `race_id` (all
+        races of the season if None). Best qualifying times are read from
+        `aggregates` when given.
+        """
+        laps_df = dataframes["laps"]
+        races_df = dataframes["races"]
+        starterfields_df = dataframes["starterfields"]
+        fcyphases_df = dataframes["fcyphases"]
+        qualif_laps_df = dataframes["qualifyings"]
+
+        race_ids_season = races_df[races_df["season"] == season]["id"]
+        laps_df = laps_df[laps_df["driver_id"].isin(driver_ids) & laps_df["race_id"].isin(race_ids_season)]
+
+        finished = starterfields_df[
+            starterfields_df["driver_id"].isin(driver_ids)
+            & starterfields_df["race_id"].isin(race_ids_season)
+            & (starterfields_df["status"] == "F")
+        ][["race_id", "driver_id"]]
+        laps_df = laps_df.merge(finished, on=["race_id", "driver_id"], how="inner", sort=False)
+
+        # Suppression des phases de sécurité (Safety Car / VSC)
+        laps_df = remove_fcy_laps(laps_df, fcyphases_df)
+
+        # Pit in laps and the lap following them (within each driver's sequence)
+        pit_in = laps_df["pitintime"].notna()
+        pit_out = pit_in.groupby(laps_df["driver_id"]).shift(1, fill_value=False).astype(bool)
+        laps_df = laps_df[~(pit_in | pit_out)]
+
+        if aggregates is not None:
+            best_qualif_times = aggregates.best_qualifying_times(race_ids_season, driver_ids)
+        else:
+            quals = qualif_laps_df[qualif_laps_df["driver_id"].isin(driver_ids)]
+            best_qualif_times = (
+                quals[["race_id", "driver_id", "q1laptime", "q2laptime", "q3laptime"]]
+                .groupby(["race_id", "driver_id"]).min().min(axis=1)
+                .rename("best_qualif_time")
+                .reset_index()
+            )
+        laps_df = laps_df.merge(best_qualif_times, on=["race_id", "driver_id"], how="left")
+
+        laps_df = laps_df.assign(
+            fuelc=100 - (100 / laps_df.groupby(["driver_id", "race_id"])["lapno"].transform("max")) * laps_df["lapno"],
+            corrected_lap_time=laps_df["laptime"] - laps_df["best_qualif_time"],
+            compound=cls.compound_categorical(laps_df["compound"]),
+        )
+        laps_df = laps_df.dropna(subset=["laptime", "best_qualif_time", "fuelc", "compound", "tireage"])
+        if race_id is not None:
+            laps_df = laps_df[laps_df["race_id"] < race_id]
+        return laps_df.reset_index(drop=True)
 
     def predict(self, features: pd.DataFrame) -> pd.Series:
         if not self.is_fitted:
             raise RuntimeError("FuelAndTireModel n'a pas été ajusté.")
-        return self.model.predict(features)
+        if self.model is not None:
+            return self.model.predict(features)
+        values = self.design_matrix(features) @ self.params.to_numpy()
+        return pd.Series(values, index=features.index)
+
+    def predict_lap_time(self, fuelc: float, compound: str, tire_age: float) -> float:
+        """
+        Predict a single corrected lap time directly from the OLS coefficients.
+
+        Equivalent to `predict` on a one-row DataFrame, without the formula
+        machinery, which makes it cheap enough to call on every simulated lap.
+        """
+        if not self.is_fitted:
+            raise RuntimeError("FuelAndTireModel n'a pas été ajusté.")
+        params = self.params
+        return (
+            params["Intercept"]
+            + params.get(f"C(compound)[T.{compound}]", 0.0)
+            + params["fuelc"] * fuelc
+            + self.tire_degradation_rate(compound) * tire_age
+        )
+
+    def tire_degradation_rate(self, compound: str) -> float:
+        """
+        Lap time lost per lap of tire age on `compound` (tireage slope of the OLS).
+        """
+        if not self.is_fitted:
+            raise RuntimeError("FuelAndTireModel n'a pas été ajusté.")
+        params = self.params
+        return params["tireage"] + params.get(f"C(compound)[T.{compound}]:tireage", 0.0)
 
     def _clean_data(self):
         laps_df = self.dfs_local["laps"]
@@ -106,7 +465,7 @@ class FuelAndTireModel(Model):
             raise RuntimeError("Aucune donnée de laps pour préparation de la régression.")
         required_features = ["laptime", "best_qualif_time", "fuelc", "compound", "tireage"]
         self.laps_df["corrected_lap_time"] = self.laps_df["laptime"] - self.laps_df["best_qualif_time"]
-        self.laps_df["compound"] = pd.Categorical(self.laps_df["compound"], categories=self.ALL_COMPOUNDS)
+        self.laps_df["compound"] = self.compound_categorical(self.laps_df["compound"])
         self.laps_df.dropna(subset=required_features, inplace=True)
 
     def _split_train_test(self):
@@ -117,5 +476,7 @@ class FuelAndTireModel(Model):
         self.test_data = self.laps_df[self.laps_df["race_id"] == self.race_id]
 
     def _regression(self):
+        # statsmodels is only imported when a model actually has to be fitted
+        import statsmodels.formula.api as smf
         formula = "corrected_lap_time ~ fuelc + C(compound) + tireage + C(compound):tireage"
         self.model = smf.ols(formula=formula, data=self.train_data).fit()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+importance_sampling.py
+
+Importance sampling of rare race outcomes on the array backend. Outcomes such
+as a midfield podium hinge on rare combinations of front-runner retirements
+and safety cars, which plain Monte Carlo only sees a handful of times per
+million races. The sampler draws races with the retirement probabilities of
+the DNF model and the safety car rate (or the hazards of the safety car
+model) tilted upwards, and carries the likelihood ratio of each race as a
+"weight". Weighted means of event indicators are unbiased estimates of the
+untilted probabilities, with a standard error and an effective sample size
+(see also `RaceAnalytics`, which accepts the weighted outcomes).
+"""
+
+import numpy as np
+import pandas as pd
+
+from lap_kernel import RaceArrays
+
+
+class ImportanceSampler:
+    """
+    Tilted simulation of a race with likelihood ratio weights.
+
+    Attributes:
+        arrays (RaceArrays): Race simulated.
+        seed (int | None): Campaign seed (simulation i draws from (seed, i)).
+        q_accident (np.ndarray): (D,) tilted accident probabilities.
+        q_failure (np.ndarray): (D,) tilted failure probabilities.
+        q_sc (float): Tilted probability that a retirement brings a safety car.
+        hazard_tilt (float | None): Multiplier of the safety car model hazards.
+    """
+
+    # Cap of the tilted probabilities (unless the original one is higher)
+    MAX_PROBABILITY = 0.5
+
+    def __init__(
+        self,
+        arrays: RaceArrays,
+        dnf_tilt: float = 2.0,
+        sc_tilt: float = 2.0,
+        drivers: list[str] | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """
+        Args:
+            arrays: Race to simulate (not in test mode).
+            dnf_tilt: Multiplier of the accident and failure probabilities.
+            sc_tilt: Multiplier of the safety car probability per retirement,
+                or of the phase start hazards with a safety car model.
+            drivers: Names of the drivers whose retirements are tilted
+                (default: all), e.g. the cars ahead of the one of interest.
+            seed: Campaign seed.
+        """
+        if arrays.test_mode:
+            raise ValueError("Importance sampling needs random events (no test mode).")
+        if dnf_tilt <= 0 or sc_tilt <= 0:
+            raise ValueError("Tilts must be positive.")
+        self.arrays = arrays
+        self.seed = seed
+        tilted = np.ones(len(arrays.driver_ids), dtype=bool)
+        if drivers is not None:
+            unknown = set(drivers) - set(arrays.driver_names)
+            if unknown:
+                raise ValueError(f"Unknown drivers: {sorted(unknown)}")
+            tilted = np.isin(arrays.driver_names, list(drivers))
+        self.q_accident = np.where(tilted, self._tilt(arrays.p_accident, dnf_tilt), arrays.p_accident)
+        self.q_failure = np.where(tilted, self._tilt(arrays.p_failure, dnf_tilt), arrays.p_failure)
+        self.q_sc = float(self._tilt(np.array(arrays.p_sc), sc_tilt))
+        self.hazard_tilt = sc_tilt if arrays.safety_car_model is not None else None
+
+    @classmethod
+    def _tilt(cls, p: np.ndarray, tilt: float) -> np.ndarray:
+        """Probabilities multiplied by `tilt`, capped at MAX_PROBABILITY (or p if higher)."""
+        return np.minimum(p * tilt, np.maximum(p, cls.MAX_PROBABILITY))
+
+    @staticmethod
+    def _bernoulli_log_ratio(happened: np.ndarray, p: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """log P(draw | p) - log P(draw | q) of Bernoulli draws (0 where p == q)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(happened, np.log(p) - np.log(q), np.log1p(-p) - np.log1p(-q))
+        return np.where(p == q, 0.0, ratio)
+
+    def simulate(self, sim_ids, compiled: bool = True) -> pd.DataFrame:
+        """
+        Simulate races under the tilted probabilities.
+
+        Args:
+            sim_ids: Simulation identifiers.
+            compiled: Run the Numba kernel (False: interpreted kernel).
+
+        Returns:
+            Outcomes as `RaceArrays.simulate`, plus the "weight" of each
+            simulation (likelihood ratio of its random events).
+        """
+        sim_ids = list(sim_ids)
+        arrays = self.arrays
+        inputs, log_weight = arrays._draw(sim_ids, self.seed, self.hazard_tilt)
+        out_time, out_position, out_dnf = arrays._run_kernel(
+            inputs, self.q_accident, self.q_failure, self.q_sc, compiled
+        )
+        _, u_dnf, u_sc, _, _ = inputs
+        log_weight = log_weight + self._bernoulli_log_ratio(
+            u_dnf[:, :, 0] < self.q_accident, arrays.p_accident, self.q_accident
+        ).sum(axis=1)
+        log_weight += self._bernoulli_log_ratio(
+            u_dnf[:, :, 2] < self.q_failure, arrays.p_failure, self.q_failure
+        ).sum(axis=1)
+        # The safety car draw of a driver only matters if they retire
+        sc_ratio = self._bernoulli_log_ratio(u_sc < self.q_sc, np.array(arrays.p_sc), np.array(self.q_sc))
+        log_weight += np.where(out_dnf > 0, sc_ratio, 0.0).sum(axis=1)
+
+        outcomes = arrays._outcomes(sim_ids, out_time, out_position, out_dnf)
+        outcomes["weight"] = np.repeat(np.exp(log_weight), len(arrays.driver_ids))
+        return outcomes
+
+    @staticmethod
+    def finishes_in_top(driver_name: str, max_position: int):
+        """
+        Event "`driver_name` is classified in the top `max_position`", for `probability`.
+        """
+        def event(outcomes: pd.DataFrame) -> pd.Series:
+            rows = outcomes[outcomes["driver_name"] == driver_name]
+            hit = rows["dnf_lap"].isna() & (rows["final_position"] <= max_position)
+            return pd.Series(hit.to_numpy(), index=rows["simulation_id"].to_numpy())
+        return event
+
+    def probability(
+        self,
+        event,
+        target_relative_error: float = 0.1,
+        batch_size: int = 2000,
+        max_simulations: int = 1_000_000,
+        first_sim_id: int = 0,
+        compiled: bool = True,
+    ) -> dict:
+        """
+        Estimate the probability of an event, simulating batches until its
+        relative standard error reaches `target_relative_error`.
+
+        Args:
+            event: Callable mapping outcomes to a boolean Series indexed by
+                simulation_id (see `finishes_in_top`).
+            target_relative_error: Standard error / estimate to reach.
+            batch_size: Simulations per batch.
+            max_simulations: Budget; the estimate is returned when reached.
+            first_sim_id: First simulation identifier.
+            compiled: Run the Numba kernel (False: interpreted kernel).
+
+        Returns:
+            dict with "probability" (unbiased weighted mean), "standard_error",
+            "relative_error", "num_simulations", "effective_sample_size" (of
+            the weights of the simulations where the event happened) and
+            "hits" (number of such simulations).
+        """
+        contributions = []
+        n_sims = 0
+        while n_sims < max_simulations:
+            size = min(batch_size, max_simulations - n_sims)
+            outcomes = self.simulate(range(first_sim_id + n_sims, first_sim_id + n_sims + size), compiled)
+            weights = outcomes.groupby("simulation_id", sort=False)["weight"].first()
+            hits = event(outcomes).reindex(weights.index, fill_value=False).astype(bool)
+            contributions.append(np.where(hits, weights.to_numpy(), 0.0))
+            n_sims += size
+            estimate = self._estimate(np.concatenate(contributions))
+            if estimate["probability"] > 0 and estimate["relative_error"] <= target_relative_error:
+                break
+        return self._estimate(np.concatenate(contributions))
+
+    @staticmethod
+    def _estimate(contributions: np.ndarray) -> dict:
+        """Unbiased estimate from the weight-times-indicator of each simulation."""
+        n_sims = len(contributions)
+        probability = float(contributions.mean())
+        standard_error = float(contributions.std(ddof=1) / np.sqrt(n_sims)) if n_sims > 1 else np.inf
+        hit_weights = contributions[contributions > 0]
+        ess = float(hit_weights.sum() ** 2 / (hit_weights ** 2).sum()) if len(hit_weights) else 0.0
+        return {
+            "probability": probability,
+            "standard_error": standard_error,
+            "relative_error": standard_error / probability if probability > 0 else np.inf,
+            "num_simulations": n_sims,
+            "effective_sample_size": ess,
+            "hits": len(hit_weights),
+        }
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+lap_aggregates.py
+
+Defines the LapAggregates class, which builds the lap-derived inputs of the
+models (pit stop durations and quantiles, FCY-cleaned regression laps, final
+laps and DNF counts) from laps streamed one race at a time, so that the whole
+laps table never has to be in memory.
+"""
+
+import pandas as pd
+
+from data_loader import DataLoader, compact_dtypes
+from fuel_and_tire_model import remove_fcy_laps
+
+
+class LapAggregates:
+    """
+    Incremental lap aggregates, updated race by race (see `DataLoader.iter_laps`).
+
+    `pit_stops` and `regression_laps` have the columns of the laps table that
+    their models use, so each can stand in for `dataframes["laps"]` when
+    fitting `PitStop` and `FuelAndTireModel` respectively.
+
+    Attributes:
+        best_pit_stop (dict[int, float]): race_id -> PIT_STOP_QUANTILE quantile
+            of the pit stop durations of the race.
+    """
+
+    # Quantile of a race's pit stop durations taken as its best pit stop
+    PIT_STOP_QUANTILE = 0.025
+
+    # Columns kept for the fuel & tire regression
+    REGRESSION_COLUMNS = ["race_id", "driver_id", "lapno", "laptime", "pitintime", "compound", "tireage"]
+
+    def __init__(self, dataframes: dict) -> None:
+        """
+        Args:
+            dataframes: The small tables ("starterfields", "fcyphases"),
+                e.g. from `DataLoader.load_data(tables=...)`.
+        """
+        self.starterfields = dataframes["starterfields"]
+        self.fcyphases = dataframes["fcyphases"]
+        self.best_pit_stop: dict[int, float] = {}
+        self._pit_stops: list[pd.DataFrame] = []
+        self._regression_laps: list[pd.DataFrame] = []
+        self._final_laps: list[pd.DataFrame] = []
+
+    @classmethod
+    def build(cls, loader: DataLoader, seasons=None, batch_size: int = 50_000) -> "LapAggregates":
+        """
+        Stream the laps of `seasons` (default: all) through a new LapAggregates.
+
+        Args:
+            loader: Loader of the database.
+            seasons: Seasons to aggregate.
+            batch_size: Rows fetched from SQLite at a time.
+
+        Returns:
+            The filled LapAggregates.
+        """
+        tables = loader.load_data(seasons=seasons, tables=["starterfields", "fcyphases"])
+        aggregates = cls(tables)
+        for race_id, laps in loader.iter_laps(seasons=seasons, batch_size=batch_size):
+            aggregates.update(race_id, laps)
+        return aggregates
+
+    def update(self, race_id: int, laps: pd.DataFrame) -> None:
+        """
+        Add the laps of one race.
+
+        Args:
+            race_id: Race of the laps.
+            laps: All laps of the race, in driver_id, lapno order.
+        """
+        # Pit stops
+        stops = laps.loc[laps["pitstopduration"].notna(), ["race_id", "driver_id", "lapno", "pitstopduration"]]
+        if not stops.empty:
+            self.best_pit_stop[race_id] = stops["pitstopduration"].quantile(q=self.PIT_STOP_QUANTILE)
+            self._pit_stops.append(stops)
+
+        # Last lap completed by each driver, and its race time
+        self._final_laps.append(
+            laps.groupby("driver_id", sort=False).tail(1).loc[:, ["race_id", "driver_id", "lapno", "racetime"]]
+        )
+
+        # Laps of finishers, without FCY phases nor pit in/out laps
+        sf = self.starterfields
+        finished = sf.loc[(sf["race_id"] == race_id) & (sf["status"] == "F"), "driver_id"]
+        clean = remove_fcy_laps(laps[laps["driver_id"].isin(finished)], self.fcyphases)
+        pit_in = clean["pitintime"].notna()
+        pit_out = pit_in.groupby(clean["driver_id"]).shift(1, fill_value=False).astype(bool)
+        self._regression_laps.append(clean.loc[~(pit_in | pit_out), self.REGRESSION_COLUMNS])
+
+    @property
+    def pit_stops(self) -> pd.DataFrame:
+        """Pit stop laps: race_id, driver_id, lapno, pitstopduration."""
+        return self._concat(self._pit_stops, ["race_id", "driver_id", "lapno", "pitstopduration"])
+
+    @property
+    def regression_laps(self) -> pd.DataFrame:
+        """Laps usable by the fuel & tire regression (REGRESSION_COLUMNS)."""
+        return self._concat(self._regression_laps, self.REGRESSION_COLUMNS)
+
+    @property
+    def final_laps(self) -> pd.DataFrame:
+        """Per race and driver: laps completed, race time and starterfields status."""
+        final = self._concat(self._final_laps, ["race_id", "driver_id", "lapno", "racetime"])
+        return final.merge(self.starterfields[["race_id", "driver_id", "status"]], on=["race_id", "driver_id"], how="left")
+
+    def dnf_counts(self) -> pd.Series:
+        """
+        Returns:
+            Number of drivers who did not finish, per race_id.
+        """
+        final = self.final_laps
+        return (final["status"] != "F").groupby(final["race_id"]).sum().rename("dnf_count")
+
+    @staticmethod
+    def _concat(frames: list, columns: list) -> pd.DataFrame:
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        # Per-race categoricals differ in categories: recompact after concatenation
+        return compact_dtypes(pd.concat(frames, ignore_index=True))
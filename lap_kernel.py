@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+lap_kernel.py
+
+Array backend of the race simulation. The state of every driver (tires, fuel,
+pit stop plan, DNF lap, race time) is held in flat NumPy arrays, and one
+kernel runs the lap-by-lap transition of `Run` (retirements, pit windows,
+safety car multiplier, classification) for a batch of simulations.
+
+The kernel is compiled with Numba when it is installed, and then runs the
+simulations of a batch in parallel; without Numba the same function runs
+interpreted (slow, only meant for testing). Random inputs are drawn with NumPy
+outside the kernel, from (seed, simulation_id), so simulation i does not
+depend on the batch it runs in.
+
+Process pools forked after the compiled kernel has run (`SensitivitySweep`,
+`SimulationServer`) need Numba's "workqueue" threading layer
+(NUMBA_THREADING_LAYER=workqueue): forked children hang on the worker threads
+of the TBB layer that the parent started.
+
+The outcomes follow the same distribution as `Run` but not the same random
+stream: both engines agree statistically, not draw for draw. In test mode the
+scripted retirements and safety car laps of `Run` are replayed without lap time
+noise, so that both engines agree exactly up to the pit stop durations.
+"""
+
+import importlib.util
+import types
+
+import numpy as np
+import pandas as pd
+
+# Compiled kernel, built on first use
+_COMPILED = None
+
+# Interpreted execution: prange is a plain range (numba.prange once compiled)
+prange = range
+
+
+def numba_available() -> bool:
+    """Returns True if Numba can be imported."""
+    return importlib.util.find_spec("numba") is not None
+
+
+def _race_kernel(
+    num_laps, grid_time, base_time, compound_offset, fuel_coef, deg_rate, sigma,
+    p_accident, p_failure, start_compound, start_age,
+    n_stops, stop_lap, stop_low, stop_high, stop_compound, stop_age,
+    pit_base, pit_shape, pit_scale,
+    p_sc, sc_dur, sc_factor,
+    noise, u_dnf, u_sc, u_pit, lap_factor,
+    out_time, out_position, out_dnf,
+):
+    """
+    Simulate S races of D drivers (see `RaceArrays` for the driver arrays).
+
+    Args:
+        noise: (S, L, D) standard normal lap time noise.
+        u_dnf: (S, D, 4) uniforms: accident, accident lap, failure, failure lap.
+        u_sc: (S, D) uniforms deciding whether a retirement brings a safety car.
+        u_pit: (S, D, K) uniforms of the pit stop durations.
+        lap_factor: (S, L + 1) lap time multiplier of the FCY phases drawn
+            from a safety car model (1 on green laps).
+        out_time, out_position, out_dnf: (S, D) outputs: race time, final
+            position and retirement lap (0 for finishers).
+    """
+    n_sims, n_drivers = out_time.shape
+    fuel_step = 100.0 / num_laps
+    for s in prange(n_sims):
+        # Retirements and the safety car phases they trigger
+        dnf = np.zeros(n_drivers, dtype=np.int64)
+        safety_car = np.zeros(num_laps + 1, dtype=np.bool_)
+        for d in range(n_drivers):
+            lap = 0
+            if u_dnf[s, d, 0] < p_accident[d]:
+                lap = 1 + int(u_dnf[s, d, 1] * num_laps)
+            if u_dnf[s, d, 2] < p_failure[d]:
+                failure_lap = 1 + int(u_dnf[s, d, 3] * num_laps)
+                if lap == 0 or failure_lap < lap:
+                    lap = failure_lap
+            dnf[d] = lap
+            if lap > 0 and u_sc[s, d] < p_sc:
+                for sc_lap in range(lap, min(lap + sc_dur - 1, num_laps) + 1):
+                    safety_car[sc_lap] = True
+
+        # Lap by lap transition
+        time = grid_time.copy()
+        compound = start_compound.copy()
+        age = start_age.copy()
+        fuel = np.full(n_drivers, 100.0)
+        next_stop = np.zeros(n_drivers, dtype=np.int64)
+        for lap in range(1, num_laps + 1):
+            for d in range(n_drivers):
+                if dnf[d] > 0 and lap >= dnf[d]:
+                    continue
+                age[d] += 1.0
+                fuel[d] = max(fuel[d] - fuel_step, 0.0)
+                c = compound[d]
+                lap_time = (
+                    base_time[d] + compound_offset[d, c] + fuel_coef[d] * fuel[d]
+                    + deg_rate[d, c] * age[d] + sigma[d] * noise[s, lap - 1, d]
+                )
+                if safety_car[lap]:
+                    lap_time *= sc_factor
+                else:
+                    lap_time *= lap_factor[s, lap]
+                k = next_stop[d]
+                if k < n_stops[d] and (
+                    lap == stop_lap[d, k] or (stop_low[d, k] <= lap and lap < stop_high[d, k])
+                ):
+                    u = u_pit[s, d, k]
+                    lap_time += pit_base[d] + pit_scale[d] * (u / (1.0 - u)) ** (1.0 / pit_shape[d])
+                    age[d] = stop_age[d, k]
+                    compound[d] = stop_compound[d, k]
+                    next_stop[d] = k + 1
+                time[d] += lap_time
+
+        # Classification: finishers by race time, then retirements, latest first
+        n_finishers = 0
+        for d in range(n_drivers):
+            if dnf[d] == 0:
+                n_finishers += 1
+        finish_key = np.empty(n_drivers)
+        retire_key = np.empty(n_drivers, dtype=np.int64)
+        for d in range(n_drivers):
+            finish_key[d] = time[d] if dnf[d] == 0 else np.inf
+            # Unique keys: retirement lap descending, grid order on ties
+            retire_key[d] = (num_laps + 1 - dnf[d]) * n_drivers + d if dnf[d] > 0 else -1
+        finish_order = np.argsort(finish_key)
+        retire_order = np.argsort(retire_key)
+        for rank in range(n_finishers):
+            out_position[s, finish_order[rank]] = rank + 1
+        for rank in range(n_drivers - n_finishers):
+            out_position[s, retire_order[n_finishers + rank]] = n_finishers + rank + 1
+        for d in range(n_drivers):
+            out_time[s, d] = time[d]
+            out_dnf[s, d] = dnf[d]
+
+
+def _compiled_kernel():
+    """Compile `_race_kernel` with Numba, parallel over simulations (once)."""
+    global _COMPILED
+    if _COMPILED is None:
+        # numba is optional and slow to import
+        import numba
+
+        # Same code, with `prange` bound to Numba's parallel range
+        kernel = types.FunctionType(
+            _race_kernel.__code__, {**_race_kernel.__globals__, "prange": numba.prange}, "_race_kernel"
+        )
+        _COMPILED = numba.njit(parallel=True)(kernel)
+    return _COMPILED
+
+
+class RaceArrays:
+    """
+    Flat array description of a race, built from a fresh `Run`: its fitted
+    drivers, their strategies, the starting grid and the parameters.
+
+    Attributes:
+        driver_ids (np.ndarray): (D,) drivers, in grid order.
+        driver_names (list[str]): Driver names, in the same order.
+        num_laps (int): Race distance.
+        compounds (list): Compounds of the strategies; arrays indexed by
+            compound use these positions.
+    """
+
+    def __init__(self, run) -> None:
+        """
+        Args:
+            run: A `Run` that has not started (no traffic model).
+        """
+        if run.traffic_model is not None:
+            raise ValueError("The array backend does not support a traffic model.")
+        self.gp_location = run.gp_location
+        self.test_mode = run.test_mode
+        self.safety_car_model = run.safety_car_model
+        drivers = run.drivers_list
+        params = run.parameters
+        n_drivers = len(drivers)
+        self.num_laps = int(run.number_of_laps)
+        self.driver_ids = np.array([int(d.driver_id) for d in drivers], dtype=np.int64)
+        self.driver_names = [d.name for d in drivers]
+
+        compounds = []
+        for d in drivers:
+            for compound in [d.compound] + [d.pit_stops_info[k]["compound"] for k in self._stop_keys(d)]:
+                if compound not in compounds:
+                    compounds.append(compound)
+        self.compounds = compounds
+        n_stops = np.array([len(self._stop_keys(d)) for d in drivers], dtype=np.int64)
+        max_stops = max(int(n_stops.max()) if n_drivers else 0, 1)
+
+        grid = dict(run.starting_grid)
+        self.grid_time = np.array(
+            [grid.get(d.driver_id, 0) * params["t_per_grid_pos"] for d in drivers], dtype=float
+        )
+        self.base_time = np.empty(n_drivers)
+        self.fuel_coef = np.empty(n_drivers)
+        self.compound_offset = np.zeros((n_drivers, len(compounds)))
+        self.deg_rate = np.zeros((n_drivers, len(compounds)))
+        for i, d in enumerate(drivers):
+            model = d.fuel_tire_model
+            self.base_time[i] = d.best_qualif_time + model.params["Intercept"]
+            self.fuel_coef[i] = model.params["fuelc"]
+            for c, compound in enumerate(compounds):
+                self.compound_offset[i, c] = model.params.get(f"C(compound)[T.{compound}]", 0.0)
+                self.deg_rate[i, c] = params["tire_deg_scale"] * model.tire_degradation_rate(compound)
+        self.sigma = np.array([d.variability * params["variability_scale"] for d in drivers], dtype=float)
+        self.p_accident = np.array([d.accident_dnf_probability for d in drivers], dtype=float)
+        self.p_failure = np.array([d.failure_dnf_probability for d in drivers], dtype=float)
+        self.start_compound = np.array([compounds.index(d.compound) for d in drivers], dtype=np.int64)
+        self.start_age = np.array([d.tire_age or 0 for d in drivers], dtype=float)
+
+        self.n_stops = n_stops
+        self.stop_lap = np.zeros((n_drivers, max_stops), dtype=np.int64)
+        self.stop_low = np.zeros((n_drivers, max_stops), dtype=np.int64)
+        self.stop_high = np.zeros((n_drivers, max_stops), dtype=np.int64)
+        self.stop_compound = np.zeros((n_drivers, max_stops), dtype=np.int64)
+        self.stop_age = np.zeros((n_drivers, max_stops), dtype=float)
+        self.pit_base = np.zeros(n_drivers)
+        self.pit_shape = np.ones(n_drivers)
+        self.pit_scale = np.zeros(n_drivers)
+        for i, d in enumerate(drivers):
+            for k, key in enumerate(self._stop_keys(d)):
+                stop = d.pit_stops_info[key]
+                self.stop_lap[i, k] = stop["pit_stop_lap"]
+                self.stop_low[i, k], self.stop_high[i, k] = stop["pitstop_interval"]
+                self.stop_compound[i, k] = compounds.index(stop["compound"])
+                self.stop_age[i, k] = stop["tire_age"]
+            if n_stops[i]:
+                pit_stop = run.context.get_pit_stop(d.team)
+                shape, loc, scale = pit_stop.variability_law
+                self.pit_base[i] = pit_stop.avg_min_pit_stop_duration + loc + params["pit_loss_offset"]
+                self.pit_shape[i], self.pit_scale[i] = shape, scale
+
+        # With a safety car model, FCY phases come from it instead of DNFs
+        self.p_sc = float(params["p_sc"]) if self.safety_car_model is None else 0.0
+        self.sc_dur = int(params["sc_dur"])
+        self.sc_factor = float(params["sc_factor"])
+        self.fcy_factors = np.array([1.0, params["sc_factor"], params["vsc_factor"]])
+
+        if self.test_mode:
+            # Scripted events of `Run`: accidents on known laps, fixed safety car laps
+            self.scripted_dnf = np.zeros(n_drivers, dtype=np.int64)
+            for i, d in enumerate(drivers):
+                run.simulate_dnf_lap(d)
+                # Scripted laps past the race distance never come in `Run` either
+                if d.earliest_dnf_lap is not None and d.earliest_dnf_lap <= self.num_laps:
+                    # A retirement on lap 0 is a retirement before completing lap 1
+                    self.scripted_dnf[i] = max(d.earliest_dnf_lap, 1)
+            self.p_accident = (self.scripted_dnf > 0).astype(float)
+            self.p_failure = np.zeros(n_drivers)
+            self.p_sc = 0.0
+            self.scripted_lap_factor = np.ones(self.num_laps + 1)
+            for lap in run.safety_car_laps:
+                if 1 <= lap <= self.num_laps:
+                    self.scripted_lap_factor[lap] = self.sc_factor
+
+    @staticmethod
+    def _stop_keys(driver) -> list:
+        """Consecutive planned stops 1, 2, ... of a driver (as `Run` follows them)."""
+        keys = []
+        while len(keys) + 1 in driver.pit_stops_info:
+            keys.append(len(keys) + 1)
+        return keys
+
+    def draw(self, sim_ids, seed: int | None) -> tuple:
+        """
+        Draw the random inputs of simulations `sim_ids`, each from its own
+        (seed, simulation_id) stream (fresh entropy if `seed` is None).
+
+        Returns:
+            (noise, u_dnf, u_sc, u_pit, lap_factor) arrays of the kernel.
+        """
+        return self._draw(sim_ids, seed)[0]
+
+    def _draw(self, sim_ids, seed: int | None, hazard_tilt: float | None = None) -> tuple:
+        """
+        `draw`, with the FCY phases of the safety car model optionally drawn
+        from hazards tilted by `hazard_tilt` (same random stream).
+
+        Returns:
+            (kernel inputs, (S,) log likelihood ratio of the FCY phases).
+        """
+        n_sims, n_drivers = len(sim_ids), len(self.driver_ids)
+        max_stops = self.stop_lap.shape[1]
+        noise = np.empty((n_sims, self.num_laps, n_drivers))
+        u_dnf = np.empty((n_sims, n_drivers, 4))
+        u_sc = np.empty((n_sims, n_drivers))
+        u_pit = np.empty((n_sims, n_drivers, max_stops))
+        lap_factor = np.ones((n_sims, self.num_laps + 1))
+        fcy_log_weight = np.zeros(n_sims)
+        for s, sim_id in enumerate(sim_ids):
+            rng = np.random.default_rng(None if seed is None else [seed, sim_id])
+            noise[s] = rng.standard_normal((self.num_laps, n_drivers))
+            u_dnf[s] = rng.random((n_drivers, 4))
+            u_sc[s] = rng.random(n_drivers)
+            u_pit[s] = rng.random((n_drivers, max_stops))
+            if self.safety_car_model is not None:
+                if hazard_tilt is None:
+                    phases = self.safety_car_model.sample(self.gp_location, self.num_laps, rng=rng)[0]
+                else:
+                    phases, log_weight = self.safety_car_model.sample_tilted(
+                        self.gp_location, self.num_laps, hazard_tilt, rng=rng
+                    )
+                    phases, fcy_log_weight[s] = phases[0], log_weight[0]
+                lap_factor[s] = self.fcy_factors[phases]
+        if self.test_mode:
+            # No lap noise; the accident uniforms land on the scripted laps
+            noise[:] = 0.0
+            u_dnf[:, :, 0] = 0.0
+            u_dnf[:, :, 1] = (self.scripted_dnf - 0.5) / self.num_laps
+            lap_factor[:] = self.scripted_lap_factor
+        return (noise, u_dnf, u_sc, u_pit, lap_factor), fcy_log_weight
+
+    def simulate(self, sim_ids, seed: int | None = None, compiled: bool = True) -> pd.DataFrame:
+        """
+        Simulate a batch of races.
+
+        Args:
+            sim_ids: Simulation identifiers (seed the random inputs).
+            seed: Campaign seed.
+            compiled: Run the Numba kernel (False: interpreted kernel).
+
+        Returns:
+            Outcomes with the columns of `Run.outcomes` plus `simulation_id`,
+            ordered by simulation then grid order.
+        """
+        sim_ids = list(sim_ids)
+        outputs = self._run_kernel(self.draw(sim_ids, seed), self.p_accident, self.p_failure, self.p_sc, compiled)
+        return self._outcomes(sim_ids, *outputs)
+
+    def _run_kernel(self, inputs: tuple, p_accident: np.ndarray, p_failure: np.ndarray, p_sc: float, compiled: bool) -> tuple:
+        """
+        Run the kernel on drawn `inputs`, with the given retirement and
+        safety car probabilities.
+
+        Returns:
+            (out_time, out_position, out_dnf) arrays.
+        """
+        n_sims, n_drivers = inputs[1].shape[:2]
+        out_time = np.empty((n_sims, n_drivers))
+        out_position = np.empty((n_sims, n_drivers), dtype=np.int64)
+        out_dnf = np.empty((n_sims, n_drivers), dtype=np.int64)
+        kernel = _compiled_kernel() if compiled else _race_kernel
+        kernel(
+            self.num_laps, self.grid_time, self.base_time, self.compound_offset, self.fuel_coef,
+            self.deg_rate, self.sigma, p_accident, p_failure, self.start_compound,
+            self.start_age, self.n_stops, self.stop_lap, self.stop_low, self.stop_high,
+            self.stop_compound, self.stop_age, self.pit_base, self.pit_shape, self.pit_scale,
+            p_sc, self.sc_dur, self.sc_factor,
+            *inputs,
+            out_time, out_position, out_dnf,
+        )
+        return out_time, out_position, out_dnf
+
+    def _outcomes(self, sim_ids: list, out_time: np.ndarray, out_position: np.ndarray, out_dnf: np.ndarray) -> pd.DataFrame:
+        """Outcome table of the kernel outputs (see `simulate`)."""
+        n_sims, n_drivers = out_time.shape
+        dnf_lap = out_dnf.ravel().astype(float)
+        dnf_lap[dnf_lap == 0] = np.nan
+        return pd.DataFrame({
+            "driver_id": np.tile(self.driver_ids, n_sims),
+            "driver_name": np.tile(np.array(self.driver_names, dtype=object), n_sims),
+            "final_position": out_position.ravel(),
+            "cumulative_time": out_time.ravel(),
+            "dnf_lap": dnf_lap,
+            "simulation_id": np.repeat(np.asarray(sim_ids, dtype=np.int64), n_drivers),
+        })
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+model_cache.py
+
+Bounded in-process caches of fitted model parameters. A long-lived process
+(simulation server, backtest over hundreds of races) fits models for many
+(driver, race, season) keys; a plain class-level dict would keep all of them
+for the life of the process. A ModelCache keeps at most `max_entries` entries
+and evicts the least recently used one beyond that, counts its hits, misses
+and evictions, and can be cleared, or scoped to a job with `scope()`.
+
+Every cache is guarded by a lock, so threads can share it. Caches are
+registered at creation: after a fork the child process gets fresh locks (a
+lock held by another thread of the parent at fork time would otherwise stay
+locked forever in the child), and `clear_all` / `cache_stats` act on all of
+them at once.
+"""
+
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator
+
+import pandas as pd
+
+_caches: "weakref.WeakSet[ModelCache]" = weakref.WeakSet()
+
+# Sentinel of absent entries (None is a valid cached value)
+_MISSING = object()
+
+
+class ModelCache:
+    """
+    Thread-safe LRU mapping with hit, miss and eviction counters.
+
+    Attributes:
+        name (str): Name reported by `cache_stats`.
+        max_entries (int): Number of entries kept; the least recently used
+            entry is evicted beyond it.
+        hits (int): Lookups that found their key.
+        misses (int): Lookups that did not.
+        evictions (int): Entries evicted to respect `max_entries`.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024) -> None:
+        if max_entries < 1:
+            raise ValueError("A cache must hold at least one entry.")
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Value of `key` (marked as most recently used), or `default` if absent.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Value of `key`, created with `factory()` and stored on a miss. The
+        lock is held meanwhile, so concurrent callers share one value.
+        """
+        with self._lock:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = factory()
+                self.put(key, value)
+            return value
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.put(key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Membership tests neither count as lookups nor refresh the entry
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove `key` and return its value (`default` if absent)."""
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    @contextmanager
+    def scope(self) -> Iterator["ModelCache"]:
+        """
+        Context in which new entries are temporary: keys added inside the
+        `with` block are removed when it exits, entries that existed before
+        are kept. Meant for one job at a time per process.
+        """
+        with self._lock:
+            before = set(self._entries)
+        try:
+            yield self
+        finally:
+            with self._lock:
+                for key in [k for k in self._entries if k not in before]:
+                    del self._entries[key]
+
+    def stats(self) -> dict:
+        """Counters, current size and hit rate of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else float("nan"),
+            }
+
+    def _reset_lock(self) -> None:
+        self._lock = threading.RLock()
+
+
+def clear_all() -> None:
+    """Clear every ModelCache of the process (e.g. between backtest jobs)."""
+    for cache in list(_caches):
+        cache.clear()
+
+
+def cache_stats() -> pd.DataFrame:
+    """
+    Returns:
+        One row of `ModelCache.stats` per cache of the process, indexed by name.
+    """
+    rows = [cache.stats() for cache in list(_caches)]
+    return pd.DataFrame(rows, columns=[
+        "name", "size", "max_entries", "hits", "misses", "evictions", "hit_rate"
+    ]).set_index("name").sort_index()
+
+
+def _after_fork_in_child() -> None:
+    for cache in list(_caches):
+        cache._reset_lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
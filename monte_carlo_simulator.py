@@ -3,14 +3,34 @@ from typing import Dict, Any
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from rich.progress import Progress
 
+from aggregate_store import AggregateStore
+from checkpoint import SimulationCheckpoint
 from data_loader import DataLoader
+from fingerprint import stable_hash
+from importance_sampling import ImportanceSampler
+from lap_kernel import RaceArrays, numba_available
+from race_analytics import RaceAnalytics
+from race_context import RaceContext
+from qmc_sampling import SobolSampler
+from race_snapshot import RaceSnapshot
+from result_cache import ResultCache, database_fingerprint, source_fingerprint
+from results_sink import ResultsWriter
 from run import Run
-from spearman_evaluation import SpearmanEvaluation
-from rmse_evaluation import RMSEEvaluation
-from wilcoxon_evaluation import WilcoxonEvaluation
+from safety_car_model import SafetyCarModel
+from strategy_evaluator import StrategyEvaluator
+from strategy_surrogate import StrategySurrogate
+from traffic_model import TrafficModel
+from trajectory_bands import TrajectoryBands
+
+# Modules whose code determines the simulated outcomes. A hash of their source
+# is part of the result cache key, so a change to the models invalidates the
+# outcomes cached before it.
+MODEL_MODULES = (
+    "aggregate_store", "data_loader", "dnf_model", "driver", "fuel_and_tire_model",
+    "lap_kernel", "model", "monte_carlo_simulator", "pit_stop", "preprocessor",
+    "race_context", "race_snapshot", "run", "safety_car_model", "team", "traffic_model",
+)
 
 
 class MonteCarloSimulator:
@@ -20,6 +40,15 @@ class MonteCarloSimulator:
     statistics, and plots outcomes.
     """
 
+    # Seasons before `season` used by the models (pit stop and DNF training)
+    HISTORY_SEASONS = 2
+
+    # Simulation engines: `Run` objects, or the Numba lap kernel (lap_kernel.py)
+    ENGINES = ("python", "numba")
+
+    # Simulations per call of the Numba kernel
+    KERNEL_BATCH = 1000
+
     def __init__(
         self,
         season: int,
@@ -30,6 +59,13 @@ class MonteCarloSimulator:
         test_mode: bool = False,
         starting_grid: list[tuple[int,int]] | None = None,
         verbose: bool = True,
+        parameters: Dict[str, Any] | None = None,
+        seed: int | None = None,
+        cache: ResultCache | None = None,
+        traffic_model: TrafficModel | None = None,
+        engine: str = "python",
+        safety_car_model: SafetyCarModel | None = None,
+        aggregates: AggregateStore | None = None,
     ) -> None:
         """
         Args:
@@ -40,6 +76,21 @@ class MonteCarloSimulator:
             num_simulations: Number of Monte Carlo runs.
             test_mode: Use deterministic events from the real race if True.
             verbose: Enable INFO logging if True.
+            parameters: Overrides of `Run.DEFAULT_PARAMETERS`.
+            seed: If set, simulation i is seeded from (seed, i), which makes
+                every simulation reproducible independently of the others.
+            cache: Optional on-disk result cache. Only seeded simulations are
+                cached, since only they can be reproduced.
+            traffic_model: Optional traffic/overtaking model passed to every run.
+            engine: "python" (one `Run` per simulation) or "numba" (compiled
+                kernel over batches of simulations, without lap traces or
+                traffic model). Falls back to "python", with a warning,
+                when numba is not installed.
+            safety_car_model: Optional empirical SC/VSC hazard tables passed
+                to every run (see safety_car_model.py).
+            aggregates: Optional store of materialized aggregates the models
+                read instead of scanning the tables; it is first refreshed
+                with the races of `db_path` it does not hold yet.
         """
         self.season = season
         self.gp_location = gp_location
@@ -49,10 +100,23 @@ class MonteCarloSimulator:
         self.test_mode = test_mode
 
         self.starting_grid = starting_grid
-
-        # Load data once
+        self.parameters = Run.resolve_parameters(parameters)
+        self.seed = seed
+        self.cache = cache
+        self.traffic_model = traffic_model
+        self.safety_car_model = safety_car_model
+        self.aggregates = aggregates
+        if aggregates is not None:
+            aggregates.refresh(db_path)
+
+        # Load data once, only for the seasons the models are trained on
         loader = DataLoader(db_path=self.db_path)
-        self.dataframes = loader.load_data()
+        self.dataframes = loader.load_data(
+            seasons=range(self.season - self.HISTORY_SEASONS, self.season + 1)
+        )
+
+        # Fitted race context, built on first use and shared by every run
+        self.context = None
 
         # Placeholders for results
         self.results = []  # type: list[pd.DataFrame]
@@ -68,8 +132,51 @@ class MonteCarloSimulator:
             self.logger.addHandler(handler)
         self.logger.setLevel(logging.INFO if verbose else logging.WARNING)
 
-    def run_simulation(self) -> None:
-        """Run the Monte Carlo simulations and aggregate outcomes."""
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}; expected one of {self.ENGINES}.")
+        if engine == "numba":
+            if traffic_model is not None:
+                raise ValueError("The numba engine does not support a traffic model.")
+            if not numba_available():
+                self.logger.warning("numba is not installed: falling back to the python engine.")
+                engine = "python"
+        self.engine = engine
+        self._race_arrays = None
+
+        report = loader.memory_report
+        if report is not None:
+            self.logger.info(
+                "Loaded tables: %.1f MB (%.1f MB before dtype compaction)",
+                report.loc["total", "bytes_after"] / 1e6,
+                report.loc["total", "bytes_before"] / 1e6,
+            )
+
+    def run_simulation(
+        self,
+        checkpoint_path: str | None = None,
+        checkpoint_every: int = 100,
+        sink: ResultsWriter | None = None,
+        trajectories: TrajectoryBands | None = None,
+    ) -> None:
+        """
+        Run the Monte Carlo simulations and aggregate outcomes.
+
+        Args:
+            checkpoint_path: If set, completed simulations are appended to this
+                file every `checkpoint_every` runs, and a later call with the
+                same configuration resumes from it. The file is kept at the end,
+                so rerunning a finished campaign only reloads it.
+            checkpoint_every: Number of simulations between two checkpoints.
+            sink: If set, the outcomes (and lap traces, if the writer keeps them)
+                of the simulations run by this call are streamed to it. The
+                result cache, which holds no lap traces, is then not read.
+            trajectories: If set, the lap traces of the simulations run by
+                this call are folded into it (see `trajectory_bands`; python
+                engine only, the numba kernel keeps no lap traces). The result
+                cache is then not read.
+        """
+        if trajectories is not None and self.engine == "numba":
+            raise ValueError("Trajectory bands need the lap traces of the python engine.")
         self.logger.info(
             "Simulating %d races for %s %d",
             self.num_simulations, self.gp_location, self.season
@@ -77,27 +184,342 @@ class MonteCarloSimulator:
 
         # Clear previous results
         self.results.clear()
-
+        completed = 0
+
+        # Reuse the cached prefix of simulations 0..n-1, if any
+        cache_key = self.cache_key() if self.cache is not None and self.seed is not None else None
+        if cache_key is not None and (sink is not None or trajectories is not None):
+            self.logger.info("Streaming the simulations: the result cache is only written.")
+        elif cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                completed = min(int(cached["simulation_id"].max()) + 1, self.num_simulations)
+                self.results.append(cached[cached["simulation_id"] < completed])
+                self.logger.info("Loaded %d simulations from the result cache.", completed)
+                if completed == self.num_simulations:
+                    self.final_outcomes = pd.concat(self.results, ignore_index=True)
+                    return
+
+        checkpoint = None
+        batch = []
+        if checkpoint_path is not None:
+            checkpoint = SimulationCheckpoint(checkpoint_path, self.configuration_key())
+            state = checkpoint.load()
+            checkpointed = state["completed"] if state is not None else 0
+            if checkpointed > completed:
+                completed = min(checkpointed, self.num_simulations)
+                outcomes = state["outcomes"]
+                self.results = [outcomes[outcomes["simulation_id"] < completed]]
+                np.random.set_state(state["rng_state"])
+                self.logger.info("Resuming from checkpoint after %d simulations.", completed)
+            elif completed > checkpointed:
+                # The cached simulations the checkpoint lacks go into its next
+                # record, so that it alone can resume the whole campaign
+                cached = pd.concat(self.results, ignore_index=True)
+                batch = [cached[cached["simulation_id"] >= checkpointed]]
+
+        self.get_context()
+
+        from rich.progress import Progress
+
+        done = completed
         with Progress() as progress:
             task = progress.add_task(
-                "[cyan]Running simulations...", total=self.num_simulations
+                "[cyan]Running simulations...", total=self.num_simulations, completed=completed
             )
-            for _ in range(self.num_simulations):
-                sim = Run(
-                    season=self.season,
-                    gp_location=self.gp_location,
-                    dataframes=self.dataframes,
-                    driver_strategies=self.driver_strategies,
-                    test_mode=self.test_mode,
-                    starting_grid=self.starting_grid,
-                )
-                sim.run()
-                self.results.append(sim.outcomes)
-                progress.update(task, advance=1)
-
+            for outcomes, laps_summary in self._iter_simulations(completed, self.num_simulations):
+                self.results.append(outcomes)
+                batch.append(outcomes)
+                if sink is not None:
+                    sink.write_outcomes(outcomes, laps_summary)
+                if trajectories is not None:
+                    trajectories.update(laps_summary)
+                count = int(outcomes["simulation_id"].nunique())
+                progress.update(task, advance=count)
+
+                done += count
+                crossed = done // checkpoint_every > (done - count) // checkpoint_every
+                if checkpoint is not None and (crossed or done == self.num_simulations):
+                    checkpoint.save(done, pd.concat(batch, ignore_index=True), np.random.get_state())
+                    batch = []
+
+        if sink is not None:
+            sink.flush()
         self.final_outcomes = pd.concat(self.results, ignore_index=True)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is None or len(cached) < len(self.final_outcomes):
+                self.cache.put(cache_key, self.final_outcomes)
         self.logger.info("Simulations completed.")
 
+    def simulate(self, sim_id: int) -> Run:
+        """
+        Run simulation `sim_id` of the campaign (seeded per simulation when
+        `seed` is set, so the result does not depend on who runs it).
+
+        Args:
+            sim_id: Simulation index.
+
+        Returns:
+            The completed Run.
+        """
+        context = self.get_context()
+        self._seed_simulation(sim_id)
+        sim = Run(
+            season=self.season,
+            gp_location=self.gp_location,
+            dataframes=self.dataframes,
+            driver_strategies=self.driver_strategies,
+            test_mode=self.test_mode,
+            starting_grid=self.starting_grid,
+            parameters=self.parameters,
+            context=context,
+            traffic_model=self.traffic_model,
+            safety_car_model=self.safety_car_model,
+        )
+        sim.run()
+        return sim
+
+    def simulate_range(self, first_sim_id: int, num_simulations: int) -> pd.DataFrame:
+        """
+        Run simulations first_sim_id .. first_sim_id + num_simulations - 1.
+
+        Returns:
+            Their outcomes, with a `simulation_id` column.
+        """
+        return pd.concat(
+            [outcomes for outcomes, _ in self._iter_simulations(first_sim_id, first_sim_id + num_simulations)],
+            ignore_index=True,
+        )
+
+    def _iter_simulations(self, first_sim_id: int, end_sim_id: int):
+        """
+        Run simulations first_sim_id .. end_sim_id - 1 with the selected engine.
+
+        Yields:
+            (outcomes with `simulation_id`, lap traces or None): one simulation
+            at a time with the python engine, KERNEL_BATCH with numba.
+        """
+        if self.engine == "numba":
+            arrays = self.race_arrays()
+            for start in range(first_sim_id, end_sim_id, self.KERNEL_BATCH):
+                sim_ids = range(start, min(start + self.KERNEL_BATCH, end_sim_id))
+                yield arrays.simulate(sim_ids, self.seed), None
+            return
+        for sim_id in range(first_sim_id, end_sim_id):
+            sim = self.simulate(sim_id)
+            yield sim.outcomes.assign(simulation_id=sim_id), sim.laps_summary.assign(simulation_id=sim_id)
+
+    def race_arrays(self, driver_strategies: dict | None = None) -> RaceArrays:
+        """
+        Return the flat arrays of the race for the Numba kernel, built on first call.
+
+        Args:
+            driver_strategies: Other strategies to build the arrays with (not
+                cached), e.g. to evaluate alternatives of one driver.
+        """
+        if driver_strategies is not None or self._race_arrays is None:
+            run = Run(
+                season=self.season,
+                gp_location=self.gp_location,
+                dataframes=self.dataframes,
+                driver_strategies=self.driver_strategies if driver_strategies is None else driver_strategies,
+                test_mode=self.test_mode,
+                starting_grid=self.starting_grid,
+                parameters=self.parameters,
+                context=self.get_context(),
+                traffic_model=self.traffic_model,
+                safety_car_model=self.safety_car_model,
+            )
+            if driver_strategies is not None:
+                return RaceArrays(run)
+            self._race_arrays = RaceArrays(run)
+        return self._race_arrays
+
+    def _configuration(self) -> Dict[str, Any]:
+        """
+        Everything that determines the outcomes of simulation i, the number
+        of simulations excepted (so that a campaign can be extended).
+        """
+        configuration = {
+            "season": self.season,
+            "gp_location": self.gp_location,
+            "driver_strategies": self.driver_strategies,
+            "test_mode": self.test_mode,
+            "starting_grid": self.starting_grid,
+            "parameters": self.parameters,
+            "seed": self.seed,
+            "traffic_model": vars(self.traffic_model) if self.traffic_model is not None else None,
+        }
+        # The engines draw different random streams (python keys stay unchanged)
+        if self.engine != "python":
+            configuration["engine"] = self.engine
+        if self.safety_car_model is not None:
+            configuration["safety_car_model"] = self.safety_car_model.to_dict()
+        # The models then read their inputs from the store, not from the tables
+        if self.aggregates is not None:
+            configuration["aggregates"] = True
+        return configuration
+
+    def configuration_key(self) -> str:
+        """
+        Returns:
+            Hex digest of the configuration and database path (checkpoint key).
+        """
+        return stable_hash({**self._configuration(), "db_path": self.db_path})
+
+    def cache_key(self) -> str:
+        """
+        Returns:
+            Hex digest of the configuration, database content and model
+            version (result cache key).
+        """
+        return stable_hash({
+            **self._configuration(),
+            "db": database_fingerprint(self.db_path),
+            "model_version": source_fingerprint(MODEL_MODULES),
+        })
+
+    def _seed_simulation(self, sim_id: int) -> None:
+        """Seed the global NumPy RNG for simulation `sim_id` when a seed is set."""
+        self.seed_simulation(self.seed, sim_id)
+
+    @staticmethod
+    def seed_simulation(seed: int | None, sim_id: int) -> None:
+        """
+        Seed the global NumPy RNG from (seed, sim_id); do nothing if seed is None.
+        """
+        if seed is not None:
+            seed_seq = np.random.SeedSequence([seed, sim_id])
+            np.random.seed(seed_seq.generate_state(1)[0])
+
+    def run_from_snapshot(
+        self,
+        snapshot: RaceSnapshot,
+        num_simulations: int | None = None,
+        driver_strategies: Dict[str, Dict[int, Any]] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Run Monte Carlo continuations of a race from `snapshot`: only the laps
+        after `snapshot.lap` are simulated, so the cost is proportional to the
+        remaining laps. Continuation i is seeded from (seed, i) when `seed`
+        is set, as `simulate` is.
+
+        Args:
+            snapshot: Race state to resume from (e.g. from `Run.run_until`).
+            num_simulations: Number of continuations (default: `num_simulations`).
+            driver_strategies: Optional new strategies for some drivers, e.g.
+                a stop on the next lap to answer "what if we pit now?".
+
+        Returns:
+            Concatenated outcomes of the continuations (also in `final_outcomes`).
+        """
+        num_simulations = num_simulations or self.num_simulations
+        context = self.get_context()
+        self.logger.info(
+            "Simulating %d continuations from lap %d of %s %d",
+            num_simulations, snapshot.lap, self.gp_location, self.season
+        )
+        self.results.clear()
+        for sim_id in range(num_simulations):
+            self._seed_simulation(sim_id)
+            sim = Run.from_snapshot(
+                context,
+                snapshot,
+                driver_strategies=driver_strategies,
+                test_mode=self.test_mode,
+                parameters=self.parameters,
+                traffic_model=self.traffic_model,
+                safety_car_model=self.safety_car_model,
+            )
+            sim.run()
+            self.results.append(sim.outcomes.assign(simulation_id=sim_id))
+
+        self.final_outcomes = pd.concat(self.results, ignore_index=True)
+        return self.final_outcomes
+
+    def get_context(self) -> RaceContext:
+        """
+        Return the fitted RaceContext of this race, fitting it on first call.
+        """
+        if self.context is None:
+            self.context = RaceContext(
+                season=self.season,
+                gp_location=self.gp_location,
+                dataframes=self.dataframes,
+                driver_strategies=self.driver_strategies,
+                starting_grid=self.starting_grid,
+                aggregates=self.aggregates,
+            ).fit()
+        return self.context
+
+    def evaluator(self, pit_stop_estimate: str = "mean") -> StrategyEvaluator:
+        """
+        Returns:
+            Closed-form evaluator of strategies for this race and parameters,
+            to pre-screen candidates before simulating them.
+        """
+        return StrategyEvaluator(
+            self.get_context(),
+            parameters=self.parameters,
+            safety_car_model=self.safety_car_model,
+            starting_grid=self.starting_grid,
+            pit_stop_estimate=pit_stop_estimate,
+        )
+
+    def importance_sampler(
+        self, dnf_tilt: float = 2.0, sc_tilt: float = 2.0, drivers: list[str] | None = None
+    ) -> ImportanceSampler:
+        """
+        Returns:
+            Sampler of this race with tilted retirement and safety car
+            probabilities, for rare outcome probabilities (see
+            importance_sampling.py), seeded with the campaign seed.
+        """
+        return ImportanceSampler(self.race_arrays(), dnf_tilt=dnf_tilt, sc_tilt=sc_tilt, drivers=drivers, seed=self.seed)
+
+    def sobol_sampler(self) -> SobolSampler:
+        """
+        Returns:
+            Randomized quasi-Monte Carlo sampler of this race (scrambled Sobol
+            inputs, see qmc_sampling.py), seeded with the campaign seed.
+        """
+        return SobolSampler(self.race_arrays(), seed=self.seed)
+
+    def surrogate(self, driver_name: str, num_simulations: int = 256) -> StrategySurrogate:
+        """
+        Returns:
+            Unfitted emulator of `driver_name`'s expected position and race
+            time over their strategies (see strategy_surrogate.py).
+        """
+        return StrategySurrogate(self, driver_name, num_simulations=num_simulations, seed=self.seed or 0)
+
+    def trajectory_bands(self, reservoir_size: int = 100, relative_accuracy: float = 0.01) -> TrajectoryBands:
+        """
+        Returns:
+            Empty streaming summary of the gap and position trajectories of
+            this race's drivers, for `run_simulation(trajectories=...)`, with
+            its reservoir seeded by the campaign seed.
+        """
+        context = self.get_context()
+        return TrajectoryBands(
+            [driver_id for driver_id, _ in context.starting_grid],
+            context.number_of_laps,
+            relative_accuracy=relative_accuracy,
+            reservoir_size=reservoir_size,
+            seed=self.seed,
+        )
+
+    def analytics(self) -> RaceAnalytics:
+        """
+        Returns:
+            Position probability matrix, win/podium/points and head-to-head
+            probabilities of the simulated outcomes.
+        """
+        if self.final_outcomes.empty:
+            raise RuntimeError("No simulation data: call run_simulation() first.")
+        return RaceAnalytics(self.final_outcomes)
+
     def compare_outcomes(self) -> pd.DataFrame:
         """
         Compare simulated averages to actual race results.
@@ -178,6 +600,11 @@ class MonteCarloSimulator:
             self.logger.error("No comparison data for statistical tests.")
             return {}
 
+        # Evaluation modules pull scipy in: import them only when evaluating
+        from rmse_evaluation import RMSEEvaluation
+        from spearman_evaluation import SpearmanEvaluation
+        from wilcoxon_evaluation import WilcoxonEvaluation
+
         self.logger.info("Running RMSE ...")
         rmse_res = RMSEEvaluation(
             actual_data=self.comparison_df["cumulative_time_actual"],
@@ -201,6 +628,8 @@ class MonteCarloSimulator:
     def plot_results(self) -> None:
         """
         Plot the results of the simulations and comparisons."""
+        import matplotlib.pyplot as plt
+
         df = self.comparison_df
 
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
@@ -1,16 +1,18 @@
 # pit_stop.py
+import numpy as np
 import pandas as pd
-from scipy.stats import fisk
 
 class PitStop:
     """
     Gère la logique des arrêts aux stands pour une équipe, un circuit et une saison donnés.
     """
-    def __init__(self, team, gp_location, season, dataframes):
+    def __init__(self, team, gp_location, season, dataframes, aggregates=None):
         self.team = team.name
         self.gp_location = gp_location
         self.season = season
         self.dfs = dataframes
+        # Optional AggregateStore read instead of the laps table
+        self.aggregates = aggregates
         self.len_train_df = 2
 
         df_races = self.dfs["races"]
@@ -19,12 +21,24 @@ class PitStop:
             raise ValueError(f"Aucune course trouvée pour {self.gp_location} en saison {self.season}.")
         self.race_id = race_row["id"].iloc[0]
         self.avg_min_pit_stop_duration = None
+        self.variability_law = None
+
+    def fit(self):
+        """
+        Compute the best pit stop duration and calibrate the variability law once,
+        so that `calculate_pit_stop_duration` only has to sample.
+        """
+        self.calculate_best_pit_stop_duration()
+        self.variability_law = self.calibrate_pit_stop_variability_law()
 
     def calculate_best_pit_stop_duration(self):
+        seasons_to_train = [self.season - x for x in range(1, self.len_train_df + 1)]
+        if self.aggregates is not None:
+            self.avg_min_pit_stop_duration = self.aggregates.best_pit_stop_duration(self.gp_location, seasons_to_train)
+            return
         df_laps = self.dfs["laps"]
         df_races = self.dfs["races"]
         location = df_races[df_races["id"] == self.race_id]["location"].iloc[0]
-        seasons_to_train = [self.season - x for x in range(1, self.len_train_df + 1)]
         races_to_train = list(df_races[(df_races["location"] == location) & (df_races["season"].isin(seasons_to_train))]["id"])
         min_pit_stop_per_race = (
             df_laps[df_laps["race_id"].isin(races_to_train)]
@@ -35,6 +49,9 @@ class PitStop:
         self.avg_min_pit_stop_duration = min_pit_stop_per_race["pitstopduration"].mean()
 
     def calibrate_pit_stop_variability_law(self):
+        if self.aggregates is not None:
+            durations = self.aggregates.pit_stop_durations(self.team, self.season, self.race_id)
+            return self._fit_variability_law(durations - self.avg_min_pit_stop_duration)
         df_laps = self.dfs["laps"]
         df_starterfields = self.dfs["starterfields"]
         df_races = self.dfs["races"]
@@ -48,10 +65,21 @@ class PitStop:
             (df_merged["pitstopduration"] < 400)  # Exclure les valeurs aberrantes
         ].copy()
         df_filtered["pitstop_diff"] = df_filtered["pitstopduration"] - self.avg_min_pit_stop_duration
-        shape, loc, scale = fisk.fit(df_filtered["pitstop_diff"])
+        return self._fit_variability_law(df_filtered["pitstop_diff"].to_numpy(dtype=float))
+
+    @staticmethod
+    def _fit_variability_law(pitstop_diff):
+        # scipy is only needed to calibrate, not to sample
+        from scipy.stats import fisk
+        shape, loc, scale = fisk.fit(pitstop_diff)
         return [shape, loc, scale]
 
     def calculate_pit_stop_duration(self):
-        shape, loc, scale = self.calibrate_pit_stop_variability_law()
-        variability = fisk.rvs(shape, loc=loc, scale=scale, size=1)[0]
+        if self.variability_law is not None:
+            shape, loc, scale = self.variability_law
+        else:
+            shape, loc, scale = self.calibrate_pit_stop_variability_law()
+        # Inverse CDF of the Fisk (log-logistic) law, as scipy's fisk.rvs does
+        u = np.random.uniform(size=1)[0]
+        variability = loc + scale * (u / (1 - u)) ** (1 / shape)
         return self.avg_min_pit_stop_duration + variability
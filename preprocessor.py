@@ -1,10 +1,13 @@
 import pandas as pd 
 
+from data_loader import compact_dtypes
+
 class DataPreprocessor:
     """
     Applies cleaning:
       - keeps only required columns
       - filters out wet-weather races and wet qualifying sessions from 2014-2019 
+      - stores the remaining tables with compact dtypes
     """
     # Map season -> list of circuit locations to exclude for modelisation
     WET_RACES_BY_YEAR = {
@@ -25,12 +28,14 @@ class DataPreprocessor:
         2018: ["Hockenheim"],
     }
 
-    def __init__(self, required_columns: dict[str, list[str]]) -> None:
+    def __init__(self, required_columns: dict[str, list[str]], compact: bool = True) -> None:
         """
         Args:
             required_columns: map table_name -> columns to retain
+            compact: downcast the cleaned tables (see `data_loader.compact_dtypes`)
         """
         self.required_columns = required_columns
+        self.compact = compact
 
     def preprocess(
         self,
@@ -41,6 +46,7 @@ class DataPreprocessor:
         2. Identify wet-qualifying race IDs based on WET_QUALIFYINGS_BY_YEAR.
         3. Combine both sets and remove those race IDs from every table.
         4. Keep only the required columns per table.
+        5. Downcast dtypes (drops the categories of removed races).
 
         Args:
             data: dict of raw DataFrames from DataLoader.
@@ -66,7 +72,8 @@ class DataPreprocessor:
             if cols:
                 df = df[cols].copy()
 
-            cleaned[table_name] = df.reset_index(drop=True)
+            df = df.reset_index(drop=True)
+            cleaned[table_name] = compact_dtypes(df) if self.compact else df
 
         return cleaned
 
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+qmc_sampling.py
+
+Randomized quasi-Monte Carlo on the array backend. The random inputs of a
+batch of races (pit stop uniforms, retirement and safety car uniforms, lap
+time noise) are the coordinates of the points of one scrambled Sobol
+sequence, mapped through the same inverse CDFs as the kernel uses (Fisk law
+of the pit stops, retirement thresholds, normal quantiles of the noise).
+Low-discrepancy points cover the input space more evenly than independent
+draws, so expected race times and positions converge faster than 1/sqrt(N).
+The lap noises of a driver are an orthogonal rotation of normals whose first
+one is their (scaled) sum: the part of the noise that moves the race time
+takes a single early coordinate instead of one per lap.
+
+Error estimates come from independent replications: each replication
+scrambles the sequence with its own (seed, replication) stream, its mean is
+an unbiased estimate, and the spread of the replication means gives the
+standard error. FCY phases of a safety car model are drawn pseudo-randomly.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lap_kernel import RaceArrays
+
+
+class SobolSampler:
+    """
+    Scrambled Sobol simulation of a race.
+
+    Attributes:
+        arrays (RaceArrays): Race simulated.
+        seed (int | None): Campaign seed of the scrambles.
+    """
+
+    # Uniforms are kept this far from 0 and 1 (normal quantiles stay finite)
+    EPSILON = 1e-12
+
+    def __init__(self, arrays: RaceArrays, seed: int | None = None) -> None:
+        if arrays.test_mode:
+            raise ValueError("Quasi-Monte Carlo needs random events (no test mode).")
+        self.arrays = arrays
+        self.seed = seed
+
+    @property
+    def dimension(self) -> int:
+        """Number of Sobol coordinates of one race."""
+        arrays = self.arrays
+        n_drivers, max_stops = arrays.stop_lap.shape
+        return n_drivers * (max_stops + 4 + 1) + arrays.num_laps * n_drivers
+
+    def draw(self, num_simulations: int, replication: int = 0) -> tuple:
+        """
+        Random inputs of `num_simulations` races from one scrambled Sobol
+        sequence. The first coordinates, where Sobol points are the most
+        uniform, go to the pit stops, the total lap noise of each driver and
+        the retirements, which move race times the most.
+
+        Args:
+            num_simulations: Number of races, a power of 2.
+            replication: Index of the scramble.
+
+        Returns:
+            (noise, u_dnf, u_sc, u_pit, lap_factor) arrays of the kernel.
+        """
+        if num_simulations < 1 or num_simulations & (num_simulations - 1):
+            raise ValueError("Sobol batches must have a power of 2 simulations.")
+        # scipy is slow to import: only load it when sampling
+        from scipy.stats import norm, qmc
+
+        arrays = self.arrays
+        n_drivers, max_stops = arrays.stop_lap.shape
+        rng = np.random.default_rng(None if self.seed is None else [self.seed, replication])
+        points = qmc.Sobol(self.dimension, scramble=True, seed=rng).random(num_simulations)
+        points = np.clip(points, self.EPSILON, 1 - self.EPSILON)
+
+        bounds = np.cumsum([n_drivers * max_stops, n_drivers, n_drivers * 4, n_drivers])
+        u_pit = points[:, :bounds[0]].reshape(num_simulations, n_drivers, max_stops)
+        z = np.empty((num_simulations, arrays.num_laps, n_drivers))
+        z[:, 0] = norm.ppf(points[:, bounds[0]:bounds[1]])
+        u_dnf = points[:, bounds[1]:bounds[2]].reshape(num_simulations, n_drivers, 4)
+        u_sc = np.ascontiguousarray(points[:, bounds[2]:bounds[3]])
+        z[:, 1:] = norm.ppf(points[:, bounds[3]:]).reshape(num_simulations, arrays.num_laps - 1, n_drivers)
+        noise = np.einsum("lk,skd->sld", self._rotation(arrays.num_laps), z)
+        lap_factor = np.ones((num_simulations, arrays.num_laps + 1))
+        if arrays.safety_car_model is not None:
+            phases = arrays.safety_car_model.sample(arrays.gp_location, arrays.num_laps, size=num_simulations, rng=rng)
+            lap_factor = arrays.fcy_factors[phases]
+        return noise, np.ascontiguousarray(u_dnf), u_sc, np.ascontiguousarray(u_pit), lap_factor
+
+    @staticmethod
+    def _rotation(num_laps: int) -> np.ndarray:
+        """
+        Orthogonal (num_laps, num_laps) matrix whose first column is constant:
+        it maps iid normals to iid normals, the first one carrying their sum.
+        """
+        basis = np.column_stack([np.ones(num_laps), np.eye(num_laps)[:, :num_laps - 1]])
+        q, _ = np.linalg.qr(basis)
+        return q * np.sign(q[0, 0])
+
+    def simulate(self, num_simulations: int, replication: int = 0, compiled: bool = True) -> pd.DataFrame:
+        """
+        Simulate the races of one replication.
+
+        Returns:
+            Outcomes as `RaceArrays.simulate`, with simulation identifiers
+            replication * num_simulations + i and a "replication" column.
+        """
+        arrays = self.arrays
+        outputs = arrays._run_kernel(
+            self.draw(num_simulations, replication), arrays.p_accident, arrays.p_failure, arrays.p_sc, compiled
+        )
+        sim_ids = list(range(replication * num_simulations, (replication + 1) * num_simulations))
+        outcomes = arrays._outcomes(sim_ids, *outputs)
+        outcomes["replication"] = replication
+        return outcomes
+
+    def estimate(self, num_simulations: int = 256, replications: int = 8, compiled: bool = True) -> pd.DataFrame:
+        """
+        Expected outcomes of each driver from independent replications.
+
+        Args:
+            num_simulations: Races per replication (a power of 2).
+            replications: Number of scrambles (at least 2 for standard errors).
+            compiled: Run the Numba kernel (False: interpreted kernel).
+
+        Returns:
+            DataFrame indexed by driver_id with "driver_name", the means
+            "position", "race_time" (finishers) and "p_dnf", and their
+            standard errors "<column>_se" across replications.
+        """
+        if replications < 2:
+            raise ValueError("At least 2 replications are needed for standard errors.")
+        means = []
+        for replication in range(replications):
+            outcomes = self.simulate(num_simulations, replication, compiled)
+            finished = outcomes["dnf_lap"].isna()
+            grouped = outcomes.assign(
+                dnf=~finished,
+                race_time=outcomes["cumulative_time"].where(finished),
+            ).groupby("driver_id")
+            means.append(pd.DataFrame({
+                "position": grouped["final_position"].mean(),
+                "race_time": grouped["race_time"].mean(),
+                "p_dnf": grouped["dnf"].mean(),
+            }))
+        stacked = pd.concat(means, keys=range(replications), names=["replication"])
+        by_driver = stacked.groupby("driver_id")
+        result = by_driver.mean()
+        for column in ["position", "race_time", "p_dnf"]:
+            result[f"{column}_se"] = by_driver[column].std(ddof=1) / np.sqrt(replications)
+        names = dict(zip(self.arrays.driver_ids, self.arrays.driver_names))
+        result.insert(0, "driver_name", [names[d] for d in result.index])
+        return result
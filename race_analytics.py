@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+race_analytics.py
+
+Defines the RaceAnalytics class: finishing-position probability matrix,
+win/podium/points probabilities and head-to-head matrices computed from
+Monte Carlo outcomes with vectorized counting, with optional exact
+(Clopper-Pearson) confidence bounds. Outcomes of importance sampling carry a
+per-simulation likelihood ratio "weight": probabilities are then unbiased
+weighted means, with normal bounds and an effective sample size.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def clopper_pearson(successes: np.ndarray, trials: np.ndarray, confidence: float = 0.95):
+    """
+    Exact binomial confidence interval of a proportion.
+
+    Args:
+        successes: Number(s) of successes.
+        trials: Number(s) of trials.
+        confidence: Confidence level of the interval.
+
+    Returns:
+        (lower, upper) arrays of the same shape as `successes`.
+    """
+    # scipy is only needed when bounds are requested
+    from scipy.stats import beta
+
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    alpha = 1.0 - confidence
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lower = np.where(successes > 0, beta.ppf(alpha / 2, successes, trials - successes + 1), 0.0)
+        upper = np.where(successes < trials, beta.ppf(1 - alpha / 2, successes + 1, trials - successes), 1.0)
+    return lower, upper
+
+
+class RaceAnalytics:
+    """
+    Outcome distribution of a Monte Carlo campaign.
+
+    Outcomes are turned once into a (simulations, drivers) array of finishing
+    positions; every statistic is then a bincount or an array comparison.
+    The position and head-to-head matrices are computed on first use and kept.
+
+    Attributes:
+        driver_ids (np.ndarray): Drivers, in the order of the matrices.
+        driver_names (dict[int, str]): driver_id -> name, when available.
+        positions (np.ndarray): (S, D) finishing positions.
+        dnf (np.ndarray): (S, D) True if the driver retired.
+        weights (np.ndarray | None): (S,) likelihood ratios of importance
+            sampling, None for plain Monte Carlo.
+    """
+
+    # Finishing positions scoring points
+    POINTS_POSITIONS = 10
+
+    # Simulations per block of the head-to-head computation: the (D, D, block)
+    # comparison indicators stay within the CPU caches
+    HEAD_TO_HEAD_BLOCK = 1024
+
+    def __init__(self, outcomes: pd.DataFrame) -> None:
+        """
+        Args:
+            outcomes: Outcomes with "simulation_id", "driver_id",
+                "final_position" and optionally "dnf_lap", "driver_name" and
+                "weight" (e.g. `MonteCarloSimulator.final_outcomes`).
+        """
+        if outcomes.empty:
+            raise ValueError("No outcomes to analyze.")
+        driver_index, self.driver_ids = self._factorize_drivers(outcomes["driver_id"].to_numpy())
+        n_drivers = len(self.driver_ids)
+        sim_index, n_sims = self._factorize_simulations(outcomes["simulation_id"].to_numpy(), n_drivers)
+        if len(outcomes) != n_sims * n_drivers:
+            raise ValueError("Every simulation must have one outcome per driver.")
+
+        # int8 positions make the pairwise comparisons of `head_to_head` cheaper
+        dtype = np.int8 if n_drivers < np.iinfo(np.int8).max else np.int16
+        # Flat (simulation, driver) cell of every row, shared by the scatters
+        cells = sim_index * n_drivers + driver_index
+        self.positions = np.zeros((n_sims, n_drivers), dtype=dtype)
+        self.positions.reshape(-1)[cells] = outcomes["final_position"].to_numpy()
+        self.dnf = np.zeros((n_sims, n_drivers), dtype=bool)
+        if "dnf_lap" in outcomes:
+            self.dnf.reshape(-1)[cells] = outcomes["dnf_lap"].notna().to_numpy()
+        self.weights = None
+        if "weight" in outcomes:
+            self.weights = np.zeros(n_sims)
+            self.weights[sim_index] = outcomes["weight"].to_numpy(dtype=float)
+        # One contiguous row per driver: per-driver counts and pairwise
+        # comparisons become 1-D passes that NumPy vectorizes well
+        self._by_driver = np.ascontiguousarray(self.positions.T)
+        # Derived matrices, keyed by whether they are weighted
+        self._position_sums_cache = {}
+        self._ahead_sums_cache = {}
+        self.driver_names = {}
+        if "driver_name" in outcomes:
+            # Every driver has a row in the first simulation
+            first = sim_index == 0
+            self.driver_names = dict(zip(
+                outcomes["driver_id"].to_numpy()[first], outcomes["driver_name"].to_numpy()[first]
+            ))
+
+    @staticmethod
+    def _factorize_drivers(driver_ids: np.ndarray) -> tuple:
+        """
+        Returns:
+            (row -> driver index, sorted driver ids). Integer ids are counted
+            with a bincount rather than hashed.
+        """
+        if np.issubdtype(driver_ids.dtype, np.integer):
+            low = driver_ids.min()
+            offsets = driver_ids - low
+            present = np.bincount(offsets) > 0
+            if len(present) <= 1 << 16:
+                lookup = np.cumsum(present) - 1
+                return lookup[offsets], np.flatnonzero(present) + low
+        # Hash-based factorization: O(n), unlike a sort of the whole column
+        codes, uniques = pd.factorize(driver_ids, sort=True)
+        return codes, np.asarray(uniques)
+
+    @staticmethod
+    def _factorize_simulations(sim_ids: np.ndarray, n_drivers: int) -> tuple:
+        """
+        Returns:
+            (row -> simulation index, number of simulations). Outcomes laid
+            out as one block of `n_drivers` rows per simulation, in increasing
+            simulation_id order (e.g. `final_outcomes`), need no hashing.
+        """
+        if len(sim_ids) % n_drivers == 0:
+            blocks = sim_ids.reshape(-1, n_drivers)
+            if (blocks == blocks[:, :1]).all() and (np.diff(blocks[:, 0]) > 0).all():
+                return np.repeat(np.arange(len(blocks)), n_drivers), len(blocks)
+        codes, uniques = pd.factorize(sim_ids)
+        return codes, len(uniques)
+
+    @property
+    def num_simulations(self) -> int:
+        return self.positions.shape[0]
+
+    @property
+    def effective_sample_size(self) -> float:
+        """Kish effective sample size of the weights (num_simulations without weights)."""
+        if self.weights is None:
+            return float(self.num_simulations)
+        return float(self.weights.sum() ** 2 / (self.weights ** 2).sum())
+
+    def _frequency(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Probability of the event `mask` (simulations on the last axis): share
+        of simulations, or unbiased weighted mean with importance weights.
+        """
+        if self.weights is None:
+            return np.count_nonzero(mask, axis=-1) / self.num_simulations
+        return (mask @ self.weights) / self.num_simulations
+
+    def _standard_error(self, mask: np.ndarray) -> np.ndarray:
+        """Standard error of the weighted `_frequency` of `mask`."""
+        p = self._frequency(mask)
+        second = (mask @ self.weights ** 2) / self.num_simulations
+        return np.sqrt(np.maximum(second - p ** 2, 0.0) / self.num_simulations)
+
+    def _position_sums(self, weighted: bool) -> np.ndarray:
+        """
+        (D, D) number of simulations (sum of their importance weights if
+        `weighted`) in which driver i finished in position k+1.
+        """
+        if weighted not in self._position_sums_cache:
+            n_drivers = len(self.driver_ids)
+            weights = self.weights if weighted else None
+            self._position_sums_cache[weighted] = np.stack([
+                np.bincount(row, weights=weights, minlength=n_drivers + 1)[1:n_drivers + 1]
+                for row in self._by_driver
+            ])
+        return self._position_sums_cache[weighted]
+
+    def _ahead_sums(self, weighted: bool) -> np.ndarray:
+        """
+        (D, D) number of simulations (sum of their importance weights if
+        `weighted`) in which driver i finished ahead of driver j. Each block
+        of simulations is reduced by a single matmul of its (D * D, block)
+        comparison indicators with its weights.
+        """
+        if weighted not in self._ahead_sums_cache:
+            n_sims, n_drivers = self.positions.shape
+            # Sums of ones are exact in float32 within a block
+            weights = self.weights if weighted else np.ones(n_sims, dtype=np.float32)
+            ahead = np.zeros(n_drivers * n_drivers)
+            for start in range(0, n_sims, self.HEAD_TO_HEAD_BLOCK):
+                block = self._by_driver[:, start:start + self.HEAD_TO_HEAD_BLOCK]
+                indicators = (block[:, None, :] < block[None, :, :]).astype(weights.dtype)
+                ahead += indicators.reshape(n_drivers * n_drivers, -1) @ weights[start:start + block.shape[1]]
+            self._ahead_sums_cache[weighted] = ahead.reshape(n_drivers, n_drivers)
+        return self._ahead_sums_cache[weighted]
+
+    def position_counts(self) -> np.ndarray:
+        """
+        Returns:
+            (D, D) array: number of simulations driver i finished in position k+1.
+        """
+        return self._position_sums(weighted=False).astype(np.int64)
+
+    def position_matrix(self) -> pd.DataFrame:
+        """
+        Returns:
+            DataFrame driver_id x position (1..D) of finishing probabilities.
+        """
+        return pd.DataFrame(
+            self._position_sums(weighted=self.weights is not None) / self.num_simulations,
+            index=pd.Index(self.driver_ids, name="driver_id"),
+            columns=pd.RangeIndex(1, len(self.driver_ids) + 1, name="position"),
+        )
+
+    def finish_probabilities(self, confidence: float | None = None) -> pd.DataFrame:
+        """
+        P(win), P(podium), P(points) (classified finish in the top
+        POINTS_POSITIONS) and P(dnf) per driver.
+
+        Args:
+            confidence: If set, add "<column>_low"/"<column>_high" bounds:
+                exact without weights, normal with importance weights.
+
+        Returns:
+            DataFrame indexed by driver_id.
+        """
+        positions = self._by_driver
+        finished = ~np.ascontiguousarray(self.dnf.T)
+        events = {
+            "p_win": (positions == 1) & finished,
+            "p_podium": (positions <= 3) & finished,
+            "p_points": (positions <= self.POINTS_POSITIONS) & finished,
+            "p_dnf": ~finished,
+        }
+        df = pd.DataFrame(
+            {name: self._frequency(mask) for name, mask in events.items()},
+            index=pd.Index(self.driver_ids, name="driver_id"),
+        )
+        if confidence is not None:
+            if self.weights is None:
+                for name, mask in events.items():
+                    c = np.count_nonzero(mask, axis=1)
+                    df[f"{name}_low"], df[f"{name}_high"] = clopper_pearson(c, self.num_simulations, confidence)
+            else:
+                # scipy is only needed when bounds are requested
+                from scipy.stats import norm
+
+                z = norm.ppf(0.5 + confidence / 2)
+                for name, mask in events.items():
+                    half_width = z * self._standard_error(mask)
+                    df[f"{name}_low"] = np.clip(df[name] - half_width, 0.0, 1.0)
+                    df[f"{name}_high"] = np.clip(df[name] + half_width, 0.0, 1.0)
+        if self.driver_names:
+            df.insert(0, "driver_name", [self.driver_names.get(d) for d in self.driver_ids])
+        return df
+
+    def head_to_head_counts(self) -> np.ndarray:
+        """
+        Returns:
+            (D, D) array: number of simulations driver i finished ahead of driver j.
+        """
+        return np.rint(self._ahead_sums(weighted=False)).astype(np.int64)
+
+    def head_to_head(self, confidence: float | None = None):
+        """
+        Pairwise probabilities of finishing ahead.
+
+        Args:
+            confidence: If set, also return exact lower and upper bounds.
+
+        Returns:
+            DataFrame driver_id x driver_id of P(row driver ahead of column
+            driver), or a (probabilities, lower, upper) tuple of DataFrames.
+        """
+        index = pd.Index(self.driver_ids, name="driver_id")
+        columns = pd.Index(self.driver_ids, name="rival_id")
+        if self.weights is not None:
+            if confidence is not None:
+                raise ValueError("Head-to-head bounds are not available for weighted outcomes.")
+            return pd.DataFrame(self._ahead_sums(weighted=True) / self.num_simulations, index=index, columns=columns)
+        counts = self.head_to_head_counts()
+        probabilities = pd.DataFrame(counts / self.num_simulations, index=index, columns=columns)
+        if confidence is None:
+            return probabilities
+        lower, upper = clopper_pearson(counts, self.num_simulations, confidence)
+        return (
+            probabilities,
+            pd.DataFrame(lower, index=index, columns=columns),
+            pd.DataFrame(upper, index=index, columns=columns),
+        )
+
+    def p_ahead(self, driver_id: int, rival_id: int) -> float:
+        """
+        Returns:
+            Probability that `driver_id` finishes ahead of `rival_id`.
+        """
+        i = self._index(driver_id)
+        j = self._index(rival_id)
+        return float(self._frequency(self._by_driver[i] < self._by_driver[j]))
+
+    def _index(self, driver_id: int) -> int:
+        i = np.searchsorted(self.driver_ids, driver_id)
+        if i == len(self.driver_ids) or self.driver_ids[i] != driver_id:
+            raise ValueError(f"Driver {driver_id} not in the outcomes.")
+        return int(i)
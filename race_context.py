@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+race_context.py
+
+Defines the RaceContext class, which holds everything about a Grand Prix that
+can be fitted once and reused by many simulations: race parameters, starting
+grid, fitted drivers (DNF and fuel & tire models) and fitted pit stop models.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+from driver import Driver
+from fuel_and_tire_model import FuelAndTireModel
+from pit_stop import PitStop
+
+
+class RaceContext:
+    """
+    Fitted, reusable state for a single Grand Prix.
+
+    Building a `Driver` fits its DNF and fuel & tire models, and building a
+    `PitStop` calibrates its variability law. A RaceContext does this work
+    once; every `Run` created from it only copies the drivers and resets
+    their race state.
+
+    Attributes:
+        season (int): Racing season year.
+        gp_location (str): Grand Prix location name.
+        race_id (int): Identifier of the race in the database.
+        number_of_laps (int): Total laps planned for the race.
+        starting_grid (list[tuple[int, int]]): (driver_id, grid_position) pairs.
+        drivers_list (list[Driver]): Fitted drivers, in starting grid order.
+        pit_stops (dict[str, PitStop]): Fitted pit stop models keyed by team name.
+    """
+
+    def __init__(
+        self,
+        season: int,
+        gp_location: str,
+        dataframes: dict,
+        driver_strategies: dict = None,
+        starting_grid: list[tuple[int, int]] | None = None,
+        aggregates=None,
+    ) -> None:
+        """
+        Args:
+            season: The season year.
+            gp_location: Track name.
+            dataframes: Preprocessed tables (races, laps, etc.).
+            driver_strategies: Default dict mapping driver names to pit strategies.
+            starting_grid: Optional list of (driver_id, grid_position).
+            aggregates: Optional AggregateStore the models read their
+                pit stop, race count, retirement and qualifying aggregates from.
+        """
+        self.season = season
+        self.gp_location = gp_location
+        self.dataframes = dataframes
+        self.driver_strategies = driver_strategies or {}
+        self.aggregates = aggregates
+
+        self.race_id: int = None
+        self.number_of_laps: int = 0
+        self._get_race_parameters()
+
+        if starting_grid is not None:
+            self.starting_grid = starting_grid
+        else:
+            self.starting_grid = self._build_starting_grid()
+
+        self.drivers_list: list[Driver] = []
+        self.pit_stops: dict[str, PitStop] = {}
+        self.is_fitted = False
+
+    def fit(self) -> "RaceContext":
+        """
+        Instantiate (and thereby fit) every driver of the starting grid, the
+        fuel & tire models being fitted together beforehand.
+        Pit stop models are fitted lazily, the first time a team pits.
+
+        Returns:
+            The fitted context itself, to allow chaining.
+        """
+        if self.is_fitted:
+            return self
+        # Fit every driver's fuel & tire model in one batch; each Driver then
+        # finds its model in the FuelAndTireModel cache
+        FuelAndTireModel.fit_batch(
+            season=self.season,
+            race_id=self.race_id,
+            driver_ids=[driver_id for driver_id, _ in self.starting_grid],
+            dataframes=self.dataframes,
+            aggregates=self.aggregates,
+        )
+        self._initialize_drivers()
+        self.is_fitted = True
+        return self
+
+    def fit_pit_stops(self) -> None:
+        """
+        Fit the pit stop models of every team of the grid upfront, e.g. before
+        the context is shipped to worker processes. Teams whose model cannot be
+        fitted are left to be retried (and reported) when they pit.
+        """
+        self.fit()
+        for driver in self.drivers_list:
+            if driver.team is None:
+                continue
+            try:
+                self.get_pit_stop(driver.team)
+            except (ValueError, RuntimeError):
+                continue
+
+    def spawn_drivers(self, driver_strategies: dict = None) -> list[Driver]:
+        """
+        Return fresh copies of the fitted drivers, ready for a new race.
+
+        The copies share the fitted models of the context but own their race
+        state (cumulative time, tire age, fuel, DNF lap, etc.).
+
+        Args:
+            driver_strategies: Strategies to assign, by driver name. Drivers
+                missing from this dict keep the context default strategy.
+
+        Returns:
+            List of Driver instances in starting grid order.
+        """
+        self.fit()
+        strategies = driver_strategies or {}
+        drivers = []
+        for fitted in self.drivers_list:
+            drv = copy.copy(fitted)
+            strategy = strategies.get(drv.name, self.driver_strategies.get(drv.name, {}))
+            drv.reset_race_state(strategy)
+            drivers.append(drv)
+        return drivers
+
+    def get_pit_stop(self, team) -> PitStop:
+        """
+        Return the fitted pit stop model of `team`, fitting it on first use.
+
+        Args:
+            team (Team): Team of the driver pitting.
+
+        Returns:
+            PitStop: Fitted pit stop model.
+        """
+        if team.name not in self.pit_stops:
+            pit_stop = PitStop(
+                team=team,
+                gp_location=self.gp_location,
+                season=self.season,
+                dataframes=self.dataframes,
+                aggregates=self.aggregates,
+            )
+            pit_stop.fit()
+            self.pit_stops[team.name] = pit_stop
+        return self.pit_stops[team.name]
+
+    def _get_race_parameters(self) -> None:
+        """
+        Load race_id and number_of_laps from the races table.
+        """
+        races = self.dataframes["races"]
+        race = races[
+            (races["season"] == self.season)
+            & (races["location"] == self.gp_location)
+        ]
+        if race.empty:
+            raise ValueError(
+                f"No race for {self.gp_location}, season {self.season}."
+            )
+        self.race_id = race["id"].iloc[0]
+        self.number_of_laps = race["nolapsplanned"].iloc[0]
+
+    def _build_starting_grid(self) -> list[tuple[int, int]]:
+        """
+        Construct the starting grid by combining qualifying order and any missing drivers.
+        Missing drivers are ordered alphabetically by name.
+
+        Returns:
+            List of (driver_id, grid_position).
+        """
+        quals = self.dataframes["qualifyings"]
+        sf = self.dataframes["starterfields"]
+        drivers_df = self.dataframes["drivers"]
+
+        # 1) Main grid from qualifying
+        qual_grid = (
+            quals[quals["race_id"] == self.race_id]
+            .sort_values("position")
+            .loc[:, ["driver_id", "position"]]
+        )
+        max_pos = int(qual_grid["position"].max()) if not qual_grid.empty else 0
+
+        # 2) Detect missing drivers
+        entered = set(
+            sf[sf["race_id"] == self.race_id]["driver_id"].unique()
+        )
+        missing = entered - set(qual_grid["driver_id"])
+
+        if missing:
+            # Order missing by driver name
+            missing_df = (
+                drivers_df[drivers_df["id"].isin(missing)]
+                .loc[:, ["id", "name"]]
+                .sort_values("name")
+            )
+            extra = pd.DataFrame({
+                "driver_id": missing_df["id"].values,
+                "position": max_pos + np.arange(1, len(missing_df) + 1)
+            })
+            qual_grid = pd.concat([qual_grid, extra], ignore_index=True)
+
+        # Return as list of tuples
+        return list(zip(qual_grid["driver_id"], qual_grid["position"]))
+
+    def _initialize_drivers(self) -> None:
+        """Instantiate Driver objects based on starting grid and strategies."""
+        drivers_df = self.dataframes["drivers"]
+        for driver_id, _ in self.starting_grid:
+            row = drivers_df[drivers_df["id"] == driver_id]
+            if row.empty:
+                continue
+            name = row["name"].iloc[0]
+            strat = self.driver_strategies.get(name, {})
+            drv = Driver(
+                season=self.season,
+                race_id=self.race_id,
+                dataframes=self.dataframes,
+                name=name,
+                strategy=strat,
+                aggregates=self.aggregates,
+            )
+            self.drivers_list.append(drv)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+race_snapshot.py
+
+Defines the RaceSnapshot class: the state of a race at the end of a given lap,
+from which the remaining laps can be re-simulated (see `Run.from_snapshot`).
+"""
+
+import copy
+
+
+def _to_builtin(value):
+    """Convert numpy scalars to the equivalent Python builtin."""
+    return value.item() if hasattr(value, "item") else value
+
+
+class RaceSnapshot:
+    """
+    Frozen race state at the end of lap `lap`.
+
+    Only what the remaining laps depend on is stored: per-driver race state and
+    the safety car or virtual safety car phase still running at `lap`. Future
+    DNFs and phases are deliberately not stored, so that continuations draw
+    them again.
+
+    Attributes:
+        season (int): Racing season year.
+        gp_location (str): Grand Prix location name.
+        lap (int): Last completed lap.
+        drivers (dict[int, dict]): driver_id -> {field: value} for DRIVER_FIELDS.
+        safety_car_laps (list[int]): Laps after `lap` still under safety car.
+        vsc_laps (list[int]): Laps after `lap` still under virtual safety car.
+    """
+
+    # Driver attributes captured in a snapshot
+    DRIVER_FIELDS = (
+        "cumulative_lap_time",
+        "tire_age",
+        "compound",
+        "fuelc",
+        "next_pit_stop",
+        "alive",
+        "earliest_dnf_lap",
+        "position",
+    )
+
+    def __init__(
+        self,
+        season: int,
+        gp_location: str,
+        lap: int,
+        drivers: dict[int, dict],
+        safety_car_laps: list[int] | None = None,
+        vsc_laps: list[int] | None = None,
+    ) -> None:
+        """
+        Args:
+            season: The season year.
+            gp_location: Track name.
+            lap: Last completed lap (0 means before the start).
+            drivers: driver_id -> state dict with the keys of DRIVER_FIELDS.
+            safety_car_laps: Laps after `lap` still under safety car.
+            vsc_laps: Laps after `lap` still under virtual safety car.
+        """
+        missing = [
+            (driver_id, field)
+            for driver_id, state in drivers.items()
+            for field in self.DRIVER_FIELDS
+            if field not in state
+        ]
+        if missing:
+            raise ValueError(f"Incomplete driver state in snapshot: {missing}.")
+        self.season = season
+        self.gp_location = gp_location
+        self.lap = lap
+        self.drivers = drivers
+        self.safety_car_laps = sorted(safety_car_laps or [])
+        self.vsc_laps = sorted(vsc_laps or [])
+
+    @classmethod
+    def capture(
+        cls,
+        season: int,
+        gp_location: str,
+        lap: int,
+        drivers: list,
+        safety_car_laps: list[int],
+        vsc_laps: list[int] | None = None,
+    ) -> "RaceSnapshot":
+        """
+        Build a snapshot from live Driver objects.
+
+        Args:
+            season: The season year.
+            gp_location: Track name.
+            lap: Last completed lap.
+            drivers: Driver instances of the race.
+            safety_car_laps: All laps the race planned under safety car.
+            vsc_laps: All laps the race planned under virtual safety car.
+
+        Returns:
+            RaceSnapshot of the current state.
+        """
+        states = {
+            int(d.driver_id): {field: getattr(d, field) for field in cls.DRIVER_FIELDS}
+            for d in drivers
+        }
+        return cls(
+            season, gp_location, lap, states,
+            cls._ongoing(lap, safety_car_laps), cls._ongoing(lap, vsc_laps or []),
+        )
+
+    @staticmethod
+    def _ongoing(lap: int, planned_laps: list[int]) -> list[int]:
+        """
+        Return the laps after `lap` of the phase in `planned_laps` still
+        running at `lap` (empty if `lap` is not in a phase).
+        """
+        planned = set(planned_laps)
+        ongoing = []
+        next_lap = lap + 1
+        while lap in planned and next_lap in planned:
+            ongoing.append(next_lap)
+            next_lap += 1
+        return ongoing
+
+    def restore(self, drivers: list, overridden: set[str] | None = None) -> None:
+        """
+        Write the snapshot state onto fresh Driver copies.
+
+        Drivers whose strategy was replaced (names in `overridden`) resume from
+        the first stop of their new strategy planned after `lap`.
+
+        Args:
+            drivers: Driver instances, typically from `RaceContext.spawn_drivers`.
+            overridden: Names of drivers with a new strategy.
+        """
+        overridden = overridden or set()
+        for d in drivers:
+            state = self.drivers.get(int(d.driver_id))
+            if state is None:
+                raise ValueError(f"Driver {d.name} missing from the snapshot.")
+            for field, value in state.items():
+                setattr(d, field, value)
+            if d.name in overridden:
+                d.next_pit_stop = self._first_pending_stop(d.pit_stops_info)
+
+    def _first_pending_stop(self, strategy: dict) -> int:
+        """
+        Return the index of the first stop of `strategy` planned after `lap`.
+        """
+        stops = sorted(k for k in strategy if isinstance(k, int))
+        for k in stops:
+            stop = strategy[k]
+            last_window_lap = stop["pitstop_interval"][1] - 1
+            if stop["pit_stop_lap"] > self.lap or last_window_lap > self.lap:
+                return k
+        return (stops[-1] + 1) if stops else 1
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            Plain dict (JSON compatible) describing the snapshot.
+        """
+        return {
+            "season": self.season,
+            "gp_location": self.gp_location,
+            "lap": self.lap,
+            "drivers": {
+                str(k): {field: _to_builtin(value) for field, value in v.items()}
+                for k, v in self.drivers.items()
+            },
+            "safety_car_laps": list(self.safety_car_laps),
+            "vsc_laps": list(self.vsc_laps),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RaceSnapshot":
+        """
+        Rebuild a snapshot from `to_dict` output.
+        """
+        return cls(
+            season=data["season"],
+            gp_location=data["gp_location"],
+            lap=data["lap"],
+            drivers={int(k): dict(v) for k, v in data["drivers"].items()},
+            safety_car_laps=data.get("safety_car_laps", []),
+            vsc_laps=data.get("vsc_laps", []),
+        )
+
+    def copy(self) -> "RaceSnapshot":
+        """Return an independent copy, e.g. to edit a what-if state."""
+        return copy.deepcopy(self)
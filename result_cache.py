@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+result_cache.py
+
+Content-addressed on-disk cache of simulation outcomes. Entries are keyed by a
+hash of everything that determines the outcomes (configuration, seed, database
+fingerprint, model sources) and evicted least-recently-used beyond a size limit.
+"""
+
+import functools
+import hashlib
+import importlib.util
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+
+def database_fingerprint(db_path: str, sample_bytes: int = 1 << 20) -> str:
+    """
+    Cheap fingerprint of a database file: size, modification time and a hash
+    of its first and last `sample_bytes` bytes.
+
+    Args:
+        db_path: Path of the SQLite database.
+        sample_bytes: Number of bytes hashed at each end of the file.
+
+    Returns:
+        Hex digest identifying the file content.
+    """
+    stat = os.stat(db_path)
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    with open(db_path, "rb") as f:
+        digest.update(f.read(sample_bytes))
+        if stat.st_size > sample_bytes:
+            f.seek(max(stat.st_size - sample_bytes, sample_bytes))
+            digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def source_fingerprint(modules: tuple) -> str:
+    """
+    Hash of the source files of `modules`, so that any change to the code of
+    the models changes the keys of the outcomes they simulate.
+
+    Args:
+        modules: Names of importable modules.
+
+    Returns:
+        Hex digest of their sources.
+    """
+    digest = hashlib.sha256()
+    for name in modules:
+        with open(importlib.util.find_spec(name).origin, "rb") as f:
+            digest.update(name.encode("utf-8") + b"\0" + f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Directory of pickled outcome DataFrames, one file per key.
+
+    Every entry holds the outcomes of simulations 0..n-1 of its configuration
+    (with a `simulation_id` column), so a request for more simulations can
+    reuse the cached prefix and only compute the missing ones.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30) -> None:
+        """
+        Args:
+            directory: Cache directory (created if needed).
+            max_bytes: Total size above which least recently used entries are evicted.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        """
+        Args:
+            key: Entry key.
+
+        Returns:
+            Cached outcomes, or None on a miss (a corrupt entry is deleted
+            and counts as a miss).
+        """
+        path = self._path(key)
+        try:
+            outcomes = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError, ValueError, AttributeError, ImportError, IndexError):
+            # Truncated or corrupt entry: drop it and count a miss
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        # Mark as recently used for the LRU eviction
+        os.utime(path)
+        return outcomes
+
+    def put(self, key: str, outcomes: pd.DataFrame) -> None:
+        """
+        Store `outcomes` under `key` (atomically) and evict old entries if needed.
+
+        Args:
+            key: Entry key.
+            outcomes: Outcomes of simulations 0..n-1, with `simulation_id`.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            outcomes.to_pickle(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def size_bytes(self) -> int:
+        """Returns the total size of the cached entries."""
+        return sum(
+            os.path.getsize(os.path.join(self.directory, n))
+            for n in os.listdir(self.directory) if n.endswith(".pkl")
+        )
+
+    def clear(self) -> None:
+        """Delete every entry."""
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(self.directory, name))
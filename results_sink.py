@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+results_sink.py
+
+Append-only columnar storage of simulation results. Outcomes (and, optionally,
+lap traces) are buffered, then appended to one raw binary file per column and
+per driver, with a JSON manifest holding the dtypes and committed row counts.
+Reads are memory-mapped: one driver's column of a million-simulation campaign
+is a single file, read without touching the others.
+
+Layout:
+    <directory>/manifest.json
+    <directory>/outcomes/driver_<id>/<column>.bin
+    <directory>/laps/driver_<id>/<column>.bin
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+
+# Column dtypes of each table (little-endian, fixed width)
+OUTCOME_COLUMNS = {
+    "simulation_id": "<i4",
+    "final_position": "<i2",
+    "cumulative_time": "<f8",
+    "dnf_lap": "<f4",  # NaN for finishers
+}
+TRACE_COLUMNS = {
+    "simulation_id": "<i4",
+    "lap": "<i2",
+    "position": "<i2",  # 0 on the lap a car retires
+    "lap_time": "<f8",
+    "cumulative_lap_time": "<f8",
+    "status": "<i1",  # index in STATUS_LABELS
+}
+TABLES = {"outcomes": OUTCOME_COLUMNS, "laps": TRACE_COLUMNS}
+STATUS_LABELS = ["running", "DNF"]
+
+
+def _column_path(directory: str, table: str, driver_id: int, column: str) -> str:
+    return os.path.join(directory, table, f"driver_{driver_id}", f"{column}.bin")
+
+
+def _load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"tables": {table: {} for table in TABLES}, "status_labels": STATUS_LABELS}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ResultsWriter:
+    """
+    Buffered, append-only writer of per-simulation outcomes and lap traces.
+
+    Row counts are only committed to the manifest after the column files were
+    appended, so bytes written by an interrupted flush are ignored (and
+    truncated when the directory is reopened).
+    """
+
+    def __init__(self, directory: str, traces: bool = False, buffer_rows: int = 100_000) -> None:
+        """
+        Args:
+            directory: Results directory (created if needed, appended to if it exists).
+            traces: Also store the lap traces (`Run.laps_summary`).
+            buffer_rows: Buffered rows above which the buffers are flushed.
+        """
+        self.directory = directory
+        self.traces = traces
+        self.buffer_rows = buffer_rows
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = _load_manifest(directory)
+        self._buffers: dict[str, list[pd.DataFrame]] = {table: [] for table in TABLES}
+        self._buffered = 0
+        self._truncate_uncommitted()
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, simulation_id: int, outcomes: pd.DataFrame, laps_summary: pd.DataFrame | None = None) -> None:
+        """
+        Buffer the results of one simulation.
+
+        Args:
+            simulation_id: Identifier of the simulation.
+            outcomes: `Run.outcomes`.
+            laps_summary: `Run.laps_summary`, stored if the writer keeps traces.
+        """
+        if laps_summary is not None:
+            laps_summary = laps_summary.assign(simulation_id=simulation_id)
+        self.write_outcomes(outcomes.assign(simulation_id=simulation_id), laps_summary)
+
+    def write_outcomes(self, outcomes: pd.DataFrame, laps_summary: pd.DataFrame | None = None) -> None:
+        """
+        Buffer the results of one or more simulations whose frames already
+        have a `simulation_id` column (e.g. a batch of the numba engine).
+
+        Args:
+            outcomes: Outcomes with `simulation_id`.
+            laps_summary: Lap traces with `simulation_id`, stored if the
+                writer keeps traces.
+        """
+        self._buffer("outcomes", outcomes)
+        if self.traces and laps_summary is not None:
+            status = pd.Categorical(laps_summary["status"], categories=STATUS_LABELS).codes
+            self._buffer("laps", laps_summary.assign(status=status))
+        if self._buffered >= self.buffer_rows:
+            self.flush()
+
+    def _buffer(self, table: str, df: pd.DataFrame) -> None:
+        self._buffers[table].append(df)
+        self._buffered += len(df)
+
+    def flush(self) -> None:
+        """Append the buffered rows to the column files and commit their counts."""
+        if not self._buffered:
+            return
+        for table, columns in TABLES.items():
+            if not self._buffers[table]:
+                continue
+            counts = self.manifest["tables"][table]
+            buffered = pd.concat(self._buffers[table], ignore_index=True)
+            for driver_id, rows in buffered.groupby("driver_id", sort=False):
+                driver_id = int(driver_id)
+                os.makedirs(os.path.dirname(_column_path(self.directory, table, driver_id, "x")), exist_ok=True)
+                for column, dtype in columns.items():
+                    values = pd.to_numeric(rows[column], errors="coerce")
+                    if np.dtype(dtype).kind == "i":
+                        values = values.fillna(0)
+                    values = values.to_numpy(dtype=dtype)
+                    with open(_column_path(self.directory, table, driver_id, column), "ab") as f:
+                        f.write(values.tobytes())
+                counts[str(driver_id)] = counts.get(str(driver_id), 0) + len(rows)
+            self._buffers[table] = []
+        self._buffered = 0
+        self._save_manifest()
+
+    def close(self) -> None:
+        """Flush the remaining buffered rows."""
+        self.flush()
+
+    def _save_manifest(self) -> None:
+        path = os.path.join(self.directory, MANIFEST)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, path)
+
+    def _truncate_uncommitted(self) -> None:
+        """Drop bytes appended after the last committed flush (interrupted writes)."""
+        for table, columns in TABLES.items():
+            for driver_id, rows in self.manifest["tables"][table].items():
+                for column, dtype in columns.items():
+                    path = _column_path(self.directory, table, int(driver_id), column)
+                    size = rows * np.dtype(dtype).itemsize
+                    if os.path.exists(path) and os.path.getsize(path) > size:
+                        os.truncate(path, size)
+
+
+class ResultsReader:
+    """
+    Memory-mapped reader of a directory written by ResultsWriter.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Args:
+            directory: Results directory.
+        """
+        self.directory = directory
+        self.manifest = _load_manifest(directory)
+
+    def drivers(self, table: str = "outcomes") -> list[int]:
+        """Returns the driver ids stored in `table`."""
+        return sorted(int(d) for d in self.manifest["tables"][table])
+
+    def num_rows(self, driver_id: int, table: str = "outcomes") -> int:
+        """Returns the committed number of rows of `driver_id` in `table`."""
+        return self.manifest["tables"][table].get(str(driver_id), 0)
+
+    def column(self, driver_id: int, column: str, table: str = "outcomes") -> np.ndarray:
+        """
+        Args:
+            driver_id: Driver whose values are read.
+            column: Column name (see OUTCOME_COLUMNS and TRACE_COLUMNS).
+            table: "outcomes" or "laps".
+
+        Returns:
+            Read-only memory-mapped array of the column (nothing is read until used).
+        """
+        dtype = np.dtype(TABLES[table][column])
+        rows = self.num_rows(driver_id, table)
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            _column_path(self.directory, table, driver_id, column), dtype=dtype, mode="r", shape=(rows,)
+        )
+
+    def read(self, table: str = "outcomes", driver_ids=None, columns=None) -> pd.DataFrame:
+        """
+        Load some drivers and columns of `table` into a DataFrame.
+
+        Args:
+            table: "outcomes" or "laps".
+            driver_ids: Drivers to load (default: all).
+            columns: Columns to load (default: all).
+
+        Returns:
+            DataFrame with a "driver_id" column and the requested columns.
+        """
+        columns = list(TABLES[table]) if columns is None else list(columns)
+        frames = []
+        for driver_id in (self.drivers(table) if driver_ids is None else driver_ids):
+            data = {column: np.array(self.column(driver_id, column, table)) for column in columns}
+            frame = pd.DataFrame(data)
+            frame.insert(0, "driver_id", driver_id)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=["driver_id"] + columns)
+        df = pd.concat(frames, ignore_index=True)
+        if "status" in df.columns:
+            df["status"] = pd.Categorical.from_codes(df["status"], categories=self.manifest["status_labels"])
+        return df
@@ -1,11 +1,13 @@
 import numpy as np
 import pandas as pd
-from pit_stop import PitStop
-from driver import Driver
 import logging
 
 from pit_stop import PitStop
 from driver import Driver
+from race_context import RaceContext
+from race_snapshot import RaceSnapshot
+from safety_car_model import SafetyCarModel, SC, VSC
+from traffic_model import TrafficModel
 
 
 class Run:
@@ -17,14 +19,33 @@ class Run:
         season (int): Racing season year.
         gp_location (str): Grand Prix location name.
         test_mode (bool): If True, injects deterministic DNF and safety car events.
+        parameters (dict): Simulation constants, DEFAULT_PARAMETERS updated with overrides.
+        context (RaceContext): Fitted race context the drivers are copied from.
+        traffic_model (TrafficModel | None): Optional traffic/overtaking model.
+        safety_car_model (SafetyCarModel | None): Optional empirical FCY model.
         race_id (int): Identifier of the race in the database.
         number_of_laps (int): Total laps planned for the race.
         safety_car_laps (list[int]): Laps under safety car conditions.
+        vsc_laps (list[int]): Laps under virtual safety car conditions.
+        current_lap (int): Last simulated lap (0 before the start).
         drivers_list (list[Driver]): List of Driver instances participating.
         laps_summary (pd.DataFrame): Detailed lap-by-lap summary DataFrame.
         outcomes (pd.DataFrame): Final classification of drivers.
     """
 
+    # Tunable constants of the simulation. Any of them can be overridden through
+    # the `parameters` argument (e.g. for sensitivity analysis).
+    DEFAULT_PARAMETERS = {
+        "t_per_grid_pos": 0.25,    # Time penalty per grid position (s), Phillips' model
+        "p_sc": 0.2,               # Probability that a DNF triggers a safety car
+        "sc_dur": 5,               # Duration of a safety car phase (laps)
+        "sc_factor": 1.2,          # Lap time multiplier under safety car
+        "vsc_factor": 1.3,         # Lap time multiplier under virtual safety car
+        "tire_deg_scale": 1.0,     # Multiplier on the fitted tire degradation slopes
+        "pit_loss_offset": 0.0,    # Seconds added to every pit stop
+        "variability_scale": 1.0,  # Multiplier on each driver's lap time std
+    }
+
     def __init__(
         self,
         season: int,
@@ -33,6 +54,10 @@ class Run:
         driver_strategies: dict = None,
         starting_grid: list[tuple[int,int]] | None = None,
         test_mode: bool = False,
+        parameters: dict | None = None,
+        context: RaceContext | None = None,
+        traffic_model: TrafficModel | None = None,
+        safety_car_model: SafetyCarModel | None = None,
     ) -> None:
         """
         Initialize simulation parameters and load starting grid.
@@ -42,7 +67,16 @@ class Run:
             gp_location: Track name.
             dataframes: Preprocessed tables (races, laps, etc.).
             driver_strategies: Dict mapping driver names to pit strategies.
+            starting_grid: Optional list of (driver_id, grid_position).
             test_mode: If True, use deterministic events for testing.
+            parameters: Overrides of DEFAULT_PARAMETERS.
+            context: Already fitted RaceContext to reuse. If None, a new one
+                is built and fitted from `dataframes`.
+            traffic_model: Optional traffic/overtaking model. If None, cars
+                pass through each other and positions come from race times only.
+            safety_car_model: Optional empirical SC/VSC hazard tables. If set,
+                FCY phases are drawn from them instead of being triggered by
+                DNFs with probability `p_sc` (outside test mode).
         """
 
         self.season = season
@@ -50,18 +84,24 @@ class Run:
         self.test_mode = test_mode
         self.dataframes = dataframes
         self.driver_strategies = driver_strategies or {}
+        self.parameters = self.resolve_parameters(parameters)
+        self.traffic_model = traffic_model
+        self.safety_car_model = safety_car_model
+
+        # Fit (or reuse) the race context: race parameters, grid, drivers, pit stops
+        if context is None:
+            context = RaceContext(
+                season=season,
+                gp_location=gp_location,
+                dataframes=dataframes,
+                driver_strategies=self.driver_strategies,
+                starting_grid=starting_grid,
+            )
+        self.context = context.fit()
 
-        self.race_id: int = None
-        self.number_of_laps: int = 0
-
-        # Load race parameters (race_id, number_of_laps)
-        self._get_race_parameters()
-
-        # Determine the starting grid
-        if starting_grid is not None:
-            self.starting_grid = starting_grid
-        else:
-            self.starting_grid = self._build_starting_grid()
+        self.race_id: int = self.context.race_id
+        self.number_of_laps: int = self.context.number_of_laps
+        self.starting_grid = starting_grid if starting_grid is not None else self.context.starting_grid
 
         self.drivers_list: list[Driver] = []
 
@@ -72,7 +112,8 @@ class Run:
             "MexicoCity": [1, 2],
             "YasMarina": []
         }
-        self.safety_car_laps = sc_dict.get(self.gp_location, []) if self.test_mode else []
+        self.safety_car_laps = list(sc_dict.get(self.gp_location, [])) if self.test_mode else []
+        self.vsc_laps: list[int] = []
         
         # Initialize empty laps summary
         self.laps_summary = pd.DataFrame(
@@ -81,6 +122,11 @@ class Run:
         )
 
         self.outcomes = pd.DataFrame()
+        self._lap_rows: list[dict] = []
+
+        # Race progress: laps already simulated, and whether the start events were drawn
+        self.current_lap = 0
+        self._started = False
 
         # Logger setup
         self.logger = logging.getLogger(f"Run.{self.gp_location}")
@@ -93,18 +139,123 @@ class Run:
         # Create driver instances
         self._initialize_drivers()
 
+    @classmethod
+    def resolve_parameters(cls, parameters: dict | None) -> dict:
+        """
+        Merge `parameters` into DEFAULT_PARAMETERS, rejecting unknown keys.
+
+        Args:
+            parameters: Overrides, or None.
+
+        Returns:
+            Complete parameters dict.
+        """
+        overrides = parameters or {}
+        unknown = set(overrides) - set(cls.DEFAULT_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown simulation parameters: {sorted(unknown)}.")
+        return {**cls.DEFAULT_PARAMETERS, **overrides}
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        context: RaceContext,
+        snapshot: RaceSnapshot,
+        driver_strategies: dict = None,
+        test_mode: bool = False,
+        parameters: dict | None = None,
+        traffic_model: TrafficModel | None = None,
+        safety_car_model: SafetyCarModel | None = None,
+    ) -> "Run":
+        """
+        Build a Run that resumes from `snapshot` and only simulates the laps
+        after `snapshot.lap`.
+
+        Args:
+            context: Fitted context of the same race.
+            snapshot: Race state to resume from.
+            driver_strategies: Optional new strategies (e.g. "pit now"). Drivers
+                listed here resume from the first stop planned after the snapshot.
+            test_mode: If True, use deterministic events for testing.
+            parameters: Overrides of DEFAULT_PARAMETERS.
+            traffic_model: Optional traffic/overtaking model.
+            safety_car_model: Optional empirical SC/VSC hazard tables.
+
+        Returns:
+            Run ready to `run()` the remaining laps.
+        """
+        if (snapshot.season, snapshot.gp_location) != (context.season, context.gp_location):
+            raise ValueError(
+                f"Snapshot of {snapshot.gp_location} {snapshot.season} does not match "
+                f"context {context.gp_location} {context.season}."
+            )
+        sim = cls(
+            season=context.season,
+            gp_location=context.gp_location,
+            dataframes=context.dataframes,
+            driver_strategies=driver_strategies,
+            test_mode=test_mode,
+            parameters=parameters,
+            context=context,
+            traffic_model=traffic_model,
+            safety_car_model=safety_car_model,
+        )
+        snapshot.restore(sim.drivers_list, overridden=set(driver_strategies or {}))
+        sim.current_lap = snapshot.lap
+        if snapshot.lap > 0:
+            sim.safety_car_laps = list(snapshot.safety_car_laps)
+            sim.vsc_laps = list(snapshot.vsc_laps)
+            sim._initialize_retirements_and_safety_car(from_lap=snapshot.lap + 1)
+            sim._started = True
+        return sim
+
     def run(self) -> None:
         """
         Execute the race simulation: DNF handling, lap loops, pit stops,
         position updates, and final classification.
         """
-        # Initialize DNF and safety car events
-        self._initialize_retirements_and_safety_car()
+        self._start()
+        self.simulate_laps(self.number_of_laps)
+        self._classify()
+        self.logger.info(f"Race simulation for {self.gp_location} in {self.season} completed.")
 
-        # Add starting grid time penalties
-        self._add_starting_grid_time()
+    def run_until(self, lap: int) -> RaceSnapshot:
+        """
+        Simulate the race up to the end of `lap` and return its snapshot.
 
-        for lap in range(1, self.number_of_laps + 1):
+        Args:
+            lap: Last lap to simulate.
+
+        Returns:
+            RaceSnapshot at the end of `lap`.
+        """
+        self._start()
+        self.simulate_laps(lap)
+        return self.snapshot()
+
+    def snapshot(self) -> RaceSnapshot:
+        """
+        Returns:
+            RaceSnapshot of the race at the end of `current_lap`.
+        """
+        return RaceSnapshot.capture(
+            season=self.season,
+            gp_location=self.gp_location,
+            lap=self.current_lap,
+            drivers=self.drivers_list,
+            safety_car_laps=self.safety_car_laps,
+            vsc_laps=self.vsc_laps,
+        )
+
+    def simulate_laps(self, last_lap: int) -> None:
+        """
+        Simulate the laps from `current_lap + 1` to `last_lap` included.
+
+        Args:
+            last_lap: Last lap to simulate (capped at the race distance).
+        """
+        last_lap = min(last_lap, self.number_of_laps)
+        for lap in range(self.current_lap + 1, last_lap + 1):
             for driver in self.drivers_list:
                 driver.update_status(lap)
                 if driver.alive:
@@ -112,36 +263,46 @@ class Run:
                     lap_time = self._compute_lap_time(driver, lap)
                     pit_time = self._pit_stop(driver, lap)
                     driver.current_lap_time = lap_time + pit_time
-                    driver.cumulative_lap_time += driver.current_lap_time
                 else:
                     driver.current_lap_time = 0
 
-            # Update positions
+            # Interactions between cars, then race times
+            if self.traffic_model is not None:
+                self._apply_traffic()
             for driver in self.drivers_list:
                 if driver.alive:
-                    self._get_driver_position(driver)
-                else:
-                    driver.position = None
+                    driver.cumulative_lap_time += driver.current_lap_time
+
+            # Update positions
+            self._update_positions()
 
             # Record lap summary
             for driver in self.drivers_list:
                 if driver.alive or driver.earliest_dnf_lap == lap:
                     status = "running" if driver.alive else "DNF"
-                    row = {
+                    self._lap_rows.append({
                         "lap": lap,
                         "driver_id": driver.driver_id,
                         "position": driver.position,
                         "lap_time": driver.current_lap_time,
                         "cumulative_lap_time": driver.cumulative_lap_time,
                         "status": status,
-                    }
-                    # Only add if any value non-null
-                    if any(v is not None and not pd.isna(v) for v in row.values()):
-                        self.laps_summary.loc[len(self.laps_summary)] = [
-                            row.get(col, pd.NA) for col in self.laps_summary.columns
-                        ]
-
-        # Final classification
+                    })
+            self.current_lap = lap
+
+    def _start(self) -> None:
+        """Draw DNF and safety car events and apply grid penalties, once per race."""
+        if self._started:
+            return
+        # Initialize DNF and safety car events
+        self._initialize_retirements_and_safety_car()
+
+        # Add starting grid time penalties
+        self._add_starting_grid_time()
+        self._started = True
+
+    def _classify(self) -> None:
+        """Build the final classification, `outcomes` and `laps_summary`."""
         finishers = sorted(
             [d for d in self.drivers_list if d.alive],
             key=lambda d: d.cumulative_lap_time
@@ -152,7 +313,6 @@ class Run:
             reverse=True
         )
 
-        
         # Assign positions
         for pos, d in enumerate(finishers, 1):
             d.position = pos
@@ -166,14 +326,17 @@ class Run:
                 "driver_name": d.name,
                 "final_position": d.position,
                 "cumulative_time": d.cumulative_lap_time,
+                "dnf_lap": None if d.alive else d.earliest_dnf_lap,
             }
             for d in self.drivers_list
         ])
-        self.logger.info(f"Race simulation for {self.gp_location} in {self.season} completed.")
+        self.laps_summary = pd.DataFrame(
+            self._lap_rows, columns=self.laps_summary.columns, dtype=object
+        )
 
     def _add_starting_grid_time(self) -> None:
         """Add starting grid times to cumulative_lap_time according to the position."""
-        t_per_grid_pos = 0.25 # Time penalty per grid position (in seconds) from Phillips' model
+        t_per_grid_pos = self.parameters["t_per_grid_pos"]
         for driver_id, position in self.starting_grid:
             driver = next((d for d in self.drivers_list if d.driver_id == driver_id), None)
             if driver is not None:
@@ -188,95 +351,35 @@ class Run:
         """
         pass
 
-    def _build_starting_grid(self) -> list[tuple[int,int]]:
-        """
-        Construct the starting grid by combining qualifying order and any missing drivers.
-        Missing drivers are ordered alphabetically by name.
-
-        Returns:
-            List of (driver_id, grid_position).
-        """
-        quals = self.dataframes["qualifyings"]
-        sf = self.dataframes["starterfields"]
-        drivers_df = self.dataframes["drivers"]
-
-        # 1) Main grid from qualifying
-        qual_grid = (
-            quals[quals["race_id"] == self.race_id]
-            .sort_values("position")
-            .loc[:, ["driver_id", "position"]]
-        )
-        max_pos = int(qual_grid["position"].max()) if not qual_grid.empty else 0
-
-        # 2) Detect missing drivers
-        entered = set(
-            sf[sf["race_id"] == self.race_id]["driver_id"].unique()
-        )
-        missing = entered - set(qual_grid["driver_id"])
-
-        if missing:
-            # Order missing by driver name
-            missing_df = (
-                drivers_df[drivers_df["id"].isin(missing)]
-                .loc[:, ["id", "name"]]
-                .sort_values("name")
-            )
-            extra = pd.DataFrame({
-                "driver_id": missing_df["id"].values,
-                "position": max_pos + np.arange(1, len(missing_df) + 1)
-            })
-            qual_grid = pd.concat([qual_grid, extra], ignore_index=True)
-
-        # Return as list of tuples
-        return list(zip(qual_grid["driver_id"], qual_grid["position"]))
-
-    def _get_race_parameters(self) -> None:
-        """
-        Load race_id and number_of_laps from the races table.
-        """
-        races = self.dataframes["races"]
-        race = races[
-            (races["season"] == self.season)
-            & (races["location"] == self.gp_location)
-        ]
-        if race.empty:
-            raise ValueError(
-                f"No race for {self.gp_location}, season {self.season}."
-            )
-        self.race_id = race["id"].iloc[0]
-        self.number_of_laps = race["nolapsplanned"].iloc[0]
-        
     def _initialize_drivers(self) -> None:
-        """Instantiate Driver objects based on starting grid and strategies."""
-        drivers_df = self.dataframes["drivers"]
-        for driver_id, _ in self.starting_grid:
-            row = drivers_df[drivers_df["id"] == driver_id]
-            if row.empty:
-                continue
-            name = row["name"].iloc[0]
-            strat = self.driver_strategies.get(name, {})
-            drv = Driver(
-                season=self.season,
-                race_id=self.race_id,
-                dataframes=self.dataframes,
-                name=name,
-                strategy=strat,
-            )
-            self.drivers_list.append(drv)
+        """Copy the fitted drivers of the context and assign their strategies."""
+        self.drivers_list = self.context.spawn_drivers(self.driver_strategies)
 
-    def _initialize_retirements_and_safety_car(self) -> None:
+    def _initialize_retirements_and_safety_car(self, from_lap: int = 1) -> None:
         """
         Determine earliest DNF lap per driver and optionally inject safety car phases.
+
+        Args:
+            from_lap: First lap still to simulate. When resuming a race, only
+                drivers still running are drawn, conditionally on having
+                survived until `from_lap - 1`.
         """
+        drivers = [d for d in self.drivers_list if d.alive]
         if self.test_mode:
-            for d in self.drivers_list:
-                self.simulate_dnf_lap(d)
+            for d in drivers:
+                self.simulate_dnf_lap(d, from_lap)
             return
 
-        p_sc = 0.2 # Probability of safety car
-        sc_dur = 5 # Duration of safety car in laps
-        for d in self.drivers_list:
-            self.simulate_dnf_lap(d)
+        if self.safety_car_model is not None:
+            for d in drivers:
+                self.simulate_dnf_lap(d, from_lap)
+            self._sample_fcy_phases(from_lap)
+            return
+
+        p_sc = self.parameters["p_sc"]
+        sc_dur = self.parameters["sc_dur"]
+        for d in drivers:
+            self.simulate_dnf_lap(d, from_lap)
             dnf_lap = d.earliest_dnf_lap
             if dnf_lap and np.random.rand() < p_sc:
                 sc_end = min(dnf_lap + sc_dur - 1, self.number_of_laps)
@@ -284,17 +387,35 @@ class Run:
                     if lap not in self.safety_car_laps:
                         self.safety_car_laps.append(lap)
 
+    def _sample_fcy_phases(self, from_lap: int) -> None:
+        """
+        Draw the SC and VSC laps from `from_lap` on from the safety car model.
+        A phase still running at `from_lap` (resumed race) goes on, and no new
+        phase starts before it ends.
+        """
+        ongoing = set(self.safety_car_laps) | set(self.vsc_laps)
+        first_free_lap = from_lap
+        while first_free_lap in ongoing:
+            first_free_lap += 1
+        phases = self.safety_car_model.sample(self.gp_location, self.number_of_laps, first_free_lap)[0]
+        sc_laps, vsc_laps = set(self.safety_car_laps), set(self.vsc_laps)
+        self.safety_car_laps += [int(lap) for lap in np.flatnonzero(phases == SC) if lap not in sc_laps]
+        self.vsc_laps += [int(lap) for lap in np.flatnonzero(phases == VSC) if lap not in vsc_laps]
+
     def _compute_lap_time(self, driver: Driver, current_lap: int) -> float:
         """Compute a single lap time including fuel/tire model and safety car."""
-        feats = pd.DataFrame({
-            "fuelc": [driver.fuelc],
-            "compound": [driver.compound],
-            "tireage": [driver.tire_age],
-        })
-        base = driver.fuel_tire_model.predict(feats).iloc[0]
-        var = 0 if self.test_mode else np.random.normal(0, driver.variability)
+        base = driver.fuel_tire_model.predict_lap_time(driver.fuelc, driver.compound, driver.tire_age)
+        if self.parameters["tire_deg_scale"] != 1.0:
+            rate = driver.fuel_tire_model.tire_degradation_rate(driver.compound)
+            base += (self.parameters["tire_deg_scale"] - 1.0) * rate * driver.tire_age
+        sigma = driver.variability * self.parameters["variability_scale"]
+        var = 0 if self.test_mode else np.random.normal(0, sigma)
         lt = driver.best_qualif_time + base + var
-        return lt * 1.2 if current_lap in self.safety_car_laps else lt
+        if current_lap in self.safety_car_laps:
+            return lt * self.parameters["sc_factor"]
+        if current_lap in self.vsc_laps:
+            return lt * self.parameters["vsc_factor"]
+        return lt
 
     def _pit_stop(self, driver: Driver, current_lap: int) -> float:
         """Handle pit stop logic, calculate duration if stopping this lap."""
@@ -305,14 +426,8 @@ class Run:
                 exact = current_lap == data["pit_stop_lap"]
                 window = current_lap in range(*data["pitstop_interval"])
                 if exact or window:
-                    ps = PitStop(
-                        team=driver.team,
-                        gp_location=self.gp_location,
-                        season=self.season,
-                        dataframes=self.dataframes,
-                    )
-                    ps.calculate_best_pit_stop_duration()
-                    dur = ps.calculate_pit_stop_duration()
+                    ps: PitStop = self.context.get_pit_stop(driver.team)
+                    dur = ps.calculate_pit_stop_duration() + self.parameters["pit_loss_offset"]
                     driver.tire_age = data["tire_age"]
                     driver.compound = data["compound"]
                     driver.next_pit_stop += 1
@@ -321,19 +436,37 @@ class Run:
             self.logger.error(f"Pit stop error for {driver.name}: {e}")
         return 0.0
 
-    def _get_driver_position(self, driver: Driver) -> None:
-        """Assign current position based on cumulative lap time among alive drivers."""
+    def _apply_traffic(self) -> None:
+        """Adjust the current lap times of running cars with the traffic model."""
+        drivers = self.drivers_list
+        adjusted = self.traffic_model.apply(
+            cumulative_times=np.array([d.cumulative_lap_time for d in drivers], dtype=float),
+            lap_times=np.array([d.current_lap_time for d in drivers], dtype=float),
+            alive=np.array([d.alive for d in drivers], dtype=bool),
+        )[0]
+        for d, lap_time in zip(drivers, adjusted):
+            if d.alive:
+                d.current_lap_time = lap_time
+
+    def _update_positions(self) -> None:
+        """Assign current positions based on cumulative lap time among alive drivers."""
         alive = sorted(
             [d for d in self.drivers_list if d.alive],
             key=lambda d: d.cumulative_lap_time
         )
         for idx, d in enumerate(alive, 1):
-            if d == driver:
-                driver.position = idx
+            d.position = idx
+        for d in self.drivers_list:
+            if not d.alive:
+                d.position = None
 
-    def simulate_dnf_lap(self, driver: Driver) -> None:
+    def simulate_dnf_lap(self, driver: Driver, from_lap: int = 1) -> None:
         """
         Determine deterministic or probabilistic DNF lap for a driver.
+
+        Accidents and failures each happen with their race probability, on a
+        lap drawn uniformly over the race. With `from_lap > 1` both are drawn
+        conditionally on not having happened before `from_lap`.
         """
         if self.test_mode:
             test_dnfs = {
@@ -345,9 +478,23 @@ class Run:
             if driver.name in mapping:
                 driver.earliest_dnf_lap = mapping[driver.name]
         else:
-            acc = np.random.binomial(1, driver.accident_dnf_probability)
-            fl = np.random.binomial(1, driver.failure_dnf_probability)
-            a_lap = np.random.randint(1, self.number_of_laps + 1) if acc else None
-            f_lap = np.random.randint(1, self.number_of_laps + 1) if fl else None
+            # Share of the race already survived
+            elapsed = (from_lap - 1) / self.number_of_laps
+            acc_p = self._remaining_dnf_probability(driver.accident_dnf_probability, elapsed)
+            fail_p = self._remaining_dnf_probability(driver.failure_dnf_probability, elapsed)
+            acc = np.random.binomial(1, acc_p)
+            fl = np.random.binomial(1, fail_p)
+            a_lap = np.random.randint(from_lap, self.number_of_laps + 1) if acc else None
+            f_lap = np.random.randint(from_lap, self.number_of_laps + 1) if fl else None
             laps = [lap for lap in (a_lap, f_lap) if lap]
             driver.earliest_dnf_lap = min(laps) if laps else None
+
+    @staticmethod
+    def _remaining_dnf_probability(p: float, elapsed: float) -> float:
+        """
+        Probability of a DNF in the rest of the race given none in the first
+        `elapsed` share of it, for a DNF of race probability `p` on a uniform lap.
+        """
+        if elapsed == 0:
+            return p
+        return p * (1 - elapsed) / (1 - p * elapsed)
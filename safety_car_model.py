@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+safety_car_model.py
+
+Empirical full course yellow (safety car and virtual safety car) model built
+from the `fcyphases` table. A one-off precomputation turns the recorded phases
+into compact per-location hazard tables:
+
+- the probability that a phase starts on a lap, per bin of race progress,
+- the share of phases that are VSC rather than SC,
+- the distribution of phase durations (in laps) of each type.
+
+Locations with few recorded races are shrunk towards the all-track tables.
+Sampling draws the phases of a whole race (or of a batch of races) from one
+array of uniforms; only the few candidate starts are then walked through.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Phase codes of the sampled lap arrays
+GREEN, SC, VSC = 0, 1, 2
+
+
+class SafetyCarModel:
+    """
+    Per-location hazard tables of FCY phases.
+
+    Attributes:
+        locations (list[str]): Locations with a table ("" is the all-track table).
+        hazard (np.ndarray): (locations, N_BINS) probability that a phase
+            starts on a lap of each progress bin, when no phase is running.
+        p_vsc (np.ndarray): (locations,) share of VSC phases.
+        durations (np.ndarray): (2, MAX_DURATION) probability of an SC (row 0)
+            or VSC (row 1) phase lasting 1..MAX_DURATION laps (all tracks).
+    """
+
+    # Bins of race progress of the hazard tables
+    N_BINS = 10
+
+    # Longest phase kept (laps); longer phases are counted as this long
+    MAX_DURATION = 15
+
+    # Weight of the all-track table in a location's, in races
+    PRIOR_RACES = 3.0
+
+    def __init__(self, locations: list[str], hazard: np.ndarray, p_vsc: np.ndarray, durations: np.ndarray) -> None:
+        self.locations = list(locations)
+        self.hazard = np.asarray(hazard, dtype=np.float32)
+        self.p_vsc = np.asarray(p_vsc, dtype=np.float32)
+        self.durations = np.asarray(durations, dtype=np.float32)
+        self._index = {location: i for i, location in enumerate(self.locations)}
+        self._duration_cdf = np.cumsum(self.durations.astype(float), axis=1)
+        self._lap_hazards: dict[tuple[str, int], np.ndarray] = {}
+
+    @classmethod
+    def from_dataframes(cls, dataframes: dict, seasons=None) -> "SafetyCarModel":
+        """
+        Build the tables from the FCY phases of the races of `seasons`.
+
+        Args:
+            dataframes: Tables with "races" and "fcyphases".
+            seasons: Seasons to learn from (default: all). Leave the simulated
+                race out, e.g. `range(season - 2, season)`.
+
+        Returns:
+            Fitted SafetyCarModel.
+        """
+        races = dataframes["races"]
+        if seasons is not None:
+            races = races[races["season"].isin(list(seasons))]
+        if races.empty:
+            raise ValueError("No races to build the safety car tables from.")
+        phases = dataframes["fcyphases"]
+        phases = phases[phases["race_id"].isin(races["id"])]
+
+        locations = [""] + sorted(races["location"].astype(str).unique())
+        index = {location: i for i, location in enumerate(locations)}
+        starts = np.zeros((len(locations), cls.N_BINS))
+        at_risk = np.zeros((len(locations), cls.N_BINS))
+        n_races = np.zeros(len(locations))
+        n_vsc = np.zeros(len(locations))
+        n_phases = np.zeros(len(locations))
+        durations = np.zeros((2, cls.MAX_DURATION))
+
+        phases_by_race = {race_id: group for race_id, group in phases.groupby("race_id", observed=True)}
+        for race_id, location, num_laps in races[["id", "location", "nolapsplanned"]].itertuples(index=False):
+            num_laps = int(num_laps)
+            if num_laps <= 0:
+                continue
+            rows = [0, index[str(location)]]
+            laps = np.arange(1, num_laps + 1)
+            bins = cls._progress_bins(laps, num_laps)
+            running = np.zeros(num_laps + 1, dtype=bool)
+            race_starts = []
+            race_phases = phases_by_race.get(race_id)
+            if race_phases is not None:
+                for start, end, kind in race_phases[["startlap", "endlap", "type"]].itertuples(index=False):
+                    # Same lap convention as `remove_fcy_laps`: laps within [startlap, endlap]
+                    first = int(min(max(np.ceil(start), 1), num_laps))
+                    last = int(min(max(np.floor(end), first), num_laps))
+                    running[first:last + 1] = True
+                    race_starts.append(first)
+                    is_vsc = str(kind).upper() == "VSC"
+                    durations[int(is_vsc), min(last - first + 1, cls.MAX_DURATION) - 1] += 1
+                    n_vsc[rows] += is_vsc
+                    n_phases[rows] += 1
+            # A lap is at risk if no phase was already running on it
+            exposed = ~running[1:]
+            exposed[np.array(race_starts, dtype=int) - 1] = True
+            for row in rows:
+                at_risk[row] += np.bincount(bins[exposed], minlength=cls.N_BINS)
+                starts[row] += np.bincount(bins[np.array(race_starts, dtype=int) - 1], minlength=cls.N_BINS)
+                n_races[row] += 1
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pooled = np.where(at_risk[0] > 0, starts[0] / at_risk[0], 0.0)
+            pooled_vsc = n_vsc[0] / n_phases[0] if n_phases[0] else 0.0
+            # Shrinkage towards the all-track table, with the exposure of PRIOR_RACES average races
+            prior_laps = cls.PRIOR_RACES * at_risk[0] / max(n_races[0], 1)
+            hazard = (starts + prior_laps * pooled) / (at_risk + prior_laps)
+            hazard = np.where(np.isfinite(hazard), hazard, 0.0)
+            p_vsc = (n_vsc + cls.PRIOR_RACES * pooled_vsc) / (n_phases + cls.PRIOR_RACES)
+            totals = durations.sum(axis=1, keepdims=True)
+            durations = np.where(totals > 0, durations / totals, 0.0)
+        # Types never observed: one-lap phases
+        durations[totals[:, 0] == 0, 0] = 1.0
+        return cls(locations, hazard, p_vsc, durations)
+
+    @classmethod
+    def _progress_bins(cls, laps: np.ndarray, num_laps: int) -> np.ndarray:
+        """Progress bin of each lap (lap 1 starts at progress 0)."""
+        return np.minimum((laps - 1) * cls.N_BINS // num_laps, cls.N_BINS - 1).astype(int)
+
+    def save(self, path: str) -> None:
+        """Write the tables to a compressed .npz file."""
+        np.savez_compressed(
+            path,
+            locations=np.array(self.locations),
+            hazard=self.hazard,
+            p_vsc=self.p_vsc,
+            durations=self.durations,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "SafetyCarModel":
+        """Read tables written by `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["locations"].tolist(), data["hazard"], data["p_vsc"], data["durations"])
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            Plain dict of the tables (e.g. for configuration keys).
+        """
+        return {
+            "locations": self.locations,
+            "hazard": self.hazard.tolist(),
+            "p_vsc": self.p_vsc.tolist(),
+            "durations": self.durations.tolist(),
+        }
+
+    def table(self) -> pd.DataFrame:
+        """
+        Returns:
+            DataFrame indexed by location ("" for all tracks) with the hazard
+            of each progress bin and the VSC share.
+        """
+        df = pd.DataFrame(
+            self.hazard,
+            index=pd.Index(self.locations, name="location"),
+            columns=[f"hazard_{b}" for b in range(self.N_BINS)],
+        )
+        df["p_vsc"] = self.p_vsc
+        return df
+
+    def _row(self, gp_location: str) -> int:
+        """Table of `gp_location`, or the all-track table if it has none."""
+        return self._index.get(gp_location, 0)
+
+    def lap_hazard(self, gp_location: str, number_of_laps: int) -> np.ndarray:
+        """
+        Returns:
+            (number_of_laps + 1,) probability of a phase starting on each lap
+            (index 0 unused), cached per race.
+        """
+        key = (gp_location, number_of_laps)
+        if key not in self._lap_hazards:
+            bins = self._progress_bins(np.arange(1, number_of_laps + 1), number_of_laps)
+            self._lap_hazards[key] = np.concatenate([[0.0], self.hazard[self._row(gp_location), bins]])
+        return self._lap_hazards[key]
+
+    def sample(
+        self,
+        gp_location: str,
+        number_of_laps: int,
+        from_lap: int = 1,
+        size: int = 1,
+        rng: np.random.Generator | None = None,
+    ) -> np.ndarray:
+        """
+        Draw the FCY phases of `size` races.
+
+        Args:
+            gp_location: Track name.
+            number_of_laps: Race distance.
+            from_lap: First lap on which a phase can start.
+            size: Number of races.
+            rng: Generator to draw from (default: the global NumPy RNG).
+
+        Returns:
+            (size, number_of_laps + 1) int8 array of GREEN, SC or VSC per lap
+            (column 0 unused).
+        """
+        hazard = self.lap_hazard(gp_location, number_of_laps).copy()
+        hazard[:from_lap] = 0.0
+        return self._sample(gp_location, hazard, size, rng)[0]
+
+    def sample_tilted(
+        self,
+        gp_location: str,
+        number_of_laps: int,
+        tilt: float,
+        from_lap: int = 1,
+        size: int = 1,
+        rng: np.random.Generator | None = None,
+        max_hazard: float = 0.5,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Draw the FCY phases of `size` races with the phase start hazards
+        multiplied by `tilt` (capped at `max_hazard`), for importance sampling.
+
+        Returns:
+            (phases as in `sample`, (size,) log likelihood ratio of the draw
+            under the model against the tilted hazards). Only the laps on
+            which a phase could start enter the ratio.
+        """
+        hazard = self.lap_hazard(gp_location, number_of_laps).copy()
+        hazard[:from_lap] = 0.0
+        # Hazards already above the cap are left as they are
+        tilted = np.minimum(hazard * tilt, np.maximum(hazard, max_hazard))
+        phases, started = self._sample(gp_location, tilted, size, rng)
+        # Laps at risk: no phase running from an earlier lap
+        at_risk = (phases == GREEN) | started
+        at_risk[:, :from_lap] = False
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_start = np.where(hazard > 0, np.log(hazard) - np.log(tilted), 0.0)
+            log_green = np.where(hazard < 1, np.log1p(-hazard) - np.log1p(-tilted), 0.0)
+        log_weight = np.where(started, log_start, np.where(at_risk, log_green, 0.0)).sum(axis=1)
+        return phases, log_weight
+
+    def _sample(
+        self, gp_location: str, hazard: np.ndarray, size: int, rng: np.random.Generator | None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Draw the FCY phases of `size` races from per-lap start hazards.
+
+        Returns:
+            (phases, (size, number_of_laps + 1) True on the laps a phase started).
+        """
+        random = rng.random if rng is not None else np.random.random_sample
+        number_of_laps = len(hazard) - 1
+        sims, laps = np.nonzero(random((size, number_of_laps + 1)) < hazard)
+        is_vsc = random(len(sims)) < self.p_vsc[self._row(gp_location)]
+        u = random(len(sims))
+        lengths = 1 + np.minimum(
+            np.where(
+                is_vsc,
+                np.searchsorted(self._duration_cdf[1], u),
+                np.searchsorted(self._duration_cdf[0], u),
+            ),
+            self.MAX_DURATION - 1,
+        )
+
+        phases = np.zeros((size, number_of_laps + 1), dtype=np.int8)
+        started = np.zeros((size, number_of_laps + 1), dtype=bool)
+        busy_until = np.zeros(size, dtype=int)
+        # Candidate starts in (race, lap) order; those inside a running phase are dropped
+        for s, lap, vsc, length in zip(sims, laps, is_vsc, lengths):
+            if lap <= busy_until[s]:
+                continue
+            end = min(lap + length - 1, number_of_laps)
+            phases[s, lap:end + 1] = VSC if vsc else SC
+            started[s, lap] = True
+            busy_until[s] = end
+        return phases, started
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+sensitivity_sweep.py
+
+Parameter sensitivity analysis: runs Monte Carlo simulations over a grid of
+overrides of `Run.DEFAULT_PARAMETERS`, reusing a single fitted RaceContext,
+and summarizes the outcomes per grid point in a tidy DataFrame.
+"""
+
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from monte_carlo_simulator import MonteCarloSimulator
+from race_context import RaceContext
+from run import Run
+
+# Context of the current worker process, set once by `_init_worker`
+_worker_context = None
+
+
+def _init_worker(context: RaceContext) -> None:
+    """Store the fitted context in the worker process (pickled once per worker)."""
+    global _worker_context
+    _worker_context = context
+    # Forked workers inherit the parent's RNG state: give each its own stream
+    np.random.seed()
+    logging.getLogger(f"Run.{context.gp_location}").setLevel(logging.WARNING)
+
+
+def _simulate_grid_point(
+    point: Dict[str, Any],
+    driver_strategies: dict,
+    num_simulations: int,
+    test_mode: bool,
+    seed: int | None,
+    context: RaceContext | None = None,
+) -> pd.DataFrame:
+    """
+    Run `num_simulations` races with the overrides `point`.
+
+    Returns:
+        Concatenated outcomes with a `simulation_id` column.
+    """
+    context = context if context is not None else _worker_context
+    outcomes = []
+    for sim_id in range(num_simulations):
+        MonteCarloSimulator.seed_simulation(seed, sim_id)
+        sim = Run(
+            season=context.season,
+            gp_location=context.gp_location,
+            dataframes=context.dataframes,
+            driver_strategies=driver_strategies,
+            test_mode=test_mode,
+            parameters=point,
+            context=context,
+        )
+        sim.run()
+        outcomes.append(sim.outcomes.assign(simulation_id=sim_id))
+    return pd.concat(outcomes, ignore_index=True)
+
+
+class SensitivitySweep:
+    """
+    Sensitivity analysis of race outcomes to the simulation parameters.
+
+    Every grid point is simulated with the same seed (common random numbers),
+    so differences between grid points come from the parameters, not from noise.
+    Simulation `sim_id` is seeded from (seed, sim_id) as in `MonteCarloSimulator`,
+    so a grid point gives the outcomes of a simulator run with its parameters.
+    """
+
+    def __init__(
+        self,
+        context: RaceContext,
+        param_grid: Dict[str, List[Any]],
+        driver_strategies: dict = None,
+        num_simulations: int = 100,
+        test_mode: bool = False,
+        n_jobs: int = 1,
+        seed: int | None = None,
+    ) -> None:
+        """
+        Args:
+            context: Fitted (or not yet fitted) race context, shared by all points.
+            param_grid: Dict mapping a key of `Run.DEFAULT_PARAMETERS` to the
+                list of values to try. The sweep covers the cartesian product.
+            driver_strategies: Dict mapping driver names to pit strategies.
+            num_simulations: Number of Monte Carlo runs per grid point.
+            test_mode: Use deterministic events from the real race if True.
+            n_jobs: Number of worker processes. 1 runs everything in-process.
+            seed: Seed shared by every grid point (see `MonteCarloSimulator.seed_simulation`).
+                If None, each run draws one from the global NumPy RNG and
+                keeps it in `run_seed`.
+        """
+        Run.resolve_parameters({name: None for name in param_grid})
+        self.context = context
+        self.param_grid = param_grid
+        self.driver_strategies = driver_strategies or {}
+        self.num_simulations = num_simulations
+        self.test_mode = test_mode
+        self.n_jobs = n_jobs
+        self.seed = seed
+        self.run_seed: int | None = None
+
+        self.outcomes = pd.DataFrame()
+        self.summary = pd.DataFrame()
+
+    def grid_points(self) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List of override dicts, one per point of the cartesian product.
+        """
+        names = list(self.param_grid)
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*(self.param_grid[n] for n in names))
+        ]
+
+    def run(self) -> pd.DataFrame:
+        """
+        Simulate every grid point and summarize the outcomes.
+
+        Returns:
+            Tidy DataFrame with one row per (grid point, driver): the parameter
+            values followed by mean/std of position and time, and the DNF rate.
+        """
+        self.context.fit()
+        points = self.grid_points()
+        # Unseeded sweeps also share their random numbers between grid points
+        self.run_seed = self.seed if self.seed is not None else int(np.random.randint(2**32))
+        args = [
+            (p, self.driver_strategies, self.num_simulations, self.test_mode, self.run_seed)
+            for p in points
+        ]
+
+        if self.n_jobs == 1:
+            results = [_simulate_grid_point(*a, context=self.context) for a in args]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                initializer=_init_worker,
+                initargs=(self.context,),
+            ) as executor:
+                results = list(executor.map(_simulate_grid_point, *zip(*args)))
+
+        frames = []
+        for grid_id, (point, outcomes) in enumerate(zip(points, results)):
+            frames.append(outcomes.assign(grid_id=grid_id, **point))
+        self.outcomes = pd.concat(frames, ignore_index=True)
+        self.summary = self.summarize(self.outcomes, list(self.param_grid))
+        return self.summary
+
+    @staticmethod
+    def summarize(outcomes: pd.DataFrame, param_names: List[str]) -> pd.DataFrame:
+        """
+        Aggregate per-simulation outcomes into metrics per grid point and driver.
+
+        Args:
+            outcomes: Outcomes with `grid_id`, parameter columns and Run.outcomes columns.
+            param_names: Names of the swept parameters.
+
+        Returns:
+            Tidy summary DataFrame.
+        """
+        keys = ["grid_id", *param_names, "driver_id", "driver_name"]
+        return (
+            outcomes
+            .assign(dnf=outcomes["dnf_lap"].notna())
+            .groupby(keys, as_index=False, sort=True)
+            .agg(
+                mean_position=("final_position", "mean"),
+                std_position=("final_position", "std"),
+                mean_time=("cumulative_time", "mean"),
+                std_time=("cumulative_time", "std"),
+                dnf_rate=("dnf", "mean"),
+            )
+        )
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+shared_tables.py
+
+Export of the loaded tables to memory-mapped NumPy column files, so that worker
+processes can share one copy of the data instead of each unpickling (or
+reloading) its own `dataframes` dict.
+
+A directory holds one `.npy` file per column (categorical and text columns as
+integer codes) and a `manifest.json` describing the tables. `SharedTables`
+maps such a directory back to pandas DataFrames whose columns are read-only
+views of the memory-mapped files: the operating system page cache holds the
+data once, whatever the number of processes attached to it.
+"""
+
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+
+
+def export_tables(dataframes: dict, directory: str) -> "SharedTables":
+    """
+    Write every table of `dataframes` to `directory` as memory-mappable columns.
+
+    Args:
+        dataframes: dict table_name -> DataFrame (e.g. from `DataLoader.load_data`).
+        directory: Target directory (created if needed).
+
+    Returns:
+        SharedTables attached to the exported directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for table, df in dataframes.items():
+        columns = []
+        for i, (name, col) in enumerate(df.items()):
+            filename = f"{table}.{i}.npy"
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                kind = "categorical"
+                categories = col.cat.categories.tolist()
+                values = col.cat.codes.to_numpy()
+            elif pd.api.types.is_numeric_dtype(col.dtype) or pd.api.types.is_bool_dtype(col.dtype):
+                kind, categories = "numeric", None
+                values = col.to_numpy()
+            else:
+                # Text (e.g. driver names): stored as codes, rebuilt as strings
+                kind = "text"
+                codes, uniques = pd.factorize(col)
+                categories = [str(v) for v in uniques]
+                values = codes.astype(np.int32)
+            np.save(os.path.join(directory, filename), np.ascontiguousarray(values), allow_pickle=False)
+            columns.append({"name": name, "file": filename, "kind": kind, "categories": categories})
+        manifest[table] = {"rows": len(df), "columns": columns}
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return SharedTables(directory)
+
+
+class SharedTables(Mapping):
+    """
+    Read-only mapping table_name -> DataFrame over an exported directory.
+
+    Tables are attached lazily, once per process. Pickling a SharedTables (or
+    anything referencing it, such as a fitted RaceContext built on it) only
+    sends the directory path; the receiving process re-attaches zero-copy.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Args:
+            directory: Directory written by `export_tables`.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self._frames: dict[str, pd.DataFrame] = {}
+
+    def __reduce__(self):
+        return (SharedTables, (self.directory,))
+
+    def __getitem__(self, table: str) -> pd.DataFrame:
+        if table not in self._frames:
+            if table not in self.manifest:
+                raise KeyError(table)
+            self._frames[table] = self._attach(self.manifest[table])
+        return self._frames[table]
+
+    def __iter__(self):
+        return iter(self.manifest)
+
+    def __len__(self) -> int:
+        return len(self.manifest)
+
+    def _attach(self, spec: dict) -> pd.DataFrame:
+        """Build a DataFrame whose numeric and categorical columns are views of the files."""
+        columns = {}
+        for col in spec["columns"]:
+            # Plain ndarray view of the read-only memory map (no copy)
+            values = np.asarray(np.load(os.path.join(self.directory, col["file"]), mmap_mode="r", allow_pickle=False))
+            if col["kind"] == "categorical":
+                dtype = pd.CategoricalDtype(col["categories"])
+                series = pd.Series(pd.Categorical.from_codes(values, dtype=dtype, validate=False), copy=False)
+            elif col["kind"] == "text":
+                labels = np.array(col["categories"] + [None], dtype=object)
+                series = pd.Series(labels[values])
+            else:
+                series = pd.Series(values, copy=False)
+            columns[col["name"]] = series
+        return pd.DataFrame(columns, copy=False)
+
+    def nbytes(self) -> int:
+        """Returns the total size of the column files."""
+        return sum(
+            os.path.getsize(os.path.join(self.directory, col["file"]))
+            for spec in self.manifest.values() for col in spec["columns"]
+        )
@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+simulation_server.py
+
+Long-running local simulation service. Data is loaded and the race contexts of
+the configured races are fitted once at startup; strategy queries are then
+answered by a pool of worker processes that already hold the fitted contexts.
+
+Protocol: newline-delimited JSON over a Unix socket or a localhost TCP socket.
+A client sends one request line, e.g.
+
+    {"season": 2016, "gp_location": "Austin", "driver_strategies": {...},
+     "num_simulations": 500, "chunk_size": 100, "parameters": {}, "seed": 1}
+
+and receives one "chunk" message per completed chunk of simulations, holding
+the outcome distribution accumulated so far, then a final "done" message
+(or an "error" message). A query without a seed is given a fresh one, which
+the "done" message reports so that the query can be replayed.
+
+Usage:
+    python simulation_server.py --db data/F1_timingdata_2014_2019.sqlite \
+        --race 2016:Austin --race 2016:Suzuka --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DataLoader
+from monte_carlo_simulator import MonteCarloSimulator
+from race_context import RaceContext
+from run import Run
+from shared_tables import export_tables
+
+# Fitted contexts of the current worker process, set once by `_init_worker`
+_worker_contexts: Dict[Tuple[int, str], RaceContext] = {}
+
+
+def _init_worker(contexts: Dict[Tuple[int, str], RaceContext]) -> None:
+    """Keep the fitted contexts in the worker process and silence per-race logs."""
+    global _worker_contexts
+    _worker_contexts = contexts
+    # Forked workers inherit the parent's RNG state: give each its own stream
+    np.random.seed()
+    for season, location in contexts:
+        logging.getLogger(f"Run.{location}").setLevel(logging.WARNING)
+
+
+def _simulate_chunk(
+    race: Tuple[int, str],
+    driver_strategies: dict,
+    parameters: dict,
+    test_mode: bool,
+    seed: int | None,
+    first_sim_id: int,
+    num_simulations: int,
+) -> Dict[str, list]:
+    """
+    Simulate `num_simulations` races in a worker process.
+
+    Returns:
+        Columns "driver_id", "final_position", "cumulative_time" and "dnf".
+    """
+    context = _worker_contexts[race]
+    columns = {"driver_id": [], "final_position": [], "cumulative_time": [], "dnf": []}
+    for sim_id in range(first_sim_id, first_sim_id + num_simulations):
+        MonteCarloSimulator.seed_simulation(seed, sim_id)
+        sim = Run(
+            season=context.season,
+            gp_location=context.gp_location,
+            dataframes=context.dataframes,
+            driver_strategies=driver_strategies,
+            test_mode=test_mode,
+            parameters=parameters,
+            context=context,
+        )
+        sim.run()
+        out = sim.outcomes
+        columns["driver_id"].extend(int(v) for v in out["driver_id"])
+        columns["final_position"].extend(int(v) for v in out["final_position"])
+        columns["cumulative_time"].extend(float(v) for v in out["cumulative_time"])
+        columns["dnf"].extend(bool(v) for v in out["dnf_lap"].notna())
+    return columns
+
+
+def parse_strategies(strategies: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Restore the integer stop keys of strategies decoded from JSON
+    ({"1": {...}} -> {1: {...}}).
+    """
+    return {
+        name: {int(k) if str(k).isdigit() else k: v for k, v in strategy.items()}
+        for name, strategy in strategies.items()
+    }
+
+
+class OutcomeDistribution:
+    """
+    Running outcome distribution of a query: finishing position counts, race
+    time moments and DNF counts per driver.
+    """
+
+    def __init__(self, num_positions: int) -> None:
+        """
+        Args:
+            num_positions: Number of cars, i.e. of possible finishing positions.
+        """
+        self.num_positions = num_positions
+        self.count = 0
+        self.stats: Dict[int, Dict[str, Any]] = {}
+
+    def update(self, columns: Dict[str, list]) -> None:
+        """Add a chunk of outcomes (as returned by `_simulate_chunk`)."""
+        df = pd.DataFrame(columns)
+        for driver_id, grp in df.groupby("driver_id"):
+            st = self.stats.setdefault(int(driver_id), {
+                "positions": np.zeros(self.num_positions, dtype=np.int64),
+                "n": 0, "time_sum": 0.0, "time_sq_sum": 0.0, "dnf": 0,
+            })
+            st["positions"] += np.bincount(grp["final_position"] - 1, minlength=self.num_positions)[: self.num_positions]
+            finished = grp.loc[~grp["dnf"], "cumulative_time"]
+            st["n"] += len(grp)
+            st["dnf"] += int(grp["dnf"].sum())
+            st["time_sum"] += float(finished.sum())
+            st["time_sq_sum"] += float((finished ** 2).sum())
+        # One row per car and simulation
+        self.count += len(df) // self.num_positions
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns:
+            JSON-compatible distribution: per driver, position probabilities,
+            mean/std race time of finishers and DNF rate.
+        """
+        drivers = {}
+        for driver_id, st in self.stats.items():
+            finishers = st["n"] - st["dnf"]
+            mean = st["time_sum"] / finishers if finishers else None
+            var = st["time_sq_sum"] / finishers - mean ** 2 if finishers else None
+            drivers[str(driver_id)] = {
+                "position_probabilities": (st["positions"] / st["n"]).tolist(),
+                "mean_time": mean,
+                "std_time": float(np.sqrt(max(var, 0.0))) if var is not None else None,
+                "dnf_rate": st["dnf"] / st["n"],
+            }
+        return {"simulations": self.count, "drivers": drivers}
+
+
+class SimulationServer:
+    """
+    Asyncio server answering strategy queries from warm, pre-fitted contexts.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        races: List[Tuple[int, str]],
+        workers: int | None = None,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        unix_path: str | None = None,
+        default_strategies: Dict[Tuple[int, str], dict] | None = None,
+        shared_dir: str | None = None,
+    ) -> None:
+        """
+        Args:
+            db_path: SQLite database path.
+            races: (season, gp_location) of the races to preload.
+            workers: Number of worker processes (default: CPU count).
+            host: TCP host, localhost only by default.
+            port: TCP port (ignored if `unix_path` is set).
+            unix_path: If set, listen on this Unix socket instead of TCP.
+            default_strategies: Optional default strategies per race.
+            shared_dir: If set, the tables are exported there as memory-mapped
+                columns that every worker attaches to, instead of each worker
+                unpickling its own copy.
+        """
+        self.db_path = db_path
+        self.races = [(int(season), location) for season, location in races]
+        self.workers = workers or os.cpu_count()
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.default_strategies = default_strategies or {}
+        self.shared_dir = shared_dir
+
+        self.contexts: Dict[Tuple[int, str], RaceContext] = {}
+        self.executor: ProcessPoolExecutor | None = None
+        self.server: asyncio.AbstractServer | None = None
+
+        self.logger = logging.getLogger("SimulationServer")
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+            self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+
+    def preload(self) -> None:
+        """Load the database and fit every configured race context."""
+        dataframes = DataLoader(db_path=self.db_path).load_data()
+        if self.shared_dir is not None:
+            dataframes = export_tables(dataframes, self.shared_dir)
+        for season, location in self.races:
+            self.logger.info("Fitting context for %s %d", location, season)
+            context = RaceContext(
+                season=season,
+                gp_location=location,
+                dataframes=dataframes,
+                driver_strategies=self.default_strategies.get((season, location)),
+            )
+            context.fit_pit_stops()
+            self.contexts[(season, location)] = context
+
+    async def start(self) -> None:
+        """Preload contexts, start the worker pool and open the socket."""
+        if not self.contexts:
+            await asyncio.get_running_loop().run_in_executor(None, self.preload)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.contexts,),
+        )
+        if self.unix_path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=self.unix_path)
+            self.logger.info("Listening on %s", self.unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host=self.host, port=self.port)
+            self.logger.info("Listening on %s:%d", self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        """Start the server and serve until cancelled."""
+        await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Close the socket and shut the worker pool down."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def simulate(self, request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run a query over the worker pool, yielding one message per completed chunk.
+
+        Args:
+            request: Decoded request (see module docstring).
+
+        Yields:
+            "chunk" messages, then a "done" message (with the seed of the
+            query, drawn from fresh entropy if none was given). The chunks
+            not yet run are cancelled if the query fails or is closed before
+            the end.
+        """
+        race = (int(request["season"]), request["gp_location"])
+        if race not in self.contexts:
+            raise ValueError(f"Race {race[1]} {race[0]} is not loaded on this server.")
+        context = self.contexts[race]
+        strategies = parse_strategies(request.get("driver_strategies", {}))
+        parameters = Run.resolve_parameters(request.get("parameters"))
+        num_simulations = int(request.get("num_simulations", 100))
+        chunk_size = max(1, int(request.get("chunk_size", 50)))
+        seed = request.get("seed")
+        if seed is None:
+            # Seeding every simulation keeps concurrent chunks independent
+            seed = int(np.random.SeedSequence().entropy)
+
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(
+                self.executor, _simulate_chunk, race, strategies, parameters,
+                bool(request.get("test_mode", False)), seed,
+                first, min(chunk_size, num_simulations - first),
+            )
+            for first in range(0, num_simulations, chunk_size)
+        ]
+        distribution = OutcomeDistribution(num_positions=len(context.drivers_list))
+        try:
+            for future in asyncio.as_completed(futures):
+                distribution.update(await future)
+                yield {"type": "chunk", "total": num_simulations, **distribution.to_dict()}
+            yield {"type": "done", "total": num_simulations, "seed": seed, **distribution.to_dict()}
+        finally:
+            for future in futures:
+                future.cancel()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one connection, one JSON line each."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                messages = None
+                try:
+                    messages = self.simulate(json.loads(line))
+                    async for message in messages:
+                        writer.write((json.dumps(message) + "\n").encode("utf-8"))
+                        await writer.drain()
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # Bad request, or failure in a worker (e.g. BrokenProcessPool)
+                    if not isinstance(e, (ValueError, KeyError, TypeError)):
+                        self.logger.exception("Request failed")
+                    message = str(e) or type(e).__name__
+                    writer.write((json.dumps({"type": "error", "message": message}) + "\n").encode("utf-8"))
+                    await writer.drain()
+                finally:
+                    # Cancels the chunks still queued, e.g. when the client is gone
+                    if messages is not None:
+                        await messages.aclose()
+        except (ConnectionError, asyncio.CancelledError):
+            # Client gone, or server shutting down while the connection was idle
+            pass
+        finally:
+            writer.close()
+
+
+async def query(
+    request: Dict[str, Any],
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_path: str | None = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Send one request to a running SimulationServer and yield its messages
+    until the final "done" (or "error") message.
+    """
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((json.dumps(request) + "\n").encode("utf-8"))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            yield message
+            if message["type"] in ("done", "error"):
+                break
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Warm F1 race simulation server.")
+    parser.add_argument("--db", required=True, help="SQLite database path.")
+    parser.add_argument("--race", action="append", required=True, help="SEASON:LOCATION, repeatable.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="Unix socket path (instead of TCP).")
+    parser.add_argument("--shared-dir", default=None, help="Directory of memory-mapped tables shared by the workers.")
+    args = parser.parse_args()
+
+    races = [(int(r.split(":")[0]), r.split(":")[1]) for r in args.race]
+    server = SimulationServer(
+        db_path=args.db, races=races, workers=args.workers,
+        host=args.host, port=args.port, unix_path=args.unix, shared_dir=args.shared_dir,
+    )
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
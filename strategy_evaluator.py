@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+strategy_evaluator.py
+
+Closed-form evaluation of pit stop strategies, for pre-screening candidates
+before any Monte Carlo run.
+
+The lap time model is linear in fuel and tire age with zero-mean Gaussian
+noise, so the race time of a driver who finishes is a sum over the laps of
+the green-flag mean lap time of the stint times the lap time multiplier, plus
+noise and pit stops. Safety car phases enter through the mean and the lap by
+lap covariance of the multiplier (a phase covers several consecutive laps),
+and pit stops through the moments of the fitted Fisk (log-logistic) law.
+"""
+
+import numpy as np
+import pandas as pd
+
+from race_context import RaceContext
+from run import Run
+from safety_car_model import SafetyCarModel
+
+
+def fisk_moment(shape: float, order: int) -> float:
+    """
+    Raw moment E[X^order] of a standard Fisk variable X = (U / (1 - U))^(1 / shape).
+
+    Returns:
+        The moment, or inf when it does not exist (shape <= order).
+    """
+    if shape <= order:
+        return np.inf
+    b = np.pi * order / shape
+    return b / np.sin(b)
+
+
+class StrategyEvaluator:
+    """
+    Expected race time and variance of strategies, per driver.
+
+    The expectation is conditional on the driver finishing, and includes the
+    grid penalty, the lap times (with the expected safety car multiplier of
+    each lap) and the expected pit stop durations. The variance sums the lap
+    time noise, the variance the multiplier puts on the mean lap times (with
+    the correlation of the laps of a safety car phase) and the pit stop
+    duration variances.
+
+    Attributes:
+        number_of_laps (int): Race distance.
+        sc_factor_mean (np.ndarray): (D, L + 1) E[lap time multiplier] of each
+            lap, given that the driver finishes (index 0 unused).
+        sc_factor_square (np.ndarray): (D, L + 1) E[multiplier ** 2].
+        sc_factor_cov (np.ndarray): (D, L + 1, L + 1) covariance of the
+            multipliers of two laps, given that the driver finishes.
+    """
+
+    def __init__(
+        self,
+        context: RaceContext,
+        parameters: dict | None = None,
+        safety_car_model: SafetyCarModel | None = None,
+        starting_grid: list[tuple[int, int]] | None = None,
+        pit_stop_estimate: str = "mean",
+    ) -> None:
+        """
+        Args:
+            context: Fitted race context.
+            parameters: Overrides of `Run.DEFAULT_PARAMETERS`.
+            safety_car_model: FCY model of the simulations, if any.
+            starting_grid: Grid of the simulations (default: the context's).
+            pit_stop_estimate: "mean" or "median" pit stop duration. Fitted
+                Fisk laws with shape <= 1 have no mean (infinite expected
+                time); the median still ranks strategies with the same
+                number of stops.
+        """
+        if pit_stop_estimate not in ("mean", "median"):
+            raise ValueError(f"Unknown pit stop estimate {pit_stop_estimate!r}.")
+        self.pit_stop_estimate = pit_stop_estimate
+        self.context = context.fit()
+        self.parameters = Run.resolve_parameters(parameters)
+        self.number_of_laps = int(context.number_of_laps)
+        self.drivers = {d.name: d for d in context.drivers_list}
+        self._row = {d.name: i for i, d in enumerate(context.drivers_list)}
+        grid = dict(starting_grid if starting_grid is not None else context.starting_grid)
+        self._grid_time = {d.name: grid.get(d.driver_id, 0) * self.parameters["t_per_grid_pos"] for d in context.drivers_list}
+
+        laps = np.arange(self.number_of_laps + 1)
+        self._fuel = np.maximum(100.0 - 100.0 / self.number_of_laps * laps, 0.0)
+        self._fuel[0] = 0.0
+        # Multiplier m_l = 1 + sum over the phase types of (factor - 1) * 1[type on lap l]
+        excess = np.array([self.parameters["sc_factor"], self.parameters["vsc_factor"]]) - 1.0
+        if safety_car_model is not None:
+            p, joint = self._fcy_probabilities(safety_car_model, context.gp_location)
+            mean = 1.0 + excess @ p
+            cov = np.einsum("a,albk,b->lk", excess, joint, excess) - np.outer(excess @ p, excess @ p)
+            mean = np.broadcast_to(mean, (len(self._row), len(laps))).copy()
+            cov = np.broadcast_to(cov, (len(self._row),) + cov.shape).copy()
+        else:
+            p, joint = self._dnf_safety_car_probabilities()
+            mean = 1.0 + excess[0] * p
+            cov = excess[0] ** 2 * (joint - p[:, :, None] * p[:, None, :])
+        mean[:, 0] = 0.0
+        cov[:, 0, :] = cov[:, :, 0] = 0.0
+        self.sc_factor_mean = mean
+        self.sc_factor_cov = cov
+        self.sc_factor_square = mean ** 2 + np.diagonal(cov, axis1=1, axis2=2)
+        self._pit_moments: dict[str, tuple[float, float]] = {}
+        self._coefficient_cache: dict[tuple, tuple[float, float, float]] = {}
+
+    def _dnf_safety_car_probabilities(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        P(lap under safety car) with the DNF-triggered phases of `Run`: each
+        other driver's retirement brings `sc_dur` SC laps with probability `p_sc`.
+
+        Returns:
+            (D, L + 1) probabilities and (D, L + 1, L + 1) probabilities of
+            two laps both under safety car, for each driver given that they finish.
+        """
+        n = self.number_of_laps
+        sc_dur = int(self.parameters["sc_dur"])
+        laps = np.arange(n + 1)
+        first, second = np.minimum.outer(laps, laps), np.maximum.outer(laps, laps)
+        log_clear, log_clear_pair = [], []
+        for d in self.context.drivers_list:
+            # Earliest of an accident and a failure, each on a uniform lap
+            survive = (1 - d.accident_dnf_probability * laps / n) * (1 - d.failure_dnf_probability * laps / n)
+            p_lap = np.concatenate([[0.0], -np.diff(survive)])
+            # P(retirement in [l - sc_dur + 1, l]), the laps whose phase covers lap l
+            cdf = np.cumsum(p_lap)
+            before = np.concatenate([np.zeros(sc_dur), cdf])[: n + 1]
+            window = cdf - before
+            # P(retirement in the window of lap l or in that of lap k)
+            overlap = np.where(second - first < sc_dur, cdf[first] - before[second], 0.0)
+            union = window[:, None] + window[None, :] - overlap
+            log_clear.append(np.log1p(-self.parameters["p_sc"] * window))
+            log_clear_pair.append(np.log1p(-self.parameters["p_sc"] * union))
+        log_clear, log_clear_pair = np.array(log_clear), np.array(log_clear_pair)
+        clear = np.exp(log_clear.sum(axis=0, keepdims=True) - log_clear)
+        clear_pair = np.exp(log_clear_pair.sum(axis=0, keepdims=True) - log_clear_pair)
+        return 1.0 - clear, 1.0 - clear[:, :, None] - clear[:, None, :] + clear_pair
+
+    def _fcy_probabilities(self, model: SafetyCarModel, gp_location: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        P(lap under SC) and P(lap under VSC) with the phases of `model`,
+        following the same rules as `SafetyCarModel.sample`, and the joint
+        probabilities of two laps.
+
+        Returns:
+            (2, L + 1) P(phase of type t on lap l), t = 0 for SC and 1 for VSC,
+            and (2, L + 1, 2, L + 1) P(type a on lap l and type b on lap k).
+        """
+        n = self.number_of_laps
+        hazard = model.lap_hazard(gp_location, n)
+        row = model._row(gp_location)
+        type_probability = np.array([1.0 - model.p_vsc[row], model.p_vsc[row]])
+        # Chain 0 is the race; chain 1 + 2 * l + t follows the races with a
+        # phase of type t on lap l (a sub-probability of total `mass`).
+        # remaining[c, t, r]: P(a phase of type t covers this lap and the r - 1 next ones)
+        remaining = np.zeros((1 + 2 * (n + 1), 2, model.MAX_DURATION + 1))
+        mass = np.zeros(len(remaining))
+        mass[0] = 1.0
+        covered = np.zeros((len(remaining), n + 1, 2))
+        for lap in range(1, n + 1):
+            free = mass - remaining.sum(axis=(1, 2))
+            start = free[:, None, None] * hazard[lap] * type_probability[:, None] * model.durations
+            covered[:, lap] = remaining.sum(axis=2) + start.sum(axis=2)
+            nxt = np.zeros_like(remaining)
+            nxt[:, :, 1:-1] = remaining[:, :, 2:]
+            nxt[:, :, 1:model.MAX_DURATION] += start[:, :, 1:]
+            for t in range(2):
+                nxt[1 + 2 * lap + t, t] = nxt[0, t]
+                mass[1 + 2 * lap + t] = covered[0, lap, t]
+            remaining = nxt
+
+        p = covered[0].T
+        # later[a, l, b, k]: P(type a on lap l and type b on lap k) for k > l
+        later = covered[1:].reshape(n + 1, 2, n + 1, 2).transpose(1, 0, 3, 2)
+        later = later * np.triu(np.ones((n + 1, n + 1)), 1)[None, :, None, :]
+        joint = later + later.transpose(2, 3, 0, 1)
+        for t in range(2):
+            joint[t, :, t, :] += np.diag(p[t])
+        return p, joint
+
+    def _pit_stop_moments(self, driver) -> tuple[float, float]:
+        """Mean and variance of one pit stop duration of `driver`'s team."""
+        team = driver.team.name
+        if team not in self._pit_moments:
+            pit_stop = self.context.get_pit_stop(driver.team)
+            shape, loc, scale = pit_stop.variability_law
+            m1, m2 = fisk_moment(shape, 1), fisk_moment(shape, 2)
+            if self.pit_stop_estimate == "median":
+                # The median of a standard Fisk variable is 1
+                m1 = 1.0
+            variance = scale ** 2 * (m2 - m1 ** 2) if np.isfinite(m2) else np.inf
+            mean = pit_stop.avg_min_pit_stop_duration + self.parameters["pit_loss_offset"] + loc + scale * m1
+            self._pit_moments[team] = (mean, variance)
+        return self._pit_moments[team]
+
+    def stints(self, strategy: dict) -> list[tuple[int, int, str, float]]:
+        """
+        Stints of `strategy`, with the stop laps `Run` triggers.
+
+        Returns:
+            List of (first lap, last lap, compound, tire age before the first lap).
+        """
+        stints = []
+        compound = strategy.get("starting_compound")
+        age = strategy.get("starting_tire_age") or 0
+        first, k = 1, 1
+        while k in strategy:
+            stop = strategy[k]
+            low, high = stop["pitstop_interval"]
+            # First lap from `first` on that is the planned lap or in the window
+            candidates = [stop["pit_stop_lap"]] if stop["pit_stop_lap"] >= first else []
+            if max(low, first) < high:
+                candidates.append(max(low, first))
+            if not candidates or min(candidates) > self.number_of_laps:
+                break
+            lap = min(candidates)
+            stints.append((first, lap, compound, age))
+            first, compound, age = lap + 1, stop["compound"], stop["tire_age"]
+            k += 1
+        if first <= self.number_of_laps:
+            stints.append((first, self.number_of_laps, compound, age))
+        return stints
+
+    def evaluate(self, driver_name: str, strategy: dict) -> tuple[float, float]:
+        """
+        Args:
+            driver_name: Driver of the context.
+            strategy: Strategy in the format of `driver_strategies`.
+
+        Returns:
+            (expected race time, variance), given that the driver finishes.
+        """
+        driver = self.drivers[driver_name]
+        i = self._row[driver_name]
+        fuel_coef = self._coefficients(driver_name, None)[2]
+
+        # Green-flag mean lap time of every lap
+        lap_mean = np.zeros(self.number_of_laps + 1)
+        stints = self.stints(strategy)
+        for first, last, compound, age in stints:
+            level, deg, _ = self._coefficients(driver_name, compound)
+            # Tire age on lap l of the stint: age + l - first + 1
+            laps = np.arange(first, last + 1)
+            lap_mean[first:last + 1] = level + deg * (age + laps - first + 1) + fuel_coef * self._fuel[first:last + 1]
+        expected = self._grid_time[driver_name] + self.sc_factor_mean[i] @ lap_mean
+
+        # Var(m_l * (mu_l + noise_l)) summed over laps: the noise under the
+        # multiplier, and the multiplier on the means, correlated within a phase
+        sigma = driver.variability * self.parameters["variability_scale"]
+        variance = sigma ** 2 * self.sc_factor_square[i].sum() + lap_mean @ self.sc_factor_cov[i] @ lap_mean
+        n_stops = len(stints) - 1
+        if n_stops:
+            pit_mean, pit_variance = self._pit_stop_moments(driver)
+            expected += n_stops * pit_mean
+            variance += n_stops * pit_variance
+        return float(expected), float(variance)
+
+    def _coefficients(self, driver_name: str, compound) -> tuple[float, float, float]:
+        """
+        (lap time level, degradation per lap, fuel coefficient) of a driver on
+        `compound`, read once from the OLS parameters.
+        """
+        key = (driver_name, compound)
+        if key not in self._coefficient_cache:
+            driver = self.drivers[driver_name]
+            model = driver.fuel_tire_model
+            params = model.params
+            level = driver.best_qualif_time + params["Intercept"] + params.get(f"C(compound)[T.{compound}]", 0.0)
+            deg = self.parameters["tire_deg_scale"] * model.tire_degradation_rate(compound)
+            self._coefficient_cache[key] = (float(level), float(deg), float(params["fuelc"]))
+        return self._coefficient_cache[key]
+
+    def p_finish(self, driver_name: str) -> float:
+        """Probability that the driver sees the flag."""
+        d = self.drivers[driver_name]
+        return (1 - d.accident_dnf_probability) * (1 - d.failure_dnf_probability)
+
+    def rank(self, driver_name: str, strategies: dict) -> pd.DataFrame:
+        """
+        Rank candidate strategies of one driver by expected race time.
+
+        Args:
+            driver_name: Driver of the context.
+            strategies: dict candidate name -> strategy.
+
+        Returns:
+            DataFrame indexed by candidate with "expected_time" and "std",
+            fastest first.
+        """
+        rows = {name: self.evaluate(driver_name, strategy) for name, strategy in strategies.items()}
+        df = pd.DataFrame.from_dict(rows, orient="index", columns=["expected_time", "variance"])
+        df["std"] = np.sqrt(df.pop("variance"))
+        df.index.name = "strategy"
+        return df.sort_values("expected_time")
+
+    def evaluate_all(self, driver_strategies: dict) -> pd.DataFrame:
+        """
+        Args:
+            driver_strategies: dict driver name -> strategy.
+
+        Returns:
+            DataFrame indexed by driver_id with "driver_name", "expected_time",
+            "std" and "p_finish".
+        """
+        rows = []
+        for name, strategy in driver_strategies.items():
+            if name not in self.drivers:
+                continue
+            expected, variance = self.evaluate(name, strategy)
+            rows.append((self.drivers[name].driver_id, name, expected, np.sqrt(variance), self.p_finish(name)))
+        return pd.DataFrame(
+            rows, columns=["driver_id", "driver_name", "expected_time", "std", "p_finish"]
+        ).set_index("driver_id")
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+strategy_surrogate.py
+
+Surrogate of the simulator over the strategy space of one driver, for
+interactive what-if queries (e.g. a pit lap slider).
+
+Strategies sampled from a `StrategySpace` (number of stops, pit laps,
+compounds) are simulated on the array backend with common random numbers,
+and a Gaussian process emulator is fitted to the driver's expected finishing
+position and race time. Strategies are described by a few stint features
+(share of the race and summed tire age on each compound, number of stops),
+in which the lap time model is linear. The emulator reports its error on
+held-out simulated strategies, answers a query with a kernel product against
+the training strategies, and falls back to the simulator (adding the run to
+its training set) where its predictive uncertainty is high.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lap_kernel import numba_available
+
+
+class StrategySpace:
+    """
+    Pit stop strategies of a race.
+
+    Attributes:
+        number_of_laps (int): Race distance.
+        compounds (list[str]): Compounds that can be fitted.
+        min_stops (int), max_stops (int): Range of the number of stops.
+        min_stint (int): Shortest stint, in laps.
+        starting_tire_age (int): Age of the starting tires.
+    """
+
+    def __init__(
+        self,
+        number_of_laps: int,
+        compounds: list[str],
+        min_stops: int = 1,
+        max_stops: int = 2,
+        min_stint: int = 3,
+        starting_tire_age: int = 2,
+    ) -> None:
+        if not compounds:
+            raise ValueError("At least one compound is needed.")
+        if min_stops < 0 or max_stops < min_stops:
+            raise ValueError("Invalid range of pit stops.")
+        if (max_stops + 1) * min_stint > number_of_laps:
+            raise ValueError("The race is too short for these stints.")
+        self.number_of_laps = int(number_of_laps)
+        self.compounds = list(compounds)
+        self.min_stops = min_stops
+        self.max_stops = max_stops
+        self.min_stint = min_stint
+        self.starting_tire_age = starting_tire_age
+
+    @staticmethod
+    def strategy(pit_laps: list[int], compounds: list[str], starting_tire_age: int = 2) -> dict:
+        """
+        Strategy dict in the simulator's format.
+
+        Args:
+            pit_laps: Laps of the stops.
+            compounds: Compound of each stint (len(pit_laps) + 1).
+            starting_tire_age: Age of the starting tires.
+        """
+        if len(compounds) != len(pit_laps) + 1:
+            raise ValueError("One compound per stint is needed.")
+        strategy = {"starting_compound": compounds[0], "starting_tire_age": starting_tire_age}
+        for k, (lap, compound) in enumerate(zip(pit_laps, compounds[1:]), 1):
+            lap = int(lap)
+            strategy[k] = {"compound": compound, "pitstop_interval": [lap, lap], "pit_stop_lap": lap, "tire_age": 0}
+        return strategy
+
+    def sample(self, rng: np.random.Generator) -> dict:
+        """
+        Draw a strategy: uniform number of stops, pit laps uniform among those
+        leaving every stint at least `min_stint` laps, uniform compounds.
+        """
+        n_stops = int(rng.integers(self.min_stops, self.max_stops + 1))
+        # Stint lengths: min_stint each plus a uniform split of the spare laps
+        spare = self.number_of_laps - (n_stops + 1) * self.min_stint
+        cuts = np.sort(rng.integers(0, spare + 1, size=n_stops))
+        lengths = np.diff(np.concatenate([[0], cuts, [spare]])) + self.min_stint
+        pit_laps = np.cumsum(lengths)[:-1]
+        compounds = [self.compounds[i] for i in rng.integers(0, len(self.compounds), size=n_stops + 1)]
+        return self.strategy(list(pit_laps), compounds, self.starting_tire_age)
+
+    @property
+    def feature_names(self) -> list[str]:
+        return (
+            [f"share_{c}" for c in self.compounds]
+            + [f"age_{c}" for c in self.compounds]
+            + ["n_stops"]
+        )
+
+    def features(self, strategy: dict) -> np.ndarray:
+        """
+        Stint features of a strategy (planned pit laps): share of the race on
+        each compound, summed tire age on each compound (in race distances
+        squared), and number of stops.
+        """
+        n_laps = self.number_of_laps
+        n_compounds = len(self.compounds)
+        x = np.zeros(2 * n_compounds + 1)
+        compound = strategy.get("starting_compound")
+        age = strategy.get("starting_tire_age") or 0
+        first, k = 1, 1
+        while first <= n_laps:
+            stop = strategy.get(k)
+            last = min(stop["pit_stop_lap"], n_laps) if stop is not None else n_laps
+            length = max(last - first + 1, 0)
+            c = self.compounds.index(compound)
+            x[c] += length / n_laps
+            # Tire ages age + 1 .. age + length over the stint
+            x[n_compounds + c] += (length * age + length * (length + 1) / 2) / n_laps ** 2
+            if stop is None:
+                break
+            first, compound, age = last + 1, stop["compound"], stop["tire_age"]
+            x[-1] += 1
+            k += 1
+        return x
+
+
+class _GaussianProcess:
+    """
+    Gaussian process regression with a squared exponential kernel on
+    standardized features and known, per-point noise variances. The length
+    scale and signal variance are picked on a grid by marginal likelihood.
+    """
+
+    LENGTH_SCALES = (0.5, 1.0, 2.0, 4.0, 8.0)
+    SIGNAL_SCALES = (0.25, 1.0, 4.0, 16.0)
+
+    # Added to the noise variances (standardized), for numerical stability
+    JITTER = 1e-6
+
+    def fit(self, X: np.ndarray, y: np.ndarray, noise_var: np.ndarray) -> "_GaussianProcess":
+        self.x_mean = X.mean(axis=0)
+        self.x_scale = np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+        self.y_mean = y.mean()
+        self.y_scale = y.std() if y.std() > 0 else 1.0
+        self.X = (X - self.x_mean) / self.x_scale
+        z = (y - self.y_mean) / self.y_scale
+        noise = noise_var / self.y_scale ** 2 + self.JITTER
+        sq_dist = ((self.X[:, None, :] - self.X[None, :, :]) ** 2).sum(axis=-1)
+
+        best = None
+        for length in self.LENGTH_SCALES:
+            for signal in self.SIGNAL_SCALES:
+                K = signal * np.exp(-0.5 * sq_dist / length ** 2) + np.diag(noise)
+                try:
+                    L = np.linalg.cholesky(K)
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = np.linalg.solve(L.T, np.linalg.solve(L, z))
+                log_likelihood = -0.5 * z @ alpha - np.log(np.diag(L)).sum()
+                if best is None or log_likelihood > best[0]:
+                    best = (log_likelihood, length, signal, L, alpha)
+        if best is None:
+            raise RuntimeError("The emulator covariance is not positive definite.")
+        _, self.length, self.signal, self.L, self.alpha = best
+        self.L_inv = np.linalg.inv(self.L)
+        self._sq_norms = (self.X ** 2).sum(axis=1)
+        return self
+
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (mean, standard deviation) of the latent function at `X`.
+        """
+        Xs = (np.atleast_2d(X) - self.x_mean) / self.x_scale
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b: two small matrix products, no 3-D temporaries
+        sq_dist = (Xs ** 2).sum(axis=1)[:, None] + self._sq_norms - 2 * Xs @ self.X.T
+        k = self.signal * np.exp(-0.5 / self.length ** 2 * sq_dist)
+        v = k @ self.L_inv.T
+        var = np.maximum(self.signal - (v * v).sum(axis=1), 0.0)
+        return self.y_mean + self.y_scale * (k @ self.alpha), self.y_scale * np.sqrt(var)
+
+
+class StrategySurrogate:
+    """
+    Emulator of one driver's expected position and race time over a
+    strategy space, the other drivers keeping their strategies.
+
+    Attributes:
+        simulator (MonteCarloSimulator): Race simulated.
+        driver_name (str): Driver whose strategy varies.
+        space (StrategySpace): Strategies sampled.
+        num_simulations (int): Races simulated per strategy.
+        training (pd.DataFrame): Simulated strategies the emulators are fitted on.
+        validation (pd.DataFrame): Held-out simulated strategies and their predictions.
+    """
+
+    TARGETS = ("position", "race_time")
+
+    def __init__(
+        self,
+        simulator,
+        driver_name: str,
+        space: StrategySpace | None = None,
+        num_simulations: int = 256,
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            simulator: MonteCarloSimulator of the race.
+            driver_name: Driver whose strategy varies.
+            space: Strategy space (default: 1 or 2 stops on the compounds
+                of the simulator's strategies).
+            num_simulations: Races simulated per strategy.
+            seed: Seed of the strategy samples and of the common random
+                numbers of the simulations.
+        """
+        if driver_name not in simulator.driver_strategies:
+            raise ValueError(f"No strategy for {driver_name}.")
+        self.simulator = simulator
+        self.driver_name = driver_name
+        arrays = simulator.race_arrays()
+        if space is None:
+            start_age = simulator.driver_strategies[driver_name].get("starting_tire_age") or 0
+            space = StrategySpace(arrays.num_laps, arrays.compounds, starting_tire_age=start_age)
+        self.space = space
+        self.num_simulations = num_simulations
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._driver_index = arrays.driver_names.index(driver_name)
+        self.training = pd.DataFrame()
+        self.validation = pd.DataFrame()
+        self._strategies: list[dict] = []
+        self._emulators: dict[str, _GaussianProcess] = {}
+
+    def simulate(self, strategy: dict) -> dict:
+        """
+        Simulate the race with `strategy` for the driver (common random
+        numbers: the same simulation ids for every strategy).
+
+        Returns:
+            dict with the mean "position" and "race_time" (finishers) of the
+            driver and the variances of these means ("<target>_var").
+        """
+        strategies = {**self.simulator.driver_strategies, self.driver_name: strategy}
+        arrays = self.simulator.race_arrays(strategies)
+        outcomes = arrays.simulate(range(self.num_simulations), seed=self.seed, compiled=numba_available())
+        driver = outcomes[outcomes["driver_name"] == self.driver_name]
+        positions = driver["final_position"].to_numpy(dtype=float)
+        times = driver.loc[driver["dnf_lap"].isna(), "cumulative_time"].to_numpy(dtype=float)
+        result = {"position": positions.mean(), "position_var": positions.var(ddof=1) / len(positions)}
+        if len(times) > 1:
+            result.update(race_time=times.mean(), race_time_var=times.var(ddof=1) / len(times))
+        else:
+            result.update(race_time=np.nan, race_time_var=np.nan)
+        return result
+
+    def _simulate_many(self, strategies: list[dict]) -> pd.DataFrame:
+        """Simulated targets and features of `strategies`."""
+        rows = [self.simulate(strategy) for strategy in strategies]
+        df = pd.DataFrame(rows)
+        features = pd.DataFrame([self.space.features(s) for s in strategies], columns=self.space.feature_names)
+        return pd.concat([features, df], axis=1)
+
+    def fit(self, num_strategies: int = 40, num_validation: int = 10) -> dict:
+        """
+        Simulate sampled strategies, fit the emulators, and score them on
+        held-out strategies.
+
+        Args:
+            num_strategies: Training strategies.
+            num_validation: Held-out strategies.
+
+        Returns:
+            `validation_error()`.
+        """
+        strategies = [self.space.sample(self._rng) for _ in range(num_strategies + num_validation)]
+        self._strategies = strategies[:num_strategies]
+        self.training = self._simulate_many(self._strategies)
+        self._fit_emulators()
+        if num_validation:
+            held_out = self._simulate_many(strategies[num_strategies:])
+            X = held_out[self.space.feature_names].to_numpy()
+            for target in self.TARGETS:
+                held_out[f"{target}_pred"], held_out[f"{target}_std"] = self._emulators[target].predict(X)
+            self.validation = held_out
+        return self.validation_error()
+
+    def _fit_emulators(self) -> None:
+        X = self.training[self.space.feature_names].to_numpy()
+        for target in self.TARGETS:
+            known = self.training[target].notna().to_numpy()
+            self._emulators[target] = _GaussianProcess().fit(
+                X[known],
+                self.training.loc[known, target].to_numpy(),
+                self.training.loc[known, f"{target}_var"].to_numpy(),
+            )
+
+    def validation_error(self) -> dict:
+        """
+        Returns:
+            dict with, per target, the RMSE of the predictions on the held-out
+            strategies ("<target>_rmse") and the share of them within two
+            predictive standard deviations, simulation noise included
+            ("<target>_coverage"); empty before `fit` with validation.
+        """
+        if self.validation.empty:
+            return {}
+        errors = {}
+        for target in self.TARGETS:
+            df = self.validation[self.validation[target].notna()]
+            residual = df[target] - df[f"{target}_pred"]
+            spread = np.sqrt(df[f"{target}_std"] ** 2 + df[f"{target}_var"])
+            errors[f"{target}_rmse"] = float(np.sqrt(np.mean(residual ** 2)))
+            errors[f"{target}_coverage"] = float(np.mean(np.abs(residual) <= 2 * spread))
+        return errors
+
+    def predict(self, strategy: dict) -> dict:
+        """
+        Emulated expected position and race time of `strategy`.
+
+        Returns:
+            dict with "position", "position_std", "race_time", "race_time_std".
+        """
+        if not self._emulators:
+            raise RuntimeError("The surrogate is not fitted: call fit() first.")
+        x = self.space.features(strategy)
+        result = {}
+        for target in self.TARGETS:
+            mean, std = self._emulators[target].predict(x)
+            result[target], result[f"{target}_std"] = float(mean[0]), float(std[0])
+        return result
+
+    def query(self, strategy: dict, max_position_std: float = 0.1, max_race_time_std: float | None = None) -> dict:
+        """
+        Answer from the emulator, or from the simulator when the emulator is
+        too uncertain; simulated strategies join the training set.
+
+        Args:
+            strategy: Strategy of the driver.
+            max_position_std: Largest acceptable predictive std of the position.
+            max_race_time_std: Largest acceptable predictive std of the race
+                time in seconds (None: not checked).
+
+        Returns:
+            `predict()` output plus "source" ("surrogate" or "simulator").
+        """
+        prediction = self.predict(strategy)
+        uncertain = prediction["position_std"] > max_position_std or (
+            max_race_time_std is not None and prediction["race_time_std"] > max_race_time_std
+        )
+        if not uncertain:
+            return {**prediction, "source": "surrogate"}
+
+        row = self._simulate_many([strategy])
+        self._strategies.append(strategy)
+        self.training = pd.concat([self.training, row], ignore_index=True)
+        self._fit_emulators()
+        simulated = row.iloc[0]
+        return {
+            "position": float(simulated["position"]),
+            "position_std": float(np.sqrt(simulated["position_var"])),
+            "race_time": float(simulated["race_time"]),
+            "race_time_std": float(np.sqrt(simulated["race_time_var"])),
+            "source": "simulator",
+        }
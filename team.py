@@ -5,6 +5,8 @@ team.py
 Defines the Team class and a TeamRegistry to ensure one instance per unique team name.
 """
 
+from model_cache import ModelCache
+
 
 class Team:
     """
@@ -24,7 +26,7 @@ class TeamRegistry:
     Registry (or cache) to ensure a single instance of Team per unique name.
     """
 
-    _teams_cache = {}
+    _teams_cache = ModelCache("teams", max_entries=1024)
 
     @classmethod
     def get_team(cls, name: str) -> Team:
@@ -38,6 +40,9 @@ class TeamRegistry:
         Returns:
             Team: A Team instance.
         """
-        if name not in cls._teams_cache:
-            cls._teams_cache[name] = Team(name)
-        return cls._teams_cache[name]
+        return cls._teams_cache.get_or_create(name, lambda: Team(name))
+
+    @classmethod
+    def clear(cls) -> None:
+        """Forget every registered team."""
+        cls._teams_cache.clear()
@@ -0,0 +1,94 @@
+# tests/conftest.py
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+DRIVER_NAMES = [
+    "Lewis Hamilton", "Nico Rosberg", "Kimi Raikkonen",
+    "Max Verstappen", "Esteban Gutierrez", "Nico Hulkenberg",
+]
+
+
+def build_synthetic_db(path: str, seed: int = 0, n_laps: int = 15) -> None:
+    """
+    Write a small timing database with the schema of the real one: 6 drivers
+    of 5 teams, 3 seasons of 8 races, one pit stop per driver and race, and
+    random SC/VSC phases.
+    """
+    rng = np.random.default_rng(seed)
+    driver_ids = list(range(1, len(DRIVER_NAMES) + 1))
+    teams = {1: "Mercedes", 2: "Mercedes", 3: "Ferrari", 4: "Red Bull", 5: "Haas", 6: "Force India"}
+    pace = {1: 0.0, 2: 0.2, 3: 0.6, 4: 0.5, 5: 1.5, 6: 1.2}
+    locations = ["Melbourne", "Sakhir", "Barcelona", "Suzuka", "Austin", "MexicoCity", "Interlagos", "YasMarina"]
+    races, laps, quals, sf, fcy, ret = [], [], [], [], [], []
+    race_id = 0
+    for season in (2014, 2015, 2016):
+        for location in locations:
+            race_id += 1
+            races.append((race_id, season, location, n_laps))
+            base = 90 + rng.normal(0, 2)
+            qualif = {d: base + pace[d] + rng.normal(0, 0.2) for d in driver_ids}
+            for pos, d in enumerate(sorted(qualif, key=qualif.get), 1):
+                quals.append((race_id, d, pos, qualif[d] + 1.0, qualif[d] + 0.5, qualif[d] if pos <= 4 else None))
+            if rng.random() < 0.5:
+                start = int(rng.integers(2, n_laps - 3))
+                fcy.append((race_id, start, start + 2, "SC" if rng.random() < 0.5 else "VSC"))
+            finish = {}
+            for d in driver_ids:
+                pit_lap = int(rng.integers(5, 10))
+                compound, age, racetime = "A3", 2, 0.0
+                laps.append((race_id, d, 0, None, None, None, compound, age, 0.0))
+                for lap in range(1, n_laps + 1):
+                    age += 1
+                    fuel = 100 - 100 / n_laps * lap
+                    laptime = qualif[d] + 3 + 0.03 * fuel + (0.08 if compound == "A3" else 0.05) * age + rng.normal(0, 0.4)
+                    pit_in, pit_duration = None, None
+                    if lap == pit_lap:
+                        pit_duration = 20 + rng.gamma(2.0, 0.6)
+                        pit_in = 1.0
+                        laptime += pit_duration
+                        compound, age = "A2", 0
+                    racetime += laptime
+                    laps.append((race_id, d, lap, laptime, pit_in, pit_duration, compound, age, racetime))
+                finish[d] = racetime
+            for pos, d in enumerate(sorted(finish, key=finish.get), 1):
+                sf.append((race_id, d, teams[d], "F", pos))
+        for d in driver_ids:
+            ret.append((season, d, int(rng.integers(0, 4)), int(rng.integers(0, 3))))
+
+    tables = {
+        "drivers": pd.DataFrame({"id": driver_ids, "name": DRIVER_NAMES, "initials": [n.split()[-1][:3].upper() for n in DRIVER_NAMES]}),
+        "races": pd.DataFrame(races, columns=["id", "season", "location", "nolapsplanned"]),
+        "laps": pd.DataFrame(laps, columns=["race_id", "driver_id", "lapno", "laptime", "pitintime", "pitstopduration", "compound", "tireage", "racetime"]),
+        "qualifyings": pd.DataFrame(quals, columns=["race_id", "driver_id", "position", "q1laptime", "q2laptime", "q3laptime"]),
+        "starterfields": pd.DataFrame(sf, columns=["race_id", "driver_id", "team", "status", "resultposition"]),
+        "fcyphases": pd.DataFrame(fcy, columns=["race_id", "startlap", "endlap", "type"]),
+        "retirements": pd.DataFrame(ret, columns=["season", "driver_id", "accidents", "failures"]),
+    }
+    with sqlite3.connect(path) as con:
+        for name, df in tables.items():
+            df.to_sql(name, con, index=False, if_exists="replace")
+
+
+@pytest.fixture(scope="session")
+def synthetic_db(tmp_path_factory) -> str:
+    """Path of a synthetic timing database (see `build_synthetic_db`)."""
+    path = str(tmp_path_factory.mktemp("db") / "synthetic.sqlite")
+    build_synthetic_db(path)
+    return path
+
+
+@pytest.fixture
+def strategies() -> dict:
+    """One-stop strategy (A3 -> A2 on lap 7) for every driver of the synthetic database."""
+    return {
+        name: {
+            "starting_compound": "A3",
+            "starting_tire_age": 2,
+            1: {"compound": "A2", "pitstop_interval": [7, 7], "pit_stop_lap": 7, "tire_age": 0},
+        }
+        for name in DRIVER_NAMES
+    }
@@ -0,0 +1,78 @@
+# tests/test_aggregate_store.py
+
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregate_store import AggregateStore
+from fuel_and_tire_model import FuelAndTireModel
+from monte_carlo_simulator import MonteCarloSimulator
+
+TABLES = ["races", "pit_stops", "starts", "retirements", "best_qualifying"]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    FuelAndTireModel.cache.clear()
+    FuelAndTireModel.statistics.clear()
+    yield
+    FuelAndTireModel.cache.clear()
+    FuelAndTireModel.statistics.clear()
+
+
+def fitted_parameters(simulator: MonteCarloSimulator) -> dict:
+    context = simulator.get_context()
+    context.fit_pit_stops()
+    parameters = {
+        driver.name: [driver.best_qualif_time, driver.accident_dnf_probability,
+                      driver.failure_dnf_probability, driver.variability]
+        for driver in context.drivers_list
+    }
+    for team, pit_stop in context.pit_stops.items():
+        parameters[team] = [pit_stop.avg_min_pit_stop_duration, *pit_stop.variability_law]
+    return parameters
+
+
+def test_models_read_the_same_values_from_the_store(synthetic_db, strategies, tmp_path):
+    plain = fitted_parameters(MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False))
+    FuelAndTireModel.cache.clear()
+    FuelAndTireModel.statistics.clear()
+    store = AggregateStore(str(tmp_path / "aggregates.sqlite"))
+    stored = fitted_parameters(
+        MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False, aggregates=store)
+    )
+    assert store.race_ids() == list(range(1, 25))
+    assert plain.keys() == stored.keys()
+    for key in plain:
+        np.testing.assert_allclose(stored[key], plain[key], rtol=1e-12)
+
+
+def test_refresh_only_adds_new_races(synthetic_db, tmp_path):
+    # The database before its last two races
+    partial_db = str(tmp_path / "partial.sqlite")
+    shutil.copy(synthetic_db, partial_db)
+    with sqlite3.connect(partial_db) as con:
+        con.execute("DELETE FROM races WHERE id > 22")
+        for table in ("laps", "qualifyings", "starterfields", "fcyphases"):
+            con.execute(f"DELETE FROM {table} WHERE race_id > 22")
+
+    incremental = AggregateStore(str(tmp_path / "incremental.sqlite"))
+    assert incremental.refresh(partial_db) == list(range(1, 23))
+    assert incremental.refresh(synthetic_db) == [23, 24]
+    assert incremental.refresh(synthetic_db) == []
+    full = AggregateStore(str(tmp_path / "full.sqlite"))
+    full.refresh(synthetic_db)
+
+    for table in TABLES:
+        query = f"SELECT * FROM {table} ORDER BY 1, 2, 3"
+        pd.testing.assert_frame_equal(incremental._read(query), full._read(query))
+
+    laps = pd.read_sql_query("SELECT * FROM laps", sqlite3.connect(synthetic_db))
+    best = laps.dropna(subset=["pitstopduration"]).groupby("race_id")["pitstopduration"].quantile(0.025)
+    races = full._read("SELECT id, best_pit_stop FROM races ORDER BY id").set_index("id")["best_pit_stop"]
+    np.testing.assert_allclose(races, best.sort_index())
+    starts = full.starts([2016])
+    assert (starts["races"] == 8).all() and len(starts) == 6
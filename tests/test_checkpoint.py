@@ -0,0 +1,97 @@
+# tests/test_checkpoint.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_simulator import MonteCarloSimulator
+
+NUM_SIMULATIONS = 6
+
+
+class Interrupted(Exception):
+    pass
+
+
+def make_simulator(synthetic_db, strategies, seed=None) -> MonteCarloSimulator:
+    return MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, num_simulations=NUM_SIMULATIONS, verbose=False, seed=seed
+    )
+
+
+def interrupt_after(simulator: MonteCarloSimulator, k: int) -> None:
+    """Make `simulator` crash when it starts simulation `k`."""
+    original = simulator.simulate
+
+    def simulate(sim_id):
+        if sim_id == k:
+            raise Interrupted()
+        return original(sim_id)
+
+    simulator.simulate = simulate
+
+
+def reference_outcomes(synthetic_db, strategies) -> pd.DataFrame:
+    np.random.seed(11)
+    reference = make_simulator(synthetic_db, strategies)
+    reference.run_simulation()
+    return reference.final_outcomes
+
+
+@pytest.mark.parametrize("k", [3, 5])
+def test_resume_after_interruption(synthetic_db, strategies, tmp_path, k):
+    # Unseeded campaign: resuming must also restore the global RNG state
+    reference = reference_outcomes(synthetic_db, strategies)
+    path = str(tmp_path / "run.ckpt")
+
+    np.random.seed(11)
+    interrupted = make_simulator(synthetic_db, strategies)
+    interrupt_after(interrupted, k)
+    with pytest.raises(Interrupted):
+        interrupted.run_simulation(checkpoint_path=path, checkpoint_every=2)
+
+    np.random.seed(0)
+    resumed = make_simulator(synthetic_db, strategies)
+    simulated = []
+    original = resumed.simulate
+    resumed.simulate = lambda sim_id: simulated.append(sim_id) or original(sim_id)
+    resumed.run_simulation(checkpoint_path=path, checkpoint_every=2)
+    assert simulated == list(range(k - k % 2, NUM_SIMULATIONS))
+    pd.testing.assert_frame_equal(resumed.final_outcomes, reference)
+
+
+def test_truncated_record_is_simulated_again(synthetic_db, strategies, tmp_path):
+    reference = reference_outcomes(synthetic_db, strategies)
+    path = str(tmp_path / "run.ckpt")
+    np.random.seed(11)
+    make_simulator(synthetic_db, strategies).run_simulation(checkpoint_path=path, checkpoint_every=2)
+
+    # Crash in the middle of writing the last record
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 100)
+    resumed = make_simulator(synthetic_db, strategies)
+    resumed.run_simulation(checkpoint_path=path, checkpoint_every=2)
+    pd.testing.assert_frame_equal(resumed.final_outcomes, reference)
+
+    # The repaired file resumes the finished campaign without simulating
+    again = make_simulator(synthetic_db, strategies)
+    again.simulate = None
+    again.run_simulation(checkpoint_path=path, checkpoint_every=2)
+    pd.testing.assert_frame_equal(again.final_outcomes, reference)
+
+
+def test_other_configuration_is_rejected(synthetic_db, strategies, tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    interrupted = make_simulator(synthetic_db, strategies, seed=1)
+    interrupt_after(interrupted, 3)
+    with pytest.raises(Interrupted):
+        interrupted.run_simulation(checkpoint_path=path, checkpoint_every=2)
+
+    with pytest.raises(ValueError, match="another configuration"):
+        make_simulator(synthetic_db, strategies, seed=2).run_simulation(checkpoint_path=path)
+    other_strategies = {name: {**strategy, "starting_compound": "A2"} for name, strategy in strategies.items()}
+    with pytest.raises(ValueError, match="another configuration"):
+        make_simulator(synthetic_db, other_strategies, seed=1).run_simulation(checkpoint_path=path)
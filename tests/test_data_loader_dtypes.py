@@ -0,0 +1,28 @@
+# tests/test_data_loader_dtypes.py
+
+import numpy as np
+import pandas as pd
+
+from data_loader import compact_dtypes, memory_report
+
+
+def test_compact_dtypes_keeps_values():
+    laps = pd.DataFrame({
+        "race_id": np.repeat([900, 901], 50),
+        "lapno": np.tile(np.arange(1, 51), 2),
+        "laptime": 90 + np.random.default_rng(0).normal(0, 1, 100),
+        "pitintime": np.where(np.arange(100) % 25 == 0, 1.0, np.nan),
+        "compound": np.where(np.arange(100) < 60, "A3", "A2"),
+    })
+
+    compact = compact_dtypes(laps)
+
+    assert compact["race_id"].dtype == np.int16
+    assert compact["pitintime"].dtype == np.float32
+    # Not exactly representable in float32: kept as is by default
+    assert compact["laptime"].dtype == np.float64
+    assert isinstance(compact["compound"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(compact.astype(laps.dtypes.to_dict()), laps)
+
+    report = memory_report({"laps": laps}, {"laps": compact})
+    assert report.loc["total", "bytes_after"] < report.loc["total", "bytes_before"]
@@ -0,0 +1,54 @@
+# tests/test_engine_equivalence.py
+
+import pytest
+
+from conftest import build_synthetic_db
+from engine_equivalence import EngineEquivalence
+from monte_carlo_simulator import MonteCarloSimulator
+
+NUM_SIMULATIONS = 400
+
+
+@pytest.fixture(scope="module")
+def long_race_db(tmp_path_factory) -> str:
+    """Synthetic database with 40-lap races, long enough for the scripted Austin events."""
+    path = str(tmp_path_factory.mktemp("db") / "long.sqlite")
+    build_synthetic_db(path, n_laps=40)
+    return path
+
+
+def test_deterministic_runs_agree(long_race_db, strategies):
+    mc = MonteCarloSimulator(2016, "Austin", long_race_db, strategies, 3, verbose=False, seed=0, test_mode=True)
+    # Fit the pit stop models, then remove their variability
+    mc.simulate(0)
+    for pit_stop in mc.get_context().pit_stops.values():
+        shape, _, _ = pit_stop.variability_law
+        pit_stop.variability_law = (shape, 0.0, 0.0)
+
+    reference = mc.simulate_range(0, 3)
+    candidate = mc.race_arrays().simulate(range(3), seed=0, compiled=False)
+    assert EngineEquivalence().deterministic_differences(reference, candidate).empty
+    dnf = reference.groupby("driver_name")["dnf_lap"].first().dropna().to_dict()
+    assert dnf == {"Nico Hulkenberg": 1, "Esteban Gutierrez": 16, "Max Verstappen": 28, "Kimi Raikkonen": 38}
+
+    # Any difference is reported
+    candidate.loc[0, "cumulative_time"] += 1e-3
+    assert len(EngineEquivalence().deterministic_differences(reference, candidate)) == 1
+
+
+def test_kernel_is_equivalent_to_run(synthetic_db, strategies):
+    mc = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, NUM_SIMULATIONS, verbose=False, seed=1)
+    reference = mc.simulate_range(0, NUM_SIMULATIONS)
+    # Independent draws: the kernel runs with another seed
+    candidate = mc.race_arrays().simulate(range(NUM_SIMULATIONS), seed=2, compiled=False)
+    tests = EngineEquivalence(alpha=0.01).equivalence_tests(reference, candidate)
+    assert set(tests["test"]) == {"race_time", "position"}
+    assert not tests["reject"].any()
+
+    # A candidate losing 2 s per pit stop is rejected
+    slower = MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, NUM_SIMULATIONS, verbose=False, seed=2,
+        parameters={"pit_loss_offset": 2.0},
+    )
+    biased = slower.race_arrays().simulate(range(NUM_SIMULATIONS), seed=2, compiled=False)
+    assert not EngineEquivalence(alpha=0.01).equivalent(reference, biased)
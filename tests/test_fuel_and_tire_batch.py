@@ -0,0 +1,115 @@
+# tests/test_fuel_and_tire_batch.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fuel_and_tire_model import FuelAndTireModel
+
+SEASON = 2016
+DRIVERS = [1, 2, 3]
+
+
+@pytest.fixture
+def dataframes():
+    """Small season of 5 races, 3 drivers, with pit stops, FCY phases, a DNF
+    and a missing qualifying."""
+    rng = np.random.default_rng(42)
+    laps, sf, quals = [], [], []
+    for race_id in range(1, 6):
+        for driver_id in DRIVERS:
+            status = "R" if (race_id, driver_id) == (2, 3) else "F"
+            sf.append((race_id, driver_id, status))
+            if (race_id, driver_id) != (3, 2):
+                quals.append((race_id, driver_id, 91.0 + driver_id, 90.5 + driver_id, 90.0 + driver_id))
+            pit_lap = int(rng.integers(8, 14))
+            compound, age = ("A3", 1) if driver_id != 2 else ("A4", 2)
+            for lapno in range(1, 26):
+                age += 1
+                pit_in = None
+                if lapno == pit_lap:
+                    pit_in = 1.0
+                    compound, age = ("A2" if race_id % 2 else "A1"), 0
+                laptime = 92 + driver_id + 0.03 * (25 - lapno) + 0.07 * age + rng.normal(0, 0.3)
+                laps.append((race_id, driver_id, lapno, laptime, pit_in, compound, age))
+    return {
+        "laps": pd.DataFrame(laps, columns=["race_id", "driver_id", "lapno", "laptime", "pitintime", "compound", "tireage"]),
+        "races": pd.DataFrame({"id": range(1, 6), "season": SEASON}),
+        "starterfields": pd.DataFrame(sf, columns=["race_id", "driver_id", "status"]),
+        "fcyphases": pd.DataFrame({"race_id": [1, 4], "startlap": [5, 17], "endlap": [7, 19]}),
+        "qualifyings": pd.DataFrame(quals, columns=["race_id", "driver_id", "q1laptime", "q2laptime", "q3laptime"]),
+    }
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    FuelAndTireModel.cache.clear()
+    FuelAndTireModel.statistics.clear()
+    yield
+    FuelAndTireModel.cache.clear()
+    FuelAndTireModel.statistics.clear()
+
+
+def test_batch_fit_matches_statsmodels(dataframes):
+    race_id = 5
+    batch = FuelAndTireModel.fit_batch(SEASON, race_id, DRIVERS, dataframes)
+    FuelAndTireModel.cache.clear()
+
+    assert set(batch) == set(DRIVERS)
+    for driver_id in DRIVERS:
+        ref = FuelAndTireModel(SEASON, driver_id, race_id, dataframes)
+        ref.fit()
+        params = ref.model.params.reindex(FuelAndTireModel.PARAM_NAMES)
+        np.testing.assert_allclose(batch[driver_id]["params"].to_numpy(), params.to_numpy(), atol=1e-8)
+        np.testing.assert_allclose(batch[driver_id]["variability"], ref.variability, rtol=1e-8)
+
+
+def test_batch_fit_fills_cache_used_by_fit(dataframes):
+    race_id = 4
+    batch = FuelAndTireModel.fit_batch(SEASON, race_id, DRIVERS, dataframes)
+    model = FuelAndTireModel(SEASON, 1, race_id, dataframes)
+    model.fit()
+    assert model.model is None
+    assert model.variability == batch[1]["variability"]
+    features = pd.DataFrame({"fuelc": [40.0, 10.0], "compound": ["A3", "A2"], "tireage": [5, 12]})
+    expected = [model.predict_lap_time(r.fuelc, r.compound, r.tireage) for r in features.itertuples()]
+    np.testing.assert_allclose(model.predict(features).to_numpy(), expected)
+
+
+def test_walk_forward_matches_per_race_fits(dataframes):
+    wf = FuelAndTireModel.walk_forward(SEASON, DRIVERS, dataframes)
+    for race_id in (4, 5):
+        FuelAndTireModel.cache.clear()
+        batch = FuelAndTireModel.fit_batch(SEASON, race_id, DRIVERS, dataframes)
+        rows = wf[wf["race_id"] == race_id].set_index("driver_id")
+        for driver_id, fitted in batch.items():
+            np.testing.assert_allclose(
+                rows.loc[driver_id, FuelAndTireModel.PARAM_NAMES].to_numpy(dtype=float), fitted["params"].to_numpy(), atol=1e-8
+            )
+            np.testing.assert_allclose(rows.loc[driver_id, "variability"], fitted["variability"], rtol=1e-8)
+
+    # Out-of-sample error against a direct computation on the test race laps
+    laps = FuelAndTireModel._batch_regression_data(SEASON, None, [1], dataframes)
+    test = laps[laps["race_id"] == 5]
+    row = wf[(wf["driver_id"] == 1) & (wf["race_id"] == 5)].iloc[0]
+    beta = row[FuelAndTireModel.PARAM_NAMES].to_numpy(dtype=float)
+    resid = test["corrected_lap_time"].to_numpy() - FuelAndTireModel.design_matrix(test) @ beta
+    assert row["n_test"] == len(test)
+    np.testing.assert_allclose(row["test_rmse"], np.sqrt(np.mean(resid ** 2)), rtol=1e-8)
+
+
+def test_statistics_follow_new_races(dataframes):
+    # Statistics computed while the database held races 1-3 only
+    partial = dict(dataframes)
+    partial["races"] = dataframes["races"][dataframes["races"]["id"] <= 3]
+    partial["laps"] = dataframes["laps"][dataframes["laps"]["race_id"] <= 3]
+    FuelAndTireModel.fit_batch(SEASON, 3, DRIVERS, partial)
+    FuelAndTireModel.cache.clear()
+
+    batch = FuelAndTireModel.fit_batch(SEASON, 5, DRIVERS, dataframes)
+    assert list(FuelAndTireModel.statistics.get((SEASON, 1, False))["race_ids"]) == [1, 2, 3, 4, 5]
+    FuelAndTireModel.cache.clear()
+    FuelAndTireModel.statistics.clear()
+    fresh = FuelAndTireModel.fit_batch(SEASON, 5, DRIVERS, dataframes)
+    for driver_id in DRIVERS:
+        np.testing.assert_allclose(batch[driver_id]["params"].to_numpy(), fresh[driver_id]["params"].to_numpy())
@@ -0,0 +1,67 @@
+# tests/test_importance_sampling.py
+
+import numpy as np
+import pytest
+
+from importance_sampling import ImportanceSampler
+from monte_carlo_simulator import MonteCarloSimulator
+from race_analytics import RaceAnalytics
+from safety_car_model import GREEN
+from test_safety_car_model import small_model
+
+FRONT_RUNNERS = ["Lewis Hamilton", "Nico Rosberg", "Max Verstappen", "Kimi Raikkonen", "Nico Hulkenberg"]
+NUM_SIMULATIONS = 5000
+
+
+@pytest.fixture
+def simulator(synthetic_db, strategies) -> MonteCarloSimulator:
+    return MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False, seed=3)
+
+
+def test_weighted_estimates_are_unbiased(simulator):
+    plain = RaceAnalytics(simulator.race_arrays().simulate(range(NUM_SIMULATIONS), seed=4, compiled=False))
+    sampler = simulator.importance_sampler(dnf_tilt=2.5, sc_tilt=1.0, drivers=FRONT_RUNNERS)
+    weighted = RaceAnalytics(sampler.simulate(range(NUM_SIMULATIONS), compiled=False))
+    assert abs(weighted.weights.mean() - 1) < 4 * weighted.weights.std() / np.sqrt(NUM_SIMULATIONS)
+    assert weighted.effective_sample_size < NUM_SIMULATIONS
+
+    expected = plain.finish_probabilities()
+    estimated = weighted.finish_probabilities(confidence=0.95)
+    for column in ("p_win", "p_podium", "p_dnf"):
+        # Bounds of both estimates (about 4 standard errors apart at most)
+        half_width = (estimated[f"{column}_high"] - estimated[f"{column}_low"]) / 2
+        plain_se = np.sqrt(expected[column] * (1 - expected[column]) / NUM_SIMULATIONS)
+        assert (np.abs(estimated[column] - expected[column]) < 2 * half_width + 4 * plain_se).all()
+
+
+def test_rare_podium_needs_fewer_simulations(simulator):
+    event = ImportanceSampler.finishes_in_top("Esteban Gutierrez", 1)
+    plain = simulator.importance_sampler(dnf_tilt=1.0, sc_tilt=1.0).probability(
+        event, target_relative_error=0.0, batch_size=NUM_SIMULATIONS, max_simulations=NUM_SIMULATIONS, compiled=False
+    )
+    tilted = simulator.importance_sampler(dnf_tilt=2.5, sc_tilt=1.0, drivers=FRONT_RUNNERS).probability(
+        event, target_relative_error=0.0, batch_size=NUM_SIMULATIONS, max_simulations=NUM_SIMULATIONS, compiled=False
+    )
+    assert plain["effective_sample_size"] == plain["hits"]
+    assert tilted["hits"] > 5 * plain["hits"]
+    assert tilted["standard_error"] < 0.6 * plain["standard_error"]
+    assert abs(tilted["probability"] - plain["probability"]) < 4 * plain["standard_error"]
+
+    # Batches stop once the target relative error is reached
+    sampler = simulator.importance_sampler(dnf_tilt=2.5, sc_tilt=1.0, drivers=FRONT_RUNNERS)
+    result = sampler.probability(event, target_relative_error=0.25, batch_size=500, compiled=False)
+    assert result["relative_error"] <= 0.25
+    assert result["num_simulations"] < NUM_SIMULATIONS
+    with pytest.raises(ValueError):
+        simulator.importance_sampler(drivers=["Ayrton Senna"])
+
+
+def test_tilted_safety_car_phases():
+    model = small_model()
+    rng = np.random.default_rng(0)
+    phases, log_weight = model.sample_tilted("Spa", 10, tilt=0.4, size=20000, rng=rng)
+    weights = np.exp(log_weight)
+    # Fewer phases under the tilt, reweighted to the model's P(phase on lap 3) = 0.5
+    assert (phases[:, 3] != GREEN).mean() < 0.3
+    assert abs(np.mean(weights * (phases[:, 3] != GREEN)) - 0.5) < 0.02
+    assert abs(weights.mean() - 1) < 0.02
@@ -0,0 +1,82 @@
+# tests/test_lap_kernel.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lap_kernel import numba_available
+from monte_carlo_simulator import MonteCarloSimulator
+
+NUM_SIMULATIONS = 500
+
+
+@pytest.fixture
+def simulator(synthetic_db, strategies) -> MonteCarloSimulator:
+    return MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, NUM_SIMULATIONS, verbose=False, seed=5
+    )
+
+
+def summary(outcomes: pd.DataFrame) -> pd.DataFrame:
+    finishers = outcomes[outcomes["dnf_lap"].isna()]
+    return pd.DataFrame({
+        "position": outcomes.groupby("driver_id")["final_position"].mean(),
+        "dnf": outcomes.groupby("driver_id")["dnf_lap"].apply(lambda x: x.notna().mean()),
+        # Median: pit stop durations are heavy-tailed
+        "time": finishers.groupby("driver_id")["cumulative_time"].median(),
+    })
+
+
+def test_kernel_matches_run_distribution(simulator):
+    python = summary(simulator.simulate_range(0, NUM_SIMULATIONS))
+    kernel = summary(simulator.race_arrays().simulate(range(NUM_SIMULATIONS), seed=5, compiled=False))
+    assert np.allclose(kernel["position"], python["position"], atol=0.3)
+    assert np.allclose(kernel["dnf"], python["dnf"], atol=0.07)
+    assert np.allclose(kernel["time"], python["time"], rtol=0.01)
+
+
+def test_kernel_simulations_do_not_depend_on_the_batch(simulator):
+    arrays = simulator.race_arrays()
+    batch = arrays.simulate(range(10), seed=1, compiled=False)
+    alone = arrays.simulate([4, 7], seed=1, compiled=False)
+    expected = batch[batch["simulation_id"].isin([4, 7])].reset_index(drop=True)
+    pd.testing.assert_frame_equal(alone, expected)
+    positions = batch.groupby("simulation_id")["final_position"].apply(sorted)
+    assert all(p == list(range(1, len(arrays.driver_ids) + 1)) for p in positions)
+
+
+def test_engine_option(synthetic_db, strategies):
+    with pytest.raises(ValueError):
+        MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False, engine="gpu")
+    mc = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False, engine="numba")
+    assert mc.engine == ("numba" if numba_available() else "python")
+
+
+@pytest.fixture
+def workqueue_layer():
+    """Run the compiled kernel on Numba's fork-safe threading layer (see lap_kernel.py)."""
+    numba = pytest.importorskip("numba")
+    previous = numba.config.THREADING_LAYER
+    numba.config.THREADING_LAYER = "workqueue"
+    yield
+    numba.config.THREADING_LAYER = previous
+
+
+@pytest.mark.parametrize("test_mode", [False, True])
+def test_compiled_kernel_matches_interpreted(synthetic_db, strategies, test_mode, workqueue_layer):
+    simulator = MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, verbose=False, seed=5, test_mode=test_mode
+    )
+    arrays = simulator.race_arrays()
+    # Same random inputs for both kernels
+    inputs = arrays.draw(range(200), seed=5)
+    args = (inputs, arrays.p_accident, arrays.p_failure, arrays.p_sc)
+    time, position, dnf = arrays._run_kernel(*args, compiled=True)
+    expected_time, expected_position, expected_dnf = arrays._run_kernel(*args, compiled=False)
+    np.testing.assert_allclose(time, expected_time, rtol=1e-12)
+    np.testing.assert_array_equal(position, expected_position)
+    np.testing.assert_array_equal(dnf, expected_dnf)
+    # Every simulation classifies every car once (scripted retirements past
+    # the race distance are not retirements)
+    assert (np.sort(position, axis=1) == np.arange(1, len(arrays.driver_ids) + 1)).all()
+    assert (dnf <= arrays.num_laps).all()
@@ -0,0 +1,63 @@
+# tests/test_laps_streaming.py
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import DataLoader
+from lap_aggregates import LapAggregates
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Two seasons of 3 races, 4 drivers, 20 laps each, with pit stops and an FCY phase."""
+    rng = np.random.default_rng(0)
+    races = pd.DataFrame({
+        "id": range(1, 7), "season": [2015] * 3 + [2016] * 3,
+        "location": ["Austin", "Suzuka", "Monza"] * 2, "nolapsplanned": 20,
+    })
+    laps, sf = [], []
+    for race_id in races["id"]:
+        for driver_id in range(1, 5):
+            sf.append((race_id, driver_id, "Team", "R" if driver_id == 4 else "F"))
+            for lapno in range(1, 21):
+                pit = lapno == 8 + driver_id
+                laps.append((race_id, driver_id, lapno, 90 + rng.normal(), 1.0 if pit else None,
+                             22 + rng.exponential() if pit else None, "A2" if lapno > 10 else "A3", lapno, 90.0 * lapno))
+    path = str(tmp_path / "timing.db")
+    with sqlite3.connect(path) as con:
+        races.to_sql("races", con, index=False)
+        pd.DataFrame(laps, columns=["race_id", "driver_id", "lapno", "laptime", "pitintime",
+                                    "pitstopduration", "compound", "tireage", "racetime"]).to_sql("laps", con, index=False)
+        pd.DataFrame(sf, columns=["race_id", "driver_id", "team", "status"]).to_sql("starterfields", con, index=False)
+        pd.DataFrame({"race_id": [2], "startlap": [3], "endlap": [5]}).to_sql("fcyphases", con, index=False)
+    return path
+
+
+def test_iter_laps_streams_each_race_once(db_path):
+    loader = DataLoader(db_path)
+    full = pd.read_sql_query("SELECT * FROM laps ORDER BY race_id, driver_id, lapno", sqlite3.connect(db_path))
+
+    chunks = list(loader.iter_laps(batch_size=7))
+
+    assert [race_id for race_id, _ in chunks] == list(range(1, 7))
+    assert all((laps["race_id"] == race_id).all() for race_id, laps in chunks)
+    streamed = pd.concat([laps for _, laps in chunks], ignore_index=True)
+    pd.testing.assert_frame_equal(streamed.astype(full.dtypes.to_dict()), full)
+    assert [race_id for race_id, _ in loader.iter_laps(seasons=[2016])] == [4, 5, 6]
+
+
+def test_aggregates_match_full_table(db_path):
+    laps = pd.read_sql_query("SELECT * FROM laps", sqlite3.connect(db_path))
+
+    aggregates = LapAggregates.build(DataLoader(db_path), batch_size=11)
+
+    quantiles = laps.dropna(subset=["pitstopduration"]).groupby("race_id")["pitstopduration"].quantile(0.025)
+    np.testing.assert_allclose(pd.Series(aggregates.best_pit_stop).sort_index(), quantiles)
+    assert (aggregates.dnf_counts() == 1).all()
+    regression = aggregates.regression_laps
+    assert not regression["driver_id"].eq(4).any()
+    assert regression["pitintime"].isna().all()
+    assert not ((regression["race_id"] == 2) & regression["lapno"].between(3, 5)).any()
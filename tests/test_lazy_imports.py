@@ -0,0 +1,56 @@
+# tests/test_lazy_imports.py
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Modules that must not be loaded by merely importing the simulator
+HEAVY_MODULES = ["matplotlib", "rich", "scipy", "statsmodels"]
+
+# Budget for the import time of a simulator module on top of numpy/pandas, as
+# a fraction of the time of importing numpy and pandas in the same interpreter.
+# A ratio, unlike a wall-clock limit, does not depend on the machine's load;
+# importing scipy.stats or statsmodels alone costs more than the budget.
+IMPORT_TIME_RATIO = 0.5
+
+SIMULATOR_MODULES = [
+    "monte_carlo_simulator",
+    "run",
+    "driver",
+    "fuel_and_tire_model",
+    "pit_stop",
+    "sensitivity_sweep",
+    "simulation_server",
+]
+
+
+def _import_in_fresh_interpreter(module: str) -> dict:
+    code = (
+        "import sys, time, json\n"
+        "t = time.perf_counter()\n"
+        "import numpy, pandas\n"
+        "baseline = time.perf_counter() - t\n"
+        "t = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'baseline': baseline, 'elapsed': elapsed, 'heavy': heavy}))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd="."
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", SIMULATOR_MODULES)
+def test_heavy_dependencies_are_deferred(module):
+    result = _import_in_fresh_interpreter(module)
+    assert result["heavy"] == []
+
+
+@pytest.mark.parametrize("module", SIMULATOR_MODULES)
+def test_import_time_budget(module):
+    result = _import_in_fresh_interpreter(module)
+    assert result["elapsed"] < IMPORT_TIME_RATIO * result["baseline"], result
@@ -0,0 +1,90 @@
+# tests/test_model_cache.py
+
+import os
+import threading
+
+import pytest
+
+from fuel_and_tire_model import FuelAndTireModel
+from model_cache import ModelCache, cache_stats, clear_all
+from team import TeamRegistry
+
+
+def test_lru_eviction_and_counters():
+    cache = ModelCache("test.lru", max_entries=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1          # "b" is now the least recently used
+    cache["c"] = 3
+    assert "b" not in cache and len(cache) == 2
+    assert cache.get("b") is None
+    with pytest.raises(KeyError):
+        cache["b"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache_stats().loc["test.lru", "size"] == 2
+
+    with cache.scope():
+        cache["d"] = 4
+        assert cache.get("d") == 4
+    assert "d" not in cache and "c" in cache  # "a" was evicted to make room
+
+    clear_all()
+    assert len(cache) == 0 and cache.stats()["hits"] == 0
+
+
+def test_shared_between_threads_and_forks():
+    cache = ModelCache("test.threads", max_entries=8)
+    created = []
+
+    def create():
+        created.append(1)
+        return object()
+
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(cache.get_or_create("k", create))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(v is values[0] for v in values)
+
+    if not hasattr(os, "fork"):
+        return
+    # Fork while another thread holds the lock: the child must not deadlock
+    locked, release = threading.Event(), threading.Event()
+
+    def hold():
+        with cache._lock:
+            locked.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    locked.wait()
+    pid = os.fork()
+    if pid == 0:
+        cache["child"] = 1
+        os._exit(0 if cache.get("k") is values[0] else 1)
+    release.set()
+    holder.join()
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert "child" not in cache
+
+
+def test_models_cache_compact_parameters(synthetic_db):
+    from data_loader import DataLoader
+    dataframes = DataLoader(synthetic_db).load_data()
+    FuelAndTireModel.cache.clear()
+    first = FuelAndTireModel(2016, 1, 21, dataframes)
+    first.fit()
+    second = FuelAndTireModel(2016, 1, 21, dataframes)
+    second.fit()
+
+    entry = FuelAndTireModel.cache.get((1, 21, 2016))
+    assert set(entry) == {"params", "variability"}
+    assert second.model is None and second.params.equals(first.params)
+    assert FuelAndTireModel.cache.stats()["hits"] == 2
+    assert TeamRegistry.get_team("Ferrari") is TeamRegistry.get_team("Ferrari")
+    FuelAndTireModel.cache.clear()
@@ -0,0 +1,46 @@
+# tests/test_qmc_sampling.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_simulator import MonteCarloSimulator
+
+NUM_SIMULATIONS = 256
+REPLICATIONS = 8
+
+
+@pytest.fixture
+def simulator(synthetic_db, strategies) -> MonteCarloSimulator:
+    return MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False, seed=11)
+
+
+def test_sobol_inputs_have_the_kernel_laws(simulator):
+    sampler = simulator.sobol_sampler()
+    noise, u_dnf, u_sc, u_pit, lap_factor = sampler.draw(1024)
+    assert abs(noise.mean()) < 0.01 and abs(noise.std() - 1) < 0.01
+    # Rotated noises stay uncorrelated across laps
+    assert np.abs(np.corrcoef(noise[:, :, 0].T) - np.eye(noise.shape[1])).max() < 0.15
+    for u in (u_dnf, u_sc, u_pit):
+        assert 0 < u.min() and u.max() < 1 and abs(u.mean() - 0.5) < 0.01
+    assert (lap_factor == 1).all()
+    with pytest.raises(ValueError):
+        sampler.draw(100)
+
+
+def test_replications_are_more_accurate_than_random_draws(simulator):
+    qmc = simulator.sobol_sampler().estimate(NUM_SIMULATIONS, REPLICATIONS, compiled=False)
+
+    # Same budget of independent draws, split into as many batches
+    arrays = simulator.race_arrays()
+    means = []
+    for r in range(REPLICATIONS):
+        outcomes = arrays.simulate(range(r * NUM_SIMULATIONS, (r + 1) * NUM_SIMULATIONS), seed=11, compiled=False)
+        means.append(outcomes.groupby("driver_id")["final_position"].mean())
+    means = pd.concat(means, axis=1)
+    random_se = means.std(axis=1, ddof=1) / np.sqrt(REPLICATIONS)
+
+    assert qmc["position_se"].mean() < 0.7 * random_se.mean()
+    # Both estimate the same expected positions
+    assert np.allclose(qmc["position"], means.mean(axis=1), atol=4 * random_se.max())
+    assert qmc["position"].sum() == pytest.approx(sum(range(1, len(qmc) + 1)))
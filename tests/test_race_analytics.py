@@ -0,0 +1,74 @@
+# tests/test_race_analytics.py
+
+import numpy as np
+import pandas as pd
+
+from race_analytics import RaceAnalytics, clopper_pearson
+
+
+def make_outcomes(n_sims=2000, n_drivers=5, seed=0):
+    rng = np.random.default_rng(seed)
+    pace = rng.normal(0, 1, (n_sims, n_drivers)) + np.arange(n_drivers) * 0.5
+    positions = pace.argsort(axis=1).argsort(axis=1) + 1
+    dnf = rng.random((n_sims, n_drivers)) < 0.1
+    return pd.DataFrame({
+        "simulation_id": np.repeat(np.arange(n_sims), n_drivers),
+        "driver_id": np.tile(np.arange(n_drivers) + 10, n_sims),
+        "final_position": positions.ravel(),
+        "dnf_lap": np.where(dnf.ravel(), 20.0, np.nan),
+    })
+
+
+def test_matrices_match_groupby():
+    outcomes = make_outcomes()
+    analytics = RaceAnalytics(outcomes.sample(frac=1.0, random_state=1))
+
+    expected = pd.crosstab(outcomes["driver_id"], outcomes["final_position"], normalize="index")
+    np.testing.assert_allclose(analytics.position_matrix().to_numpy(), expected.to_numpy())
+
+    wide = outcomes.pivot(index="simulation_id", columns="driver_id", values="final_position")
+    h2h = analytics.head_to_head()
+    assert h2h.loc[10, 12] == (wide[10] < wide[12]).mean()
+    np.testing.assert_allclose(h2h + h2h.T + np.eye(5), 1.0)
+    assert analytics.p_ahead(10, 12) == h2h.loc[10, 12]
+
+    finish = analytics.finish_probabilities(confidence=0.95)
+    winners = outcomes[(outcomes["final_position"] == 1) & outcomes["dnf_lap"].isna()]
+    assert finish.loc[10, "p_win"] == (winners["driver_id"] == 10).sum() / 2000
+    assert (finish["p_win_low"] <= finish["p_win"]).all() and (finish["p_win"] <= finish["p_win_high"]).all()
+
+
+def test_clopper_pearson_edges():
+    lower, upper = clopper_pearson(np.array([0, 10]), 10, 0.95)
+    assert lower[0] == 0.0 and upper[1] == 1.0
+    assert np.isclose(upper[0], 1 - 0.025 ** (1 / 10))
+
+
+def test_weighted_head_to_head():
+    outcomes = make_outcomes(n_sims=500)
+    weights = np.random.default_rng(2).exponential(1.0, 500)
+    outcomes["weight"] = weights[outcomes["simulation_id"]]
+    analytics = RaceAnalytics(outcomes)
+
+    wide = outcomes.pivot(index="simulation_id", columns="driver_id", values="final_position")
+    h2h = analytics.head_to_head()
+    for driver_id in wide.columns:
+        for rival_id in wide.columns:
+            expected = ((wide[driver_id] < wide[rival_id]) * weights).sum() / 500
+            assert np.isclose(h2h.loc[driver_id, rival_id], expected)
+    assert np.isclose(analytics.p_ahead(10, 12), h2h.loc[10, 12])
+
+
+def test_ordered_and_shuffled_outcomes_agree():
+    # 2000 simulations span two head-to-head blocks, the last one partial
+    outcomes = make_outcomes()
+    ordered = RaceAnalytics(outcomes)
+    shuffled = RaceAnalytics(outcomes.sample(frac=1.0, random_state=3))
+    assert ordered.num_simulations == shuffled.num_simulations == 2000
+    pd.testing.assert_frame_equal(ordered.finish_probabilities(), shuffled.finish_probabilities())
+
+    wide = outcomes.pivot(index="simulation_id", columns="driver_id", values="final_position").to_numpy()
+    expected = (wide[:, :, None] < wide[:, None, :]).sum(axis=0)
+    np.testing.assert_array_equal(ordered.head_to_head_counts(), expected)
+    np.testing.assert_array_equal(shuffled.head_to_head_counts(), expected)
+    np.testing.assert_array_equal(ordered.position_counts(), shuffled.position_counts())
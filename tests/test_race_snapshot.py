@@ -0,0 +1,119 @@
+# tests/test_race_snapshot.py
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_simulator import MonteCarloSimulator
+from race_snapshot import RaceSnapshot
+from run import Run
+
+# After the lap 7 stop of the `strategies` fixture
+SNAPSHOT_LAP = 8
+
+
+@pytest.fixture
+def context(synthetic_db, strategies):
+    return MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False).get_context()
+
+
+def make_run(context, strategies, test_mode=False) -> Run:
+    return Run(2016, "Austin", context.dataframes, strategies, test_mode=test_mode, context=context)
+
+
+def test_dict_round_trip(context, strategies):
+    np.random.seed(0)
+    snapshot = make_run(context, strategies).run_until(SNAPSHOT_LAP)
+    restored = RaceSnapshot.from_dict(json.loads(json.dumps(snapshot.to_dict())))
+    assert (restored.season, restored.gp_location, restored.lap) == (2016, "Austin", SNAPSHOT_LAP)
+    assert restored.drivers == snapshot.drivers
+    assert restored.to_dict() == snapshot.to_dict()
+    with pytest.raises(ValueError, match="Incomplete"):
+        RaceSnapshot(2016, "Austin", 1, {1: {"alive": True}})
+
+
+def test_continuation_of_an_unchanged_race(context, strategies):
+    # Test mode has no lap time noise: after the last stop, a continuation
+    # reproduces the uninterrupted race exactly
+    np.random.seed(1)
+    full = make_run(context, strategies, test_mode=True)
+    full.run()
+    np.random.seed(1)
+    snapshot = make_run(context, strategies, test_mode=True).run_until(SNAPSHOT_LAP)
+    np.random.seed(2)
+    resumed = Run.from_snapshot(context, snapshot, test_mode=True)
+    resumed.run()
+    pd.testing.assert_frame_equal(resumed.outcomes, full.outcomes)
+    assert resumed.laps_summary["lap"].min() == SNAPSHOT_LAP + 1
+
+    # Random continuations depend only on the seed
+    outcomes = []
+    for _ in range(2):
+        np.random.seed(3)
+        resumed = Run.from_snapshot(context, snapshot)
+        resumed.run()
+        outcomes.append(resumed.outcomes)
+    pd.testing.assert_frame_equal(outcomes[0], outcomes[1])
+
+
+def test_strategy_override_resumes_from_the_first_pending_stop(context, strategies):
+    for seed in range(50):
+        np.random.seed(seed)
+        snapshot = make_run(context, strategies).run_until(SNAPSHOT_LAP)
+        if snapshot.drivers[1]["alive"]:
+            break
+    two_stops = {
+        **strategies["Lewis Hamilton"],
+        2: {"compound": "A1", "pitstop_interval": [11, 11], "pit_stop_lap": 11, "tire_age": 0},
+    }
+    assert snapshot._first_pending_stop(two_stops) == 2
+    late_first_stop = {**two_stops, 1: {**two_stops[1], "pitstop_interval": [10, 10], "pit_stop_lap": 10}}
+    assert snapshot._first_pending_stop(late_first_stop) == 1
+    assert snapshot._first_pending_stop({"starting_compound": "A3"}) == 1
+
+    resumed = Run.from_snapshot(context, snapshot, {**strategies, "Lewis Hamilton": two_stops})
+    drivers = {d.name: d for d in resumed.drivers_list}
+    assert drivers["Lewis Hamilton"].next_pit_stop == 2
+    resumed.run()
+    if drivers["Lewis Hamilton"].alive:
+        assert drivers["Lewis Hamilton"].compound == "A1"
+    # The other drivers running at the snapshot keep their one-stop race
+    running = [d for d in resumed.drivers_list if snapshot.drivers[int(d.driver_id)]["alive"]]
+    assert all(d.compound == "A2" for d in running if d.name != "Lewis Hamilton")
+
+
+def test_retired_drivers_stay_retired(context, strategies):
+    for seed in range(50):
+        np.random.seed(seed)
+        snapshot = make_run(context, strategies).run_until(SNAPSHOT_LAP)
+        retired = {driver_id: state for driver_id, state in snapshot.drivers.items() if not state["alive"]}
+        if retired:
+            break
+    assert retired
+
+    for seed in range(5):
+        np.random.seed(seed)
+        resumed = Run.from_snapshot(context, snapshot)
+        resumed.run()
+        outcomes = resumed.outcomes.set_index("driver_id")
+        laps = resumed.laps_summary
+        for driver_id, state in retired.items():
+            assert outcomes.loc[driver_id, "dnf_lap"] == state["earliest_dnf_lap"]
+            running = laps[(laps["driver_id"] == driver_id) & (laps["status"] == "running")]
+            assert running.empty
+
+
+def test_seeded_continuations_are_reproducible(synthetic_db, strategies):
+    simulator = MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, num_simulations=4, verbose=False, seed=5
+    )
+    np.random.seed(0)
+    snapshot = make_run(simulator.get_context(), strategies).run_until(SNAPSHOT_LAP)
+    np.random.seed(1)
+    first = simulator.run_from_snapshot(snapshot)
+    np.random.seed(2)
+    second = simulator.run_from_snapshot(snapshot)
+    pd.testing.assert_frame_equal(first, second)
+    assert first.groupby("simulation_id")["cumulative_time"].sum().nunique() == 4
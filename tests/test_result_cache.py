@@ -0,0 +1,113 @@
+# tests/test_result_cache.py
+
+import os
+
+import pandas as pd
+import pytest
+
+import monte_carlo_simulator
+from aggregate_store import AggregateStore
+from monte_carlo_simulator import MonteCarloSimulator
+from result_cache import ResultCache
+from results_sink import ResultsReader, ResultsWriter
+
+
+def make_simulator(synthetic_db, strategies, num_simulations, cache=None, seed=7):
+    return MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, num_simulations=num_simulations,
+        verbose=False, seed=seed, cache=cache,
+    )
+
+
+def test_checkpoint_holds_the_cached_prefix(synthetic_db, strategies, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    checkpoint = str(tmp_path / "run.ckpt")
+    make_simulator(synthetic_db, strategies, 2, cache).run_simulation()
+    make_simulator(synthetic_db, strategies, 4, cache).run_simulation(checkpoint_path=checkpoint)
+
+    # Resuming from the checkpoint alone gives the whole campaign
+    resumed = make_simulator(synthetic_db, strategies, 4)
+    resumed.run_simulation(checkpoint_path=checkpoint)
+    reference = make_simulator(synthetic_db, strategies, 4)
+    reference.run_simulation()
+    assert sorted(resumed.final_outcomes["simulation_id"].unique()) == [0, 1, 2, 3]
+    pd.testing.assert_frame_equal(resumed.final_outcomes, reference.final_outcomes)
+
+
+def test_get_put_and_corrupt_entries(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    outcomes = pd.DataFrame({"simulation_id": [0, 0, 1, 1], "driver_id": [1, 2, 1, 2], "final_position": [1, 2, 2, 1]})
+    assert cache.get("missing") is None
+    cache.put("key", outcomes)
+    pd.testing.assert_frame_equal(cache.get("key"), outcomes)
+
+    # A truncated entry is a miss and is removed
+    path = os.path.join(str(tmp_path), "key.pkl")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    assert cache.get("key") is None
+    assert not os.path.exists(path)
+    with open(path, "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.get("key") is None and cache.size_bytes() == 0
+
+
+def test_lru_eviction(tmp_path):
+    outcomes = pd.DataFrame({"simulation_id": range(1000), "final_position": 1.0})
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 40)
+    cache.put("a", outcomes)
+    entry_size = cache.size_bytes()
+    cache.max_bytes = int(2.5 * entry_size)
+    cache.put("b", outcomes)
+    path_a = os.path.join(str(tmp_path), "a.pkl")
+    os.utime(path_a, ns=(1, 1))
+    os.utime(os.path.join(str(tmp_path), "b.pkl"), ns=(2, 2))
+    assert cache.get("a") is not None      # "a" becomes the most recently used
+    cache.put("c", outcomes)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_prefix_reuse_and_key_stability(synthetic_db, strategies, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    short = make_simulator(synthetic_db, strategies, 2, cache)
+    long = make_simulator(synthetic_db, strategies, 4, cache)
+    # The number of simulations is not part of the key, the seed is
+    assert short.cache_key() == long.cache_key()
+    assert short.cache_key() != make_simulator(synthetic_db, strategies, 2, cache, seed=8).cache_key()
+    short.run_simulation()
+
+    simulated = []
+    original = long.simulate
+    long.simulate = lambda sim_id: simulated.append(sim_id) or original(sim_id)
+    long.run_simulation()
+    assert simulated == [2, 3]
+    reference = make_simulator(synthetic_db, strategies, 4)
+    reference.run_simulation()
+    pd.testing.assert_frame_equal(long.final_outcomes, reference.final_outcomes)
+    assert cache.get(long.cache_key())["simulation_id"].nunique() == 4
+
+
+def test_key_follows_model_sources_and_aggregates(synthetic_db, strategies, tmp_path, monkeypatch):
+    simulator = make_simulator(synthetic_db, strategies, 2)
+    key = simulator.cache_key()
+    simulator.aggregates = AggregateStore(str(tmp_path / "aggregates.sqlite"))
+    assert simulator.cache_key() != key
+    simulator.aggregates = None
+    monkeypatch.setattr(monte_carlo_simulator, "MODEL_MODULES", monte_carlo_simulator.MODEL_MODULES[1:])
+    assert simulator.cache_key() != key
+
+
+def test_streams_are_filled_on_a_cache_hit(synthetic_db, strategies, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    make_simulator(synthetic_db, strategies, 3, cache).run_simulation()
+
+    simulator = make_simulator(synthetic_db, strategies, 3, cache)
+    bands = simulator.trajectory_bands(reservoir_size=2)
+    directory = str(tmp_path / "results")
+    with ResultsWriter(directory) as writer:
+        simulator.run_simulation(sink=writer, trajectories=bands)
+    assert bands.num_simulations == 3
+    streamed = ResultsReader(directory).read()
+    assert sorted(streamed["simulation_id"].unique()) == [0, 1, 2]
+    assert len(streamed) == len(simulator.final_outcomes)
@@ -0,0 +1,48 @@
+# tests/test_results_sink.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from results_sink import ResultsReader, ResultsWriter
+
+
+def outcomes_of(sim_id):
+    return pd.DataFrame({
+        "driver_id": [1, 2, 3],
+        "driver_name": ["A", "B", "C"],
+        "final_position": [1 + (sim_id + k) % 3 for k in range(3)],
+        "cumulative_time": [5000.0 + sim_id + k for k in range(3)],
+        "dnf_lap": [None, 12 if sim_id % 2 else None, None],
+    })
+
+
+def test_write_then_read_per_driver(tmp_path):
+    directory = str(tmp_path / "results")
+    with ResultsWriter(directory, buffer_rows=7) as writer:
+        for sim_id in range(10):
+            writer.write(sim_id, outcomes_of(sim_id))
+
+    reader = ResultsReader(directory)
+    assert reader.drivers() == [1, 2, 3]
+    times = reader.column(2, "cumulative_time")
+    assert isinstance(times, np.memmap)
+    np.testing.assert_allclose(times, 5001.0 + np.arange(10))
+    dnf = reader.read(driver_ids=[2], columns=["simulation_id", "dnf_lap"])
+    assert dnf["dnf_lap"].isna().tolist() == [sim_id % 2 == 0 for sim_id in range(10)]
+
+
+def test_uncommitted_rows_are_dropped(tmp_path):
+    directory = str(tmp_path / "results")
+    with ResultsWriter(directory) as writer:
+        writer.write(0, outcomes_of(0))
+    # Bytes appended by a flush that never committed its manifest
+    with open(os.path.join(directory, "outcomes", "driver_1", "cumulative_time.bin"), "ab") as f:
+        f.write(np.zeros(5).tobytes())
+
+    with ResultsWriter(directory) as writer:
+        writer.write(1, outcomes_of(1))
+
+    np.testing.assert_array_equal(ResultsReader(directory).column(1, "simulation_id"), [0, 1])
+    np.testing.assert_allclose(ResultsReader(directory).column(1, "cumulative_time"), [5000.0, 5001.0])
@@ -0,0 +1,88 @@
+# tests/test_safety_car_model.py
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DataLoader
+from monte_carlo_simulator import MonteCarloSimulator
+from race_snapshot import RaceSnapshot
+from run import Run
+from safety_car_model import SC, SafetyCarModel
+
+
+def small_model() -> SafetyCarModel:
+    # Two 10-lap races (one lap per progress bin), one 2-lap SC on laps 3-4
+    dataframes = {
+        "races": pd.DataFrame({"id": [1, 2], "season": [2015, 2015], "location": ["Monza", "Monza"], "nolapsplanned": [10, 10]}),
+        "fcyphases": pd.DataFrame({"race_id": [1], "startlap": [3], "endlap": [4], "type": ["SC"]}),
+    }
+    return SafetyCarModel.from_dataframes(dataframes)
+
+
+def test_tables():
+    model = small_model()
+    expected = np.zeros(SafetyCarModel.N_BINS)
+    expected[2] = 0.5
+    assert np.allclose(model.hazard[model.locations.index("Monza")], expected)
+    assert model.p_vsc[0] == 0
+    assert model.durations[0, 1] == 1
+
+
+def test_sample(tmp_path):
+    model = small_model()
+    model.save(str(tmp_path / "sc.npz"))
+    model = SafetyCarModel.load(str(tmp_path / "sc.npz"))
+    np.random.seed(0)
+    # Unknown locations use the all-track table
+    phases = model.sample("Spa", 10, size=4000)
+    assert abs((phases[:, 3] == SC).mean() - 0.5) < 0.03
+    assert np.array_equal(phases[:, 3], phases[:, 4])
+    assert not phases[:, [1, 2, 5, 6, 7, 8, 9, 10]].any()
+    assert not model.sample("Monza", 10, from_lap=4, size=100).any()
+
+
+def test_simulator_draws_phases_from_the_model(synthetic_db, strategies):
+    tables = DataLoader(synthetic_db).load_data(seasons=[2014, 2015])
+    model = SafetyCarModel.from_dataframes(tables)
+    mc = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, 1, verbose=False, seed=0, safety_car_model=model)
+    plain = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, 1, verbose=False, seed=0)
+    assert mc.configuration_key() != plain.configuration_key()
+    fcy_laps = 0
+    for sim_id in range(30):
+        sim = mc.simulate(sim_id)
+        fcy_laps += len(sim.safety_car_laps) + len(sim.vsc_laps)
+        assert set(sim.safety_car_laps).isdisjoint(sim.vsc_laps)
+    assert fcy_laps > 0
+
+
+def test_snapshot_keeps_the_ongoing_vsc_phase(synthetic_db, strategies):
+    # Phases start often and last 6 laps; half of them are VSC
+    durations = np.zeros((2, SafetyCarModel.MAX_DURATION))
+    durations[:, 5] = 1.0
+    model = SafetyCarModel([""], np.full((1, SafetyCarModel.N_BINS), 0.3), [0.5], durations)
+    context = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False).get_context()
+
+    np.random.seed(3)
+    for _ in range(50):
+        sim = Run(2016, "Austin", context.dataframes, strategies, context=context, safety_car_model=model)
+        sim._start()
+        if sim.vsc_laps and min(sim.vsc_laps) + 5 <= sim.number_of_laps:
+            break
+    lap = min(sim.vsc_laps) + 1
+    sim.simulate_laps(lap)
+    snapshot = RaceSnapshot.from_dict(json.loads(json.dumps(sim.snapshot().to_dict())))
+    # The rest of the phase (and of any phase right after it)
+    ongoing = list(range(lap + 1, lap + 5))
+    while ongoing[-1] + 1 in sim.vsc_laps:
+        ongoing.append(ongoing[-1] + 1)
+    assert snapshot.vsc_laps == ongoing and snapshot.safety_car_laps == []
+
+    for seed in range(20):
+        np.random.seed(seed)
+        resumed = Run.from_snapshot(context, snapshot, safety_car_model=model)
+        assert set(ongoing) <= set(resumed.vsc_laps)
+        # No other phase starts before the ongoing one ends
+        assert not set(ongoing) & set(resumed.safety_car_laps)
+        resumed.run()
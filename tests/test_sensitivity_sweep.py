@@ -0,0 +1,57 @@
+# tests/test_sensitivity_sweep.py
+
+import pandas as pd
+
+from monte_carlo_simulator import MonteCarloSimulator
+from sensitivity_sweep import SensitivitySweep
+
+NUM_SIMULATIONS = 8
+
+
+def test_sweep_summary_and_seeding(synthetic_db, strategies):
+    simulator = MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, num_simulations=NUM_SIMULATIONS, verbose=False, seed=3,
+        parameters={"pit_loss_offset": 10.0},
+    )
+    grid = {"pit_loss_offset": [0.0, 10.0, 20.0]}
+    sweep = SensitivitySweep(
+        simulator.get_context(), grid, strategies, num_simulations=NUM_SIMULATIONS, seed=3
+    )
+    summary = sweep.run()
+    assert list(summary.columns) == [
+        "grid_id", "pit_loss_offset", "driver_id", "driver_name",
+        "mean_position", "std_position", "mean_time", "std_time", "dnf_rate",
+    ]
+    assert len(summary) == 3 * len(strategies)
+
+    # Common random numbers: a longer pit stop raises every driver's mean time
+    mean_time = summary.pivot(index="driver_id", columns="pit_loss_offset", values="mean_time")
+    assert (mean_time[10.0] > mean_time[0.0]).all() and (mean_time[20.0] > mean_time[10.0]).all()
+
+    # A grid point gives the outcomes of the simulator with its parameters
+    simulator.run_simulation()
+    point = sweep.outcomes[sweep.outcomes["pit_loss_offset"] == 10.0]
+    columns = list(simulator.final_outcomes.columns)
+    pd.testing.assert_frame_equal(point[columns].reset_index(drop=True), simulator.final_outcomes)
+
+    parallel = SensitivitySweep(
+        simulator.get_context(), grid, strategies, num_simulations=NUM_SIMULATIONS, n_jobs=2, seed=3
+    )
+    pd.testing.assert_frame_equal(parallel.run(), summary)
+
+
+def test_unseeded_sweep_shares_one_seed(synthetic_db, strategies):
+    context = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False).get_context()
+    grid = {"pit_loss_offset": [0.0, 0.0]}
+    sweep = SensitivitySweep(context, grid, strategies, num_simulations=4, n_jobs=2)
+    sweep.run()
+    # Both points get the same races, and their simulations are not duplicates
+    first, second = (sweep.outcomes[sweep.outcomes["grid_id"] == i] for i in range(2))
+    columns = ["simulation_id", "driver_id", "cumulative_time"]
+    pd.testing.assert_frame_equal(first[columns].reset_index(drop=True), second[columns].reset_index(drop=True))
+    times = first.pivot(index="simulation_id", columns="driver_id", values="cumulative_time")
+    assert not times.duplicated().any()
+
+    seeded = SensitivitySweep(context, grid, strategies, num_simulations=4, seed=sweep.run_seed)
+    seeded.run()
+    pd.testing.assert_frame_equal(seeded.summary, sweep.summary)
@@ -0,0 +1,33 @@
+# tests/test_shared_tables.py
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from shared_tables import SharedTables, export_tables
+
+
+def test_exported_tables_are_shared_views(tmp_path):
+    dataframes = {
+        "laps": pd.DataFrame({
+            "race_id": np.repeat([1, 2], 3).astype(np.int16),
+            "laptime": np.linspace(90, 95, 6),
+            "compound": pd.Categorical(["A2", "A3", "A3", "A2", "A2", "A3"]),
+        }),
+        "drivers": pd.DataFrame({"id": [1, 2], "name": ["Lewis Hamilton", "Nico Rosberg"]}),
+    }
+
+    tables = export_tables(dataframes, str(tmp_path))
+
+    for name, df in dataframes.items():
+        pd.testing.assert_frame_equal(tables[name], df, check_dtype=False)
+    laps = tables["laps"]
+    assert laps["race_id"].dtype == np.int16
+    assert not laps["laptime"].to_numpy().flags.writeable
+
+    # Pickling only carries the directory, the copy attaches to the same files
+    restored = pickle.loads(pickle.dumps(tables))
+    assert len(pickle.dumps(tables)) < 200
+    assert isinstance(restored, SharedTables)
+    pd.testing.assert_frame_equal(restored["laps"][restored["laps"]["race_id"] == 2], laps[laps["race_id"] == 2])
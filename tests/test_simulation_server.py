@@ -0,0 +1,96 @@
+# tests/test_simulation_server.py
+
+import asyncio
+
+import numpy as np
+
+import simulation_server
+from simulation_server import SimulationServer, query
+
+_simulate_chunk = simulation_server._simulate_chunk
+
+
+def failing_chunk(race, driver_strategies, parameters, test_mode, seed, first_sim_id, num_simulations):
+    # Runs in the worker processes: seed 13 stands for a crashing simulation
+    if seed == 13:
+        raise RuntimeError("simulation crashed")
+    return _simulate_chunk(race, driver_strategies, parameters, test_mode, seed, first_sim_id, num_simulations)
+
+
+async def _messages(request, port):
+    return [message async for message in query(request, port=port)]
+
+
+def test_streams_distribution_and_worker_errors(synthetic_db, strategies, monkeypatch):
+    monkeypatch.setattr(simulation_server, "_simulate_chunk", failing_chunk)
+    server = SimulationServer(synthetic_db, [(2016, "Austin")], workers=1, port=0)
+    request = {
+        "season": 2016, "gp_location": "Austin", "driver_strategies": strategies,
+        "num_simulations": 6, "chunk_size": 2, "seed": 1,
+    }
+
+    async def scenario():
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+
+        async def collect(req):
+            # A dropped reply would otherwise hang the test
+            return await asyncio.wait_for(_messages(req, port), timeout=120)
+
+        try:
+            failed = await collect({**request, "seed": 13})
+            unknown = await collect({**request, "gp_location": "Monza"})
+            answered = await collect(request)
+        finally:
+            await server.close()
+        return failed, unknown, answered
+
+    failed, unknown, answered = asyncio.run(scenario())
+    assert failed == [{"type": "error", "message": "simulation crashed"}]
+    assert unknown[-1]["type"] == "error" and "not loaded" in unknown[-1]["message"]
+
+    assert [m["type"] for m in answered] == ["chunk"] * 3 + ["done"]
+    assert [m["simulations"] for m in answered] == [2, 4, 6, 6]
+    drivers = answered[-1]["drivers"]
+    assert len(drivers) == 6
+    for stats in drivers.values():
+        assert np.isclose(sum(stats["position_probabilities"]), 1.0)
+        assert 0.0 <= stats["dnf_rate"] <= 1.0
+    # Positions are a permutation in every simulation
+    probabilities = np.array([stats["position_probabilities"] for stats in drivers.values()])
+    assert np.allclose(probabilities.sum(axis=0), 1.0)
+
+
+def test_unseeded_chunks_are_independent(synthetic_db, strategies, monkeypatch):
+    chunks = []
+    update = simulation_server.OutcomeDistribution.update
+
+    def record(self, columns):
+        chunks.append(columns["cumulative_time"])
+        update(self, columns)
+
+    monkeypatch.setattr(simulation_server.OutcomeDistribution, "update", record)
+    server = SimulationServer(synthetic_db, [(2016, "Austin")], workers=2, port=0)
+    request = {
+        "season": 2016, "gp_location": "Austin", "driver_strategies": strategies,
+        "num_simulations": 4, "chunk_size": 1,
+    }
+
+    async def scenario():
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            unseeded = await asyncio.wait_for(_messages(request, port), timeout=120)
+            replayed = await asyncio.wait_for(
+                _messages({**request, "seed": unseeded[-1]["seed"]}, port), timeout=120
+            )
+        finally:
+            await server.close()
+        return unseeded, replayed
+
+    unseeded, replayed = asyncio.run(scenario())
+    # Forked workers must not replay the same random stream
+    assert len({tuple(times) for times in chunks[:4]}) == 4
+    # The reported seed reproduces the query
+    assert sorted(map(tuple, chunks[4:])) == sorted(map(tuple, chunks[:4]))
+    assert replayed[-1]["seed"] == unseeded[-1]["seed"]
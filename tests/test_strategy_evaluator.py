@@ -0,0 +1,51 @@
+# tests/test_strategy_evaluator.py
+
+import numpy as np
+import pytest
+from scipy.stats import fisk
+
+from data_loader import DataLoader
+from monte_carlo_simulator import MonteCarloSimulator
+from safety_car_model import SafetyCarModel
+from strategy_evaluator import fisk_moment
+
+
+def test_fisk_moments():
+    assert np.isclose(fisk_moment(3.0, 1), fisk(c=3.0).mean())
+    assert np.isclose(fisk_moment(3.0, 2), fisk(c=3.0).moment(2))
+    assert fisk_moment(1.5, 2) == np.inf
+
+
+def test_stints_follow_run_pit_triggers(synthetic_db, strategies):
+    evaluator = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False).evaluator()
+    strategy = {
+        "starting_compound": "A3",
+        "starting_tire_age": 2,
+        1: {"compound": "A2", "pitstop_interval": [4, 6], "pit_stop_lap": 5, "tire_age": 0},
+        2: {"compound": "A3", "pitstop_interval": [9, 9], "pit_stop_lap": 10, "tire_age": 1},
+    }
+    assert evaluator.stints(strategy) == [(1, 4, "A3", 2), (5, 10, "A2", 0), (11, 15, "A3", 1)]
+
+
+@pytest.mark.parametrize("fcy", ["dnf", "model"])
+def test_expected_time_matches_simulation(synthetic_db, fcy):
+    # No pit stop: the fitted pit stop laws of the synthetic teams are heavy-tailed
+    no_stop = {"starting_compound": "A3", "starting_tire_age": 2}
+    names = ["Lewis Hamilton", "Nico Rosberg", "Kimi Raikkonen"]
+    safety_car_model = None
+    if fcy == "model":
+        safety_car_model = SafetyCarModel.from_dataframes(DataLoader(synthetic_db).load_data(seasons=[2014, 2015]))
+    mc = MonteCarloSimulator(
+        2016, "Austin", synthetic_db, {n: no_stop for n in names}, verbose=False, safety_car_model=safety_car_model
+    )
+    expected = mc.evaluator().evaluate_all({n: no_stop for n in names})
+
+    outcomes = mc.race_arrays().simulate(range(5000), seed=1, compiled=False)
+    finishers = outcomes[outcomes["dnf_lap"].isna()]
+    simulated = finishers.groupby("driver_id")["cumulative_time"].agg(["mean", "std"])
+    simulated = simulated.loc[expected.index]
+    assert np.allclose(expected["expected_time"], simulated["mean"], rtol=0.002)
+    # The standard deviation is dominated by the safety car phases
+    assert np.allclose(expected["std"], simulated["std"], rtol=0.05)
+    dnf_rate = outcomes.groupby("driver_id")["dnf_lap"].apply(lambda x: x.isna().mean()).loc[expected.index]
+    assert np.allclose(expected["p_finish"], dnf_rate, atol=0.04)
@@ -0,0 +1,42 @@
+# tests/test_strategy_surrogate.py
+
+import numpy as np
+import pytest
+
+from monte_carlo_simulator import MonteCarloSimulator
+from strategy_surrogate import StrategySpace, StrategySurrogate
+
+
+@pytest.fixture
+def surrogate(synthetic_db, strategies) -> StrategySurrogate:
+    mc = MonteCarloSimulator(2016, "Austin", synthetic_db, strategies, verbose=False, seed=0)
+    return StrategySurrogate(mc, "Nico Rosberg", num_simulations=128, seed=1)
+
+
+def test_strategy_space():
+    space = StrategySpace(15, ["A3", "A2"], min_stops=1, max_stops=2, min_stint=3)
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        strategy = space.sample(rng)
+        laps = [1] + [strategy[k]["pit_stop_lap"] for k in range(1, len(strategy) - 1)] + [16]
+        assert all(b - a >= 3 for a, b in zip(laps[1:-1], laps[2:]))
+        assert laps[1] >= 3 and laps[-2] <= 12
+    x = space.features(StrategySpace.strategy([5], ["A3", "A2"], starting_tire_age=2))
+    # 5 laps of A3 aged 3..7, 10 laps of A2 aged 1..10, one stop
+    np.testing.assert_allclose(x, [5 / 15, 10 / 15, 25 / 225, 55 / 225, 1])
+
+
+def test_fit_predict_and_query(surrogate):
+    errors = surrogate.fit(num_strategies=20, num_validation=6)
+    assert errors["position_rmse"] < 0.25
+    assert errors["position_coverage"] >= 0.5
+    assert len(surrogate.validation) == 6
+
+    strategy = StrategySpace.strategy([9], ["A3", "A2"])
+    simulated = surrogate.query(strategy, max_position_std=0.0)
+    assert simulated["source"] == "simulator"
+    assert len(surrogate.training) == 21
+    # Close to a simulated strategy, the emulator answers
+    answered = surrogate.query(strategy, max_position_std=0.2)
+    assert answered["source"] == "surrogate"
+    assert answered["position"] == pytest.approx(simulated["position"], abs=0.2)
@@ -0,0 +1,66 @@
+# tests/test_traffic_model.py
+
+import numpy as np
+
+from traffic_model import TrafficModel
+
+
+def reference_apply(model, cumulative_times, lap_times, alive, uniforms):
+    """Car-by-car loop version of TrafficModel.apply."""
+    adjusted = lap_times.copy()
+    for s in range(lap_times.shape[0]):
+        order = np.argsort(np.where(alive[s], cumulative_times[s], np.inf), kind="stable")
+        ahead = None
+        for i in order:
+            if not alive[s, i]:
+                continue
+            start, lap = cumulative_times[s, i], lap_times[s, i]
+            finish = start + lap
+            if ahead is not None:
+                gap = start - ahead["start"]
+                finish += model.traffic_loss * np.clip(1.0 - gap / model.traffic_window, 0.0, 1.0)
+                if uniforms[s, i] >= model.overtake_probability(ahead["lap"] - lap, gap):
+                    finish = max(finish, ahead["finish"] + model.min_gap)
+            adjusted[s, i] = finish - start
+            ahead = {"start": start, "lap": lap, "finish": finish}
+    return adjusted
+
+
+def test_apply_matches_reference_loop():
+    rng = np.random.default_rng(0)
+    n_sims, n_drivers = 50, 20
+    cumulative = 1000 + np.cumsum(rng.exponential(0.8, (n_sims, n_drivers)), axis=1)[:, rng.permutation(n_drivers)]
+    laps = 90 + rng.normal(0, 0.7, (n_sims, n_drivers))
+    alive = rng.random((n_sims, n_drivers)) > 0.1
+    uniforms = rng.random((n_sims, n_drivers))
+    model = TrafficModel()
+
+    adjusted = model.apply(cumulative, laps, alive, uniforms)
+
+    np.testing.assert_allclose(adjusted, reference_apply(model, cumulative, laps, alive, uniforms), atol=1e-9)
+    np.testing.assert_array_equal(adjusted[~alive], laps[~alive])
+
+
+def test_blocked_car_stays_behind():
+    model = TrafficModel(min_gap=0.3)
+    # Much faster car 0.2 s behind, but the overtake draw fails
+    adjusted = model.apply([[100.0, 100.2]], [[92.0, 90.0]], [[True, True]], uniforms=[[0.0, 1.0]])
+    assert 100.2 + adjusted[0, 1] >= 100.0 + adjusted[0, 0] + model.min_gap - 1e-12
+
+
+def test_larger_gap_lowers_overtake_probability():
+    model = TrafficModel()
+    advantage = np.full(4, 1.5)
+    probability = model.overtake_probability(advantage, np.array([0.0, 0.2, 0.5, 0.9]))
+    assert (np.diff(probability) < 0).all()
+    assert np.isclose(model.overtake_probability(model.overtake_delta), 0.5)
+
+    # Same pace advantage, the car further back passes less often
+    rng = np.random.default_rng(1)
+    uniforms = rng.random((2000, 2))
+    passes = []
+    for gap in (0.1, 0.6):
+        cumulative = np.tile([100.0, 100.0 + gap], (2000, 1))
+        adjusted = model.apply(cumulative, np.tile([91.5, 90.0], (2000, 1)), np.ones((2000, 2), bool), uniforms)
+        passes.append(np.mean(cumulative[:, 1] + adjusted[:, 1] < cumulative[:, 0] + adjusted[:, 0]))
+    assert passes[0] > passes[1]
@@ -0,0 +1,67 @@
+# tests/test_trajectory_bands.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_simulator import MonteCarloSimulator
+from trajectory_bands import TrajectoryBands
+
+NUM_SIMULATIONS = 60
+
+
+@pytest.fixture
+def simulator(synthetic_db, strategies) -> MonteCarloSimulator:
+    return MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, num_simulations=NUM_SIMULATIONS, verbose=False, seed=5
+    )
+
+
+def test_bands_match_exact_quantiles(simulator):
+    traces = [laps for _, laps in simulator._iter_simulations(0, NUM_SIMULATIONS)]
+    bands = simulator.trajectory_bands(reservoir_size=10)
+    for laps in traces:
+        bands.update(laps)
+
+    running = pd.concat(traces)
+    running = running[running["status"] == "running"].astype({"cumulative_lap_time": float, "position": int})
+    running["gap"] = running["cumulative_lap_time"] - running.groupby(
+        ["simulation_id", "lap"])["cumulative_lap_time"].transform("min")
+    grouped = running.groupby(["driver_id", "lap"])
+    gap = bands.bands("gap", (0.1, 0.5, 0.9)).set_index(["driver_id", "lap"])
+    position = bands.bands("position", (0.1, 0.5, 0.9)).set_index(["driver_id", "lap"])
+    for q in (0.1, 0.5, 0.9):
+        exact = grouped["gap"].quantile(q, interpolation="lower")
+        estimate = gap[f"q{q:g}"].reindex(exact.index)
+        above = exact >= bands.min_gap
+        assert (np.abs(estimate[above] / exact[above] - 1) <= bands.relative_accuracy + 1e-9).all()
+        assert (estimate[~above] == 0).all()
+        exact_position = grouped["position"].quantile(q, interpolation="lower")
+        assert (position[f"q{q:g}"].reindex(exact.index) == exact_position).all()
+    assert (gap["running"].reindex(grouped.size().index) == grouped.size()).all()
+
+    # Chunks summarized separately merge into the same summary
+    first, second = simulator.trajectory_bands(reservoir_size=10), simulator.trajectory_bands(reservoir_size=10)
+    first.update(pd.concat(traces[:25]))
+    for laps in traces[25:]:
+        second.update(laps)
+    first.merge(second)
+    assert (first.gap_counts == bands.gap_counts).all() and first.num_simulations == NUM_SIMULATIONS
+    pd.testing.assert_frame_equal(first.reservoir(), bands.reservoir())
+    sample = bands.reservoir()
+    assert sample["simulation_id"].nunique() == 10
+    sampled = running[running["simulation_id"] == sample["simulation_id"].iloc[0]]
+    assert len(sample[sample["simulation_id"] == sample["simulation_id"].iloc[0]]) == len(sampled)
+
+
+def test_memory_does_not_grow_with_simulations(simulator):
+    bands = simulator.trajectory_bands(reservoir_size=5)
+    simulator.run_simulation(trajectories=bands)
+    assert bands.num_simulations == NUM_SIMULATIONS
+    size = bands.nbytes
+    bands.merge(bands.__class__(bands.driver_ids, bands.num_laps, reservoir_size=5, seed=5))
+    assert bands.nbytes == size
+    # 20 drivers x 70 laps with 100 traces stay within a few MB
+    assert TrajectoryBands(range(20), 70, reservoir_size=100).nbytes < 4e6
+    with pytest.raises(ValueError):
+        bands.quantiles("lap_time")
@@ -0,0 +1,95 @@
+# tests/test_work_queue.py
+
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+import work_queue
+from monte_carlo_simulator import MonteCarloSimulator
+from work_queue import WorkQueue, run_worker
+
+SEED = 11
+NUM_SIMULATIONS = 8
+
+
+@pytest.fixture
+def spec(synthetic_db, strategies) -> dict:
+    return {
+        "season": 2016,
+        "gp_location": "Austin",
+        "db_path": synthetic_db,
+        "driver_strategies": strategies,
+        "num_simulations": NUM_SIMULATIONS,
+        "seed": SEED,
+    }
+
+
+def test_submit_is_idempotent(tmp_path, spec):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    job_id = queue.submit(spec, chunk_size=3)
+    assert queue.submit(spec, chunk_size=3) == job_id
+    assert queue.progress(job_id) == {"pending": 3, "leased": 0, "done": 0, "failed": 0}
+    with pytest.raises(ValueError):
+        queue.submit({**spec, "seed": None})
+
+
+def test_expired_lease_is_claimed_again(tmp_path, spec):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.submit(spec, chunk_size=NUM_SIMULATIONS)
+    chunk = queue.claim("dead-worker", lease_seconds=-1.0)
+    retried = queue.claim("worker", lease_seconds=60.0)
+    assert retried["chunk_id"] == chunk["chunk_id"]
+    assert queue.claim("other", lease_seconds=60.0) is None
+    # The first worker lost its lease
+    assert not queue.renew(chunk, "dead-worker")
+
+
+def test_crashing_chunk_fails_after_max_attempts(tmp_path, spec):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    job_id = queue.submit(spec, chunk_size=NUM_SIMULATIONS)
+    # Workers that crash while holding the lease
+    assert queue.claim("dead-worker-1", lease_seconds=-1.0) is not None
+    assert queue.claim("dead-worker-2", lease_seconds=-1.0) is not None
+    assert queue.claim("worker") is None
+    assert queue.progress(job_id) == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+    assert queue.is_complete(job_id)
+    assert "lease expired" in queue.failures(job_id)[0]
+    with pytest.raises(RuntimeError, match="failed chunks"):
+        queue.collect(job_id)
+
+
+def test_worker_stops_on_a_failing_simulation(tmp_path, spec, monkeypatch):
+    def broken_simulator(spec):
+        raise RuntimeError("simulation crashed")
+
+    monkeypatch.setattr(work_queue, "simulator_from_spec", broken_simulator)
+    path = str(tmp_path / "queue.sqlite")
+    job_id = WorkQueue(path).submit(spec, chunk_size=3)
+    assert run_worker(path, "worker", max_attempts=2) == 0
+
+    queue = WorkQueue(path)
+    assert queue.progress(job_id)["failed"] == 3
+    assert queue.failures(job_id) == {i: "RuntimeError: simulation crashed" for i in range(3)}
+
+
+def test_workers_reproduce_the_local_campaign(tmp_path, spec, strategies, synthetic_db):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path)
+    job_id = queue.submit(spec, chunk_size=3)
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=run_worker, args=(path, f"w{i}")) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=300)
+    assert queue.is_complete(job_id)
+
+    local = MonteCarloSimulator(
+        2016, "Austin", synthetic_db, strategies, NUM_SIMULATIONS, verbose=False, seed=SEED
+    )
+    local.run_simulation()
+    pd.testing.assert_frame_equal(
+        queue.collect(job_id), local.final_outcomes, check_dtype=False
+    )
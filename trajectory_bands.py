@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+trajectory_bands.py
+
+Streaming summary of the lap-by-lap trajectories of many simulated races.
+Keeping `Run.laps_summary` for every simulation costs O(N * D * L) memory;
+`TrajectoryBands` folds each simulation into fixed-size sketches instead:
+
+- the gap to the leader of each (driver, lap) goes to a histogram of
+  logarithmic buckets (as in DDSketch): any quantile is read back within
+  `relative_accuracy` of the exact one, whatever the number of simulations;
+- the position of each (driver, lap) is counted exactly (D possible values);
+- a reservoir keeps the full traces of `reservoir_size` simulations, the ones
+  with the smallest random key drawn from (seed, simulation_id). The sample
+  is uniform and does not depend on the order in which simulations arrive,
+  so summaries of chunks run by different workers can be merged.
+
+With 20 drivers and 70 laps the sketches take a few MB, for 1k or 100k races.
+Only running drivers are counted: a driver leaves the bands on the lap they
+retire ("running" gives the number of simulations behind each band).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TrajectoryBands:
+    """
+    Quantile sketches of the gap to the leader and of the position of every
+    driver on every lap, plus a reservoir sample of full traces.
+
+    Attributes:
+        driver_ids (np.ndarray): Drivers summarized.
+        num_laps (int): Laps of the race.
+        relative_accuracy (float): Relative error bound of the gap quantiles.
+        min_gap (float): Gaps below it are counted as 0 (the leader's bucket).
+        max_gap (float): Gaps above it are counted in the last bucket.
+        reservoir_size (int): Number of full traces kept.
+        seed (int | None): Seed of the reservoir keys.
+        num_simulations (int): Simulations summarized so far.
+    """
+
+    METRICS = ("gap", "position")
+
+    def __init__(
+        self,
+        driver_ids,
+        num_laps: int,
+        relative_accuracy: float = 0.01,
+        min_gap: float = 0.01,
+        max_gap: float = 1000.0,
+        reservoir_size: int = 100,
+        seed: int | None = None,
+    ) -> None:
+        """
+        Args:
+            driver_ids: Drivers of the race.
+            num_laps: Laps of the race.
+            relative_accuracy: Relative error bound of the gap quantiles.
+            min_gap: Smallest gap (s) told apart from 0.
+            max_gap: Largest gap (s) told apart from larger ones.
+            reservoir_size: Number of full traces kept.
+            seed: Seed of the reservoir keys (None: random).
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1).")
+        if not 0 < min_gap < max_gap:
+            raise ValueError("Gaps need 0 < min_gap < max_gap.")
+        self.driver_ids = np.asarray(driver_ids, dtype=np.int64)
+        if len(np.unique(self.driver_ids)) != len(self.driver_ids):
+            raise ValueError("Driver ids must be unique.")
+        self.num_laps = int(num_laps)
+        self.relative_accuracy = relative_accuracy
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.reservoir_size = reservoir_size
+        self.seed = seed
+        self.num_simulations = 0
+
+        # Bucket i >= 1 holds gaps in [min_gap * gamma^(i-1), min_gap * gamma^i)
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        n_buckets = 2 + int(np.ceil(np.log(max_gap / min_gap) / np.log(self._gamma)))
+        n_drivers = len(self.driver_ids)
+        self.gap_counts = np.zeros((n_drivers, self.num_laps, n_buckets), dtype=np.uint32)
+        self.position_counts = np.zeros((n_drivers, self.num_laps, n_drivers), dtype=np.uint32)
+
+        self._order = np.argsort(self.driver_ids)
+        self._keys = np.empty(0)
+        self._sim_ids = np.empty(0, dtype=np.int64)
+        self._gaps = np.empty((0, n_drivers, self.num_laps), dtype=np.float32)
+        self._positions = np.empty((0, n_drivers, self.num_laps), dtype=np.int16)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the sketches and the reservoir."""
+        arrays = (self.gap_counts, self.position_counts, self._keys, self._sim_ids, self._gaps, self._positions)
+        return sum(a.nbytes for a in arrays)
+
+    def _bucket_values(self) -> np.ndarray:
+        """Value returned for each gap bucket (relative error <= relative_accuracy)."""
+        n_buckets = self.gap_counts.shape[2]
+        upper = self.min_gap * self._gamma ** np.arange(n_buckets)
+        values = 2 * upper / (1 + self._gamma)
+        values[0] = 0.0
+        return values
+
+    def _gap_buckets(self, gaps: np.ndarray) -> np.ndarray:
+        n_buckets = self.gap_counts.shape[2]
+        with np.errstate(divide="ignore"):
+            buckets = 1 + np.floor(np.log(gaps / self.min_gap) / np.log(self._gamma))
+        buckets = np.where(gaps < self.min_gap, 0, buckets)
+        return np.clip(buckets, 0, n_buckets - 1).astype(np.int64)
+
+    def _driver_index(self, driver_ids: np.ndarray) -> np.ndarray:
+        sorted_ids = self.driver_ids[self._order]
+        index = np.clip(np.searchsorted(sorted_ids, driver_ids), 0, len(sorted_ids) - 1)
+        if not (sorted_ids[index] == driver_ids).all():
+            unknown = sorted(set(driver_ids.tolist()) - set(self.driver_ids.tolist()))
+            raise ValueError(f"Unknown drivers: {unknown}")
+        return self._order[index]
+
+    def update(self, laps: pd.DataFrame) -> None:
+        """
+        Add the traces of one or more simulations.
+
+        Args:
+            laps: Rows of `Run.laps_summary` ("lap", "driver_id", "position",
+                "cumulative_lap_time", "status") with a "simulation_id" column,
+                every simulation complete.
+        """
+        running = laps[laps["status"] == "running"]
+        sim_index, sim_ids = pd.factorize(laps["simulation_id"].to_numpy(dtype=np.int64), sort=True)
+        n_sims = len(sim_ids)
+        if n_sims == 0:
+            return
+        s = sim_index[(laps["status"] == "running").to_numpy()]
+        d = self._driver_index(running["driver_id"].to_numpy(dtype=np.int64))
+        lap = running["lap"].to_numpy(dtype=np.int64) - 1
+        if lap.size and (lap.min() < 0 or lap.max() >= self.num_laps):
+            raise ValueError(f"Laps must be between 1 and {self.num_laps}.")
+        cumulative = running["cumulative_lap_time"].to_numpy(dtype=float)
+        position = running["position"].to_numpy(dtype=np.int64)
+
+        leader = np.full((n_sims, self.num_laps), np.inf)
+        np.minimum.at(leader, (s, lap), cumulative)
+        gap = cumulative - leader[s, lap]
+
+        n_drivers, n_laps, n_buckets = self.gap_counts.shape
+        cell = d * n_laps + lap
+        self.gap_counts += np.bincount(
+            cell * n_buckets + self._gap_buckets(gap), minlength=self.gap_counts.size
+        ).reshape(self.gap_counts.shape).astype(np.uint32)
+        self.position_counts += np.bincount(
+            cell * n_drivers + np.clip(position - 1, 0, n_drivers - 1), minlength=self.position_counts.size
+        ).reshape(self.position_counts.shape).astype(np.uint32)
+        self.num_simulations += n_sims
+
+        if self.reservoir_size:
+            gaps = np.full((n_sims, n_drivers, n_laps), np.nan, dtype=np.float32)
+            positions = np.zeros((n_sims, n_drivers, n_laps), dtype=np.int16)
+            gaps[s, d, lap] = gap
+            positions[s, d, lap] = position
+            self._add_to_reservoir(self._reservoir_keys(sim_ids), np.asarray(sim_ids), gaps, positions)
+
+    def _reservoir_keys(self, sim_ids) -> np.ndarray:
+        """Uniform key of each simulation, drawn from (seed, simulation_id)."""
+        if self.seed is None:
+            return np.random.default_rng().random(len(sim_ids))
+        return np.array([np.random.default_rng([self.seed, int(i)]).random() for i in sim_ids])
+
+    def _add_to_reservoir(self, keys, sim_ids, gaps, positions) -> None:
+        """Keep the `reservoir_size` traces with the smallest keys."""
+        keys = np.concatenate([self._keys, keys])
+        keep = np.argsort(keys, kind="stable")[:self.reservoir_size]
+        self._keys = keys[keep]
+        self._sim_ids = np.concatenate([self._sim_ids, sim_ids])[keep]
+        self._gaps = np.concatenate([self._gaps, gaps])[keep]
+        self._positions = np.concatenate([self._positions, positions])[keep]
+
+    def merge(self, other: "TrajectoryBands") -> "TrajectoryBands":
+        """
+        Add the simulations summarized by `other` (e.g. another worker's chunk,
+        built with the same arguments).
+
+        Returns:
+            self, to allow chaining.
+        """
+        same = (
+            np.array_equal(self.driver_ids, other.driver_ids)
+            and self.gap_counts.shape == other.gap_counts.shape
+            and (self.relative_accuracy, self.min_gap, self.reservoir_size, self.seed)
+            == (other.relative_accuracy, other.min_gap, other.reservoir_size, other.seed)
+        )
+        if not same:
+            raise ValueError("Only summaries built with the same arguments can be merged.")
+        self.gap_counts += other.gap_counts
+        self.position_counts += other.position_counts
+        self.num_simulations += other.num_simulations
+        self._add_to_reservoir(other._keys, other._sim_ids, other._gaps, other._positions)
+        return self
+
+    def running(self) -> np.ndarray:
+        """(D, L) number of simulations in which each driver was running on each lap."""
+        return self.position_counts.sum(axis=2)
+
+    def quantiles(self, metric: str = "gap", quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)) -> np.ndarray:
+        """
+        Returns:
+            (Q, D, L) quantiles of `metric` ("gap" or "position"), NaN where
+            a driver was never running on a lap. Positions are exact, gaps
+            are within `relative_accuracy` (or below `min_gap`).
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f"metric must be one of {self.METRICS}.")
+        counts = self.gap_counts if metric == "gap" else self.position_counts
+        values = self._bucket_values() if metric == "gap" else np.arange(1, counts.shape[2] + 1, dtype=float)
+        cumulative = counts.cumsum(axis=2, dtype=np.int64)
+        total = cumulative[..., -1]
+        result = np.full((len(quantiles),) + total.shape, np.nan)
+        for k, q in enumerate(quantiles):
+            if not 0 <= q <= 1:
+                raise ValueError("Quantiles must be in [0, 1].")
+            # Lower quantile: the value of rank floor(q * (n - 1)) (0-based)
+            rank = np.floor(q * (total - 1))
+            bucket = np.argmax(cumulative > rank[..., None], axis=2)
+            result[k] = np.where(total > 0, values[bucket], np.nan)
+        return result
+
+    def bands(self, metric: str = "gap", quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)) -> pd.DataFrame:
+        """
+        Returns:
+            One row per (driver_id, lap) with "running" (number of simulations)
+            and one "q<quantile>" column per quantile of `metric`.
+        """
+        values = self.quantiles(metric, quantiles)
+        n_drivers, n_laps = values.shape[1:]
+        frame = pd.DataFrame({
+            "driver_id": np.repeat(self.driver_ids, n_laps),
+            "lap": np.tile(np.arange(1, n_laps + 1), n_drivers),
+            "running": self.running().ravel(),
+        })
+        for q, band in zip(quantiles, values):
+            frame[f"q{q:g}"] = band.ravel()
+        return frame
+
+    def reservoir(self) -> pd.DataFrame:
+        """
+        Returns:
+            Full traces of the sampled simulations: simulation_id, driver_id,
+            lap, position and gap (rows where the driver was running), in
+            simulation_id order.
+        """
+        order = np.argsort(self._sim_ids, kind="stable")
+        n_sims = len(order)
+        n_drivers, n_laps = self._gaps.shape[1:]
+        gaps = self._gaps[order].ravel()
+        frame = pd.DataFrame({
+            "simulation_id": np.repeat(self._sim_ids[order], n_drivers * n_laps),
+            "driver_id": np.tile(np.repeat(self.driver_ids, n_laps), n_sims),
+            "lap": np.tile(np.arange(1, n_laps + 1), n_sims * n_drivers),
+            "position": self._positions[order].ravel(),
+            "gap": gaps.astype(float),
+        })
+        return frame[~np.isnan(gaps)].reset_index(drop=True)
+
+    def plot(self, driver_id: int, metric: str = "gap", traces: int = 10, ax=None):
+        """
+        Plot the 5-95% and 25-75% bands and the median of `metric` over the
+        laps for one driver, with a few of the sampled traces.
+
+        Returns:
+            The matplotlib Axes.
+        """
+        import matplotlib.pyplot as plt
+
+        if ax is None:
+            _, ax = plt.subplots(figsize=(10, 4))
+        d = int(self._driver_index(np.array([driver_id]))[0])
+        q05, q25, q50, q75, q95 = self.quantiles(metric, (0.05, 0.25, 0.5, 0.75, 0.95))[:, d]
+        laps = np.arange(1, self.num_laps + 1)
+        ax.fill_between(laps, q05, q95, alpha=0.2, label="5-95%")
+        ax.fill_between(laps, q25, q75, alpha=0.4, label="25-75%")
+        ax.plot(laps, q50, label="median")
+        sampled = self._gaps if metric == "gap" else np.where(self._positions > 0, self._positions, np.nan)
+        for trace in sampled[:traces, d]:
+            ax.plot(laps, trace, color="grey", linewidth=0.5, alpha=0.5)
+        ax.set_xlabel("Lap")
+        ax.set_ylabel("Gap to leader (s)" if metric == "gap" else "Position")
+        if metric == "position":
+            ax.invert_yaxis()
+        ax.set_title(f"Driver {driver_id}: {metric} over {self.num_simulations} simulations")
+        ax.legend()
+        return ax
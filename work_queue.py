@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""
+work_queue.py
+
+File-based work queue sharing Monte Carlo campaigns between processes and
+hosts, without a cluster scheduler. The queue is a single SQLite file:
+
+- the coordinator splits seeded campaigns (one per race) into chunks of
+  simulations (`WorkQueue.submit`),
+- workers on any host that can open the file claim chunks under a lease, run
+  them and store their outcomes (`run_worker`); leases of workers that died
+  expire and their chunks are claimed again; a chunk whose simulations keep
+  failing is marked failed after `max_attempts` claims,
+- the coordinator merges the chunk outcomes in simulation order
+  (`WorkQueue.collect`).
+
+Every simulation is seeded from (seed, simulation_id), so the merged outcomes
+do not depend on the number of workers, nor on which worker ran which chunk.
+
+SQLite locking relies on the file system: it works on local disks and on
+network file systems with working POSIX locks (e.g. NFSv4); prefer a local
+disk when all workers run on one host.
+
+Usage:
+    python work_queue.py submit --queue q.sqlite --db data/F1.sqlite \
+        --race 2016:Austin --strategies data/strategies_austin_2016.pkl \
+        --simulations 10000 --chunk-size 250 --seed 1
+    python work_queue.py worker --queue q.sqlite      # on every host
+    python work_queue.py status --queue q.sqlite
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import time
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from fingerprint import stable_hash
+from monte_carlo_simulator import MonteCarloSimulator
+from safety_car_model import SafetyCarModel
+from simulation_server import parse_strategies
+from traffic_model import TrafficModel
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of simulation chunks with leases.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            spec TEXT NOT NULL,
+            num_chunks INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            job_id TEXT NOT NULL,
+            chunk_id INTEGER NOT NULL,
+            first_sim_id INTEGER NOT NULL,
+            num_simulations INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            outcomes BLOB,
+            error TEXT,
+            PRIMARY KEY (job_id, chunk_id)
+        );
+    """
+
+    # Chunk statuses, as reported by `progress`
+    STATUSES = ("pending", "leased", "done", "failed")
+
+    def __init__(self, path: str, timeout: float = 60.0, max_attempts: int = 3) -> None:
+        """
+        Args:
+            path: SQLite file of the queue (created if needed).
+            timeout: Seconds to wait for a lock held by another process.
+            max_attempts: Claims of a chunk after which a chunk that failed
+                (simulation error, or lease expired after a worker crash) is
+                marked failed instead of being claimed again.
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1.")
+        self.path = path
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        with self._connect() as con:
+            con.executescript(self.SCHEMA)
+            # Queues created before chunk errors were recorded
+            columns = [row[1] for row in con.execute("PRAGMA table_info(chunks)")]
+            if "error" not in columns:
+                con.execute("ALTER TABLE chunks ADD COLUMN error TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly where needed
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def submit(self, spec: Dict[str, Any], chunk_size: int = 100) -> str:
+        """
+        Add a campaign to the queue, split into chunks of `chunk_size` simulations.
+        Submitting the same campaign again is a no-op.
+
+        Args:
+            spec: JSON-compatible campaign: keyword arguments of
+                MonteCarloSimulator ("season", "gp_location", "db_path",
+                "driver_strategies", "num_simulations", "seed", and optionally
+                "test_mode", "starting_grid", "parameters", "traffic_model",
+                "safety_car_model").
+            chunk_size: Simulations per chunk.
+
+        Returns:
+            Identifier of the job.
+        """
+        if spec.get("seed") is None:
+            raise ValueError("Distributed campaigns must be seeded to be reproducible.")
+        num_simulations = int(spec["num_simulations"])
+        job_id = stable_hash({"spec": spec, "chunk_size": chunk_size})[:16]
+        chunks = [
+            (job_id, chunk_id, first, min(chunk_size, num_simulations - first))
+            for chunk_id, first in enumerate(range(0, num_simulations, chunk_size))
+        ]
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, spec, num_chunks) VALUES (?, ?, ?)",
+                (job_id, json.dumps(spec), len(chunks)),
+            )
+            con.executemany(
+                "INSERT OR IGNORE INTO chunks (job_id, chunk_id, first_sim_id, num_simulations) VALUES (?, ?, ?, ?)",
+                chunks,
+            )
+            con.execute("COMMIT")
+        return job_id
+
+    def submit_simulator(self, simulator: MonteCarloSimulator, chunk_size: int = 100) -> str:
+        """
+        Submit the campaign of a (seeded) MonteCarloSimulator.
+
+        Returns:
+            Identifier of the job.
+        """
+        traffic = simulator.traffic_model
+        safety_car = simulator.safety_car_model
+        return self.submit({
+            "season": int(simulator.season),
+            "gp_location": simulator.gp_location,
+            "db_path": os.path.abspath(simulator.db_path),
+            "driver_strategies": simulator.driver_strategies,
+            "num_simulations": simulator.num_simulations,
+            "seed": simulator.seed,
+            "test_mode": simulator.test_mode,
+            "starting_grid": simulator.starting_grid,
+            "parameters": simulator.parameters,
+            "traffic_model": vars(traffic) if traffic is not None else None,
+            "safety_car_model": safety_car.to_dict() if safety_car is not None else None,
+        }, chunk_size=chunk_size)
+
+    def spec(self, job_id: str) -> Dict[str, Any]:
+        """Returns the campaign of `job_id`, as submitted."""
+        with self._connect() as con:
+            row = con.execute("SELECT spec FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown job {job_id}.")
+        return json.loads(row[0])
+
+    def claim(self, worker: str, lease_seconds: float = 600.0) -> Dict[str, Any] | None:
+        """
+        Lease the next chunk that is pending or whose lease expired. Chunks
+        whose lease expired after `max_attempts` claims are marked failed.
+
+        Args:
+            worker: Identifier of the claiming worker.
+            lease_seconds: Duration of the lease.
+
+        Returns:
+            dict with "job_id", "chunk_id", "first_sim_id" and
+            "num_simulations", or None if nothing can be claimed now.
+        """
+        now = time.time()
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                """
+                UPDATE chunks SET status = 'failed', lease_expires = NULL,
+                    error = COALESCE(error, 'lease expired after ' || attempts || ' attempts')
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+                """,
+                (now, self.max_attempts),
+            )
+            row = con.execute(
+                """
+                SELECT job_id, chunk_id, first_sim_id, num_simulations FROM chunks
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY job_id, chunk_id LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row is not None:
+                con.execute(
+                    """
+                    UPDATE chunks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE job_id = ? AND chunk_id = ?
+                    """,
+                    (worker, now + lease_seconds, row[0], row[1]),
+                )
+            con.execute("COMMIT")
+        if row is None:
+            return None
+        return dict(zip(("job_id", "chunk_id", "first_sim_id", "num_simulations"), row))
+
+    def renew(self, chunk: Dict[str, Any], worker: str, lease_seconds: float = 600.0) -> bool:
+        """
+        Extend the lease of `worker` on `chunk`.
+
+        Returns:
+            False if the worker lost the lease (expired and claimed by another
+            worker, or chunk already done).
+        """
+        with self._connect() as con:
+            cursor = con.execute(
+                """
+                UPDATE chunks SET lease_expires = ?
+                WHERE job_id = ? AND chunk_id = ? AND status = 'leased' AND worker = ?
+                """,
+                (time.time() + lease_seconds, chunk["job_id"], chunk["chunk_id"], worker),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, chunk: Dict[str, Any], worker: str, error: str) -> bool:
+        """
+        Release a chunk whose simulations raised `error`: it is claimed again,
+        or marked failed once it was claimed `max_attempts` times.
+
+        Returns:
+            False if the worker no longer held the lease.
+        """
+        with self._connect() as con:
+            cursor = con.execute(
+                """
+                UPDATE chunks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    worker = NULL, lease_expires = NULL, error = ?
+                WHERE job_id = ? AND chunk_id = ? AND status = 'leased' AND worker = ?
+                """,
+                (self.max_attempts, error, chunk["job_id"], chunk["chunk_id"], worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, chunk: Dict[str, Any], worker: str, outcomes: pd.DataFrame) -> bool:
+        """
+        Store the outcomes of a chunk. Only the first completion is kept (a
+        late worker whose lease expired computed the same, seeded, outcomes).
+
+        Returns:
+            True if the outcomes were stored.
+        """
+        with self._connect() as con:
+            cursor = con.execute(
+                """
+                UPDATE chunks SET status = 'done', worker = ?, lease_expires = NULL, outcomes = ?
+                WHERE job_id = ? AND chunk_id = ? AND status != 'done'
+                """,
+                (worker, pickle.dumps(outcomes), chunk["job_id"], chunk["chunk_id"]),
+            )
+            return cursor.rowcount == 1
+
+    def progress(self, job_id: str | None = None) -> Dict[str, int]:
+        """
+        Returns:
+            Number of chunks per status ("pending", "leased", "done",
+            "failed"), for one job or for the whole queue.
+        """
+        query = "SELECT status, COUNT(*) FROM chunks"
+        params: tuple = ()
+        if job_id is not None:
+            query += " WHERE job_id = ?"
+            params = (job_id,)
+        with self._connect() as con:
+            counts = dict(con.execute(query + " GROUP BY status", params).fetchall())
+        return {status: counts.get(status, 0) for status in self.STATUSES}
+
+    def is_complete(self, job_id: str) -> bool:
+        """True once no chunk of `job_id` is left to run (done or failed)."""
+        progress = self.progress(job_id)
+        return progress["pending"] == 0 and progress["leased"] == 0
+
+    def failures(self, job_id: str) -> Dict[int, str]:
+        """
+        Returns:
+            chunk_id -> last error of the failed chunks of `job_id`.
+        """
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT chunk_id, error FROM chunks WHERE job_id = ? AND status = 'failed' ORDER BY chunk_id",
+                (job_id,),
+            ).fetchall()
+        return dict(rows)
+
+    def wait(self, job_id: str, poll_interval: float = 5.0, timeout: float | None = None) -> None:
+        """Block until every chunk of `job_id` is done or failed (RuntimeError on timeout)."""
+        start = time.time()
+        while not self.is_complete(job_id):
+            if timeout is not None and time.time() - start > timeout:
+                raise RuntimeError(f"Job {job_id} not complete after {timeout} s: {self.progress(job_id)}.")
+            time.sleep(poll_interval)
+
+    def collect(self, job_id: str) -> pd.DataFrame:
+        """
+        Merge the outcomes of a completed job, in simulation order.
+
+        Returns:
+            Outcomes of every simulation, with `simulation_id`, identical to
+            `MonteCarloSimulator.final_outcomes` of the same seeded campaign.
+        """
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT status, outcomes FROM chunks WHERE job_id = ? ORDER BY chunk_id", (job_id,)
+            ).fetchall()
+        if not rows:
+            raise ValueError(f"Unknown job {job_id}.")
+        failures = self.failures(job_id)
+        if failures:
+            raise RuntimeError(f"Job {job_id} has failed chunks: {failures}.")
+        if any(status != "done" for status, _ in rows):
+            raise RuntimeError(f"Job {job_id} is not complete: {self.progress(job_id)}.")
+        return pd.concat([pickle.loads(blob) for _, blob in rows], ignore_index=True)
+
+
+def simulator_from_spec(spec: Dict[str, Any]) -> MonteCarloSimulator:
+    """Rebuild the MonteCarloSimulator of a submitted campaign."""
+    grid = spec.get("starting_grid")
+    traffic = spec.get("traffic_model")
+    safety_car = spec.get("safety_car_model")
+    return MonteCarloSimulator(
+        season=spec["season"],
+        gp_location=spec["gp_location"],
+        db_path=spec["db_path"],
+        driver_strategies=parse_strategies(spec["driver_strategies"]),
+        num_simulations=spec["num_simulations"],
+        test_mode=spec.get("test_mode", False),
+        starting_grid=[tuple(g) for g in grid] if grid is not None else None,
+        verbose=False,
+        parameters=spec.get("parameters"),
+        seed=spec["seed"],
+        traffic_model=TrafficModel(**traffic) if traffic is not None else None,
+        safety_car_model=SafetyCarModel(**safety_car) if safety_car is not None else None,
+    )
+
+
+def run_worker(
+    queue_path: str,
+    worker: str | None = None,
+    lease_seconds: float = 600.0,
+    poll_interval: float = 2.0,
+    max_attempts: int = 3,
+) -> int:
+    """
+    Claim and run chunks until every job of the queue is done or failed.
+
+    The lease is renewed after each simulation; a worker that lost its lease
+    drops the chunk. A chunk whose simulation raises is released with the
+    error (see `WorkQueue.fail`). Fitted contexts are kept per job.
+
+    Args:
+        queue_path: SQLite file of the queue.
+        worker: Worker identifier (default: host name and process id).
+        lease_seconds: Lease duration; must exceed the time of one simulation.
+        poll_interval: Seconds between claims while other workers hold the
+            remaining chunks.
+        max_attempts: Claims of a chunk before it is marked failed.
+
+    Returns:
+        Number of chunks completed by this worker.
+    """
+    queue = WorkQueue(queue_path, max_attempts=max_attempts)
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    simulators: Dict[str, MonteCarloSimulator] = {}
+    completed = 0
+    while True:
+        chunk = queue.claim(worker, lease_seconds)
+        if chunk is None:
+            if queue.progress()["leased"] == 0:
+                return completed
+            # Remaining chunks are leased by others: wait in case a lease expires
+            time.sleep(poll_interval)
+            continue
+
+        job_id = chunk["job_id"]
+        frames: List[pd.DataFrame] = []
+        try:
+            if job_id not in simulators:
+                spec = queue.spec(job_id)
+                logging.getLogger(f"Run.{spec['gp_location']}").setLevel(logging.WARNING)
+                simulators[job_id] = simulator_from_spec(spec)
+            simulator = simulators[job_id]
+            for sim_id in range(chunk["first_sim_id"], chunk["first_sim_id"] + chunk["num_simulations"]):
+                frames.append(simulator.simulate(sim_id).outcomes.assign(simulation_id=sim_id))
+                if not queue.renew(chunk, worker, lease_seconds):
+                    frames = None
+                    break
+        except Exception as e:
+            logging.getLogger("WorkQueue").exception("Chunk %s/%d failed", job_id, chunk["chunk_id"])
+            queue.fail(chunk, worker, f"{type(e).__name__}: {e}")
+            continue
+        if frames is not None and queue.complete(chunk, worker, pd.concat(frames, ignore_index=True)):
+            completed += 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="File-based work queue for Monte Carlo campaigns.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="Split campaigns into chunks.")
+    submit.add_argument("--queue", required=True)
+    submit.add_argument("--db", required=True, help="SQLite database path (visible from every host).")
+    submit.add_argument("--race", action="append", required=True, help="SEASON:LOCATION, repeatable.")
+    submit.add_argument("--strategies", action="append", required=True,
+                        help="Pickled driver strategies, one per --race.")
+    submit.add_argument("--simulations", type=int, default=1000)
+    submit.add_argument("--chunk-size", type=int, default=100)
+    submit.add_argument("--seed", type=int, required=True)
+
+    worker = sub.add_parser("worker", help="Run chunks until the queue is done.")
+    worker.add_argument("--queue", required=True)
+    worker.add_argument("--lease", type=float, default=600.0)
+    worker.add_argument("--max-attempts", type=int, default=3)
+
+    status = sub.add_parser("status", help="Show the progress of the queue.")
+    status.add_argument("--queue", required=True)
+
+    args = parser.parse_args()
+    queue = WorkQueue(args.queue)
+    if args.command == "submit":
+        if len(args.strategies) != len(args.race):
+            parser.error("Give one --strategies file per --race.")
+        for race, strategies_path in zip(args.race, args.strategies):
+            season, location = race.split(":")
+            with open(strategies_path, "rb") as f:
+                strategies = pickle.load(f)
+            job_id = queue.submit({
+                "season": int(season),
+                "gp_location": location,
+                "db_path": os.path.abspath(args.db),
+                "driver_strategies": strategies,
+                "num_simulations": args.simulations,
+                "seed": args.seed,
+            }, chunk_size=args.chunk_size)
+            print(f"{race}: job {job_id}")
+    elif args.command == "worker":
+        completed = run_worker(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+        print(f"Completed {completed} chunks.")
+    else:
+        print(queue.progress())
+
+
+if __name__ == "__main__":
+    main()